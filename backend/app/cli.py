@@ -0,0 +1,124 @@
+"""
+Maintenance commands for the backend
+
+Run from the backend directory:
+    python -m app.cli rebuild-face-index
+    python -m app.cli archive-photos --older-than-days 30
+    python -m app.cli backfill-attendance-summaries
+    python -m app.cli rebuild-attendance-rollups
+    python -m app.cli compact-attendance-rollups
+    python -m app.cli export-attendance --format csv --section A --output attendance.csv
+"""
+import os
+import sys
+import argparse
+from datetime import datetime
+
+from .database.database import Base, SessionLocal, engine
+from .models.student import Student
+from .models.face_embedding import FaceEmbedding
+from .models.attendance import Attendance
+from .models.attendance_summary import AttendanceSummary
+from .models.attendance_rollup import AttendanceRollup
+from .utils.vector_index import face_index, rebuild_face_index
+from .utils.photo_storage import photo_storage
+from .utils.attendance_summary import attendance_summaries, attendance_rollups
+from .utils.attendance_export import attendance_exporter
+
+def rebuild_face_index_command(args) -> None:
+    db = SessionLocal()
+    try:
+        count = rebuild_face_index(db)
+    finally:
+        db.close()
+    print(f"✅ Rebuilt face index at {face_index.path}: {count} embeddings in {len(face_index.centroids)} lists")
+
+def archive_photos_command(args) -> None:
+    archived = photo_storage.archive(older_than_seconds=args.older_than_days * 86400)
+    print(f"✅ Archived {archived} photos older than {args.older_than_days} days into {photo_storage.packs.directory}")
+
+def backfill_attendance_summaries_command(args) -> None:
+    db = SessionLocal()
+    try:
+        count = attendance_summaries.rebuild(db, student_id=args.student_id)
+    finally:
+        db.close()
+    print(f"✅ Rebuilt {count} attendance summaries from the attendance table")
+
+def rebuild_attendance_rollups_command(args) -> None:
+    db = SessionLocal()
+    try:
+        count = attendance_rollups.rebuild(db)
+    finally:
+        db.close()
+    print(f"✅ Rebuilt {count} attendance rollup buckets from the attendance table")
+
+def compact_attendance_rollups_command(args) -> None:
+    db = SessionLocal()
+    try:
+        deleted = attendance_rollups.compact(db)
+    finally:
+        db.close()
+    print(f"✅ Deleted {deleted} expired attendance rollup buckets")
+
+def export_attendance_command(args) -> None:
+    query = attendance_exporter.query(args.class_name, args.section, args.subject, args.start, args.end)
+    db = SessionLocal()
+    out = sys.stdout if args.output == "-" else open(args.output, "w", newline="", encoding="utf-8")
+    try:
+        for chunk in attendance_exporter.iter_chunks(db, query, args.format):
+            out.write(chunk)
+    finally:
+        db.close()
+        if out is not sys.stdout:
+            out.close()
+    if out is not sys.stdout:
+        print(f"✅ Exported attendance to {args.output}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Backend maintenance commands")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    rebuild = subparsers.add_parser("rebuild-face-index", help="Rebuild the school-wide face search index")
+    rebuild.set_defaults(func=rebuild_face_index_command)
+
+    archive = subparsers.add_parser("archive-photos", help="Move old attendance photos into pack files")
+    archive.add_argument(
+        "--older-than-days",
+        type=float,
+        default=float(os.getenv("PHOTO_ARCHIVE_AFTER_DAYS", "30")),
+        help="Archive originals stored more than this many days ago"
+    )
+    archive.set_defaults(func=archive_photos_command)
+
+    backfill = subparsers.add_parser(
+        "backfill-attendance-summaries", help="Recompute per-subject attendance summaries from the raw records"
+    )
+    backfill.add_argument("--student-id", type=int, help="Only rebuild this student's summaries")
+    backfill.set_defaults(func=backfill_attendance_summaries_command)
+
+    rollups = subparsers.add_parser("rebuild-attendance-rollups", help="Recompute day/week/month attendance rollups")
+    rollups.set_defaults(func=rebuild_attendance_rollups_command)
+
+    compact = subparsers.add_parser("compact-attendance-rollups", help="Delete day/week rollups past their retention")
+    compact.set_defaults(func=compact_attendance_rollups_command)
+
+    export = subparsers.add_parser("export-attendance", help="Export attendance records with their students as CSV or NDJSON")
+    export.add_argument("--format", choices=["csv", "ndjson"], default="csv")
+    export.add_argument("--output", default="-", help="Output file, - for stdout")
+    export.add_argument("--class-name")
+    export.add_argument("--section")
+    export.add_argument("--subject")
+    export.add_argument("--start", type=datetime.fromisoformat, help="Earliest timestamp, e.g. 2026-01-15")
+    export.add_argument("--end", type=datetime.fromisoformat, help="Timestamp to stop before, e.g. 2026-06-01")
+    export.set_defaults(func=export_attendance_command)
+
+    args = parser.parse_args()
+    # The commands may run before the API has ever created the database
+    Base.metadata.create_all(bind=engine, tables=[
+        model.__table__ for model in (Student, FaceEmbedding, Attendance, AttendanceSummary, AttendanceRollup)
+    ])
+    args.func(args)
+
+if __name__ == "__main__":
+    main()
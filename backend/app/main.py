@@ -1,16 +1,23 @@
-from datetime import timedelta
-from typing import Annotated, List
-from fastapi import Depends, FastAPI, HTTPException, status, File, UploadFile, Form
+from datetime import date, datetime, timedelta
+from typing import Annotated, List, Literal, Optional
+from fastapi import Depends, FastAPI, HTTPException, status, File, UploadFile, Form, Query, Request
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from fastapi.middleware.cors import CORSMiddleware
-from sqlalchemy.orm import Session
+from fastapi.responses import FileResponse, JSONResponse, Response, StreamingResponse
+from sqlalchemy import event, func, insert, inspect, select, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, make_transient_to_detached, object_session
 import os
-from datetime import datetime
+import asyncio
 
-from .database.database import engine, get_db
+from .database.database import engine, SessionLocal, get_async_db
 from . import models
 from .models.student import Student
 from .models.attendance import Attendance
+from .models.face_embedding import FaceEmbedding
+from .models.face_thumbnail import FaceThumbnail
+from .models.attendance_summary import AttendanceSummary
+from .models.attendance_rollup import AttendanceRollup
 # from .models.assignment import Assignment  # Not used in current system
 # from .schemas import assignment as assignment_schemas  # Not used in current system
 from .schemas import student as student_schemas
@@ -20,15 +27,39 @@ from .utils.security import (
     get_password_hash,
     create_access_token,
     verify_token,
+    is_staff,
     ACCESS_TOKEN_EXPIRE_MINUTES
 )
 from .utils.deepface_recognition import deepface_recognizer
 from .utils.google_face_recognition import google_face_recognizer
 from .utils.simple_face_recognition import simple_face_recognizer
+from .utils.face_api import face_api
+from .utils.embedding_store import embedding_store
+from .utils.inference_executor import inference_executor
+from .utils.batch_scheduler import embedding_batcher
+from .utils.roster_index import roster_index
+from .utils.vector_index import face_index
+from .utils.thumbnail_store import thumbnail_store
+from .utils.photo_storage import photo_storage, UploadTooLarge
+from .utils.result_cache import verification_cache
+from .utils.recognizer_cascade import recognizer_cascade
+from .utils.image_preprocessing import ImageInput, DecodedImage, image_bytes
+from .utils.pagination import encode_cursor, decode_cursor
+from .utils.attendance_summary import attendance_summaries, attendance_rollups, bucket_start, section_scope_id
+from .utils.bulk_attendance import parse_records
+from .utils.attendance_export import attendance_exporter, EXPORT_FORMATS
+from .utils.principal_cache import principal_cache
 
 # Create database tables
 models.student.Base.metadata.create_all(bind=engine)
 models.attendance.Base.metadata.create_all(bind=engine)
+models.face_embedding.Base.metadata.create_all(bind=engine)
+models.face_thumbnail.Base.metadata.create_all(bind=engine)
+models.attendance_summary.Base.metadata.create_all(bind=engine)
+models.attendance_rollup.Base.metadata.create_all(bind=engine)
+# create_all skips tables that already exist, so add indexes introduced since then
+for index in Attendance.__table__.indexes:
+    index.create(bind=engine, checkfirst=True)
 
 app = FastAPI()
 
@@ -39,14 +70,162 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
+# Keep the face search indexes in step with student activation and section moves,
+# whichever code path changes them. The stored vectors are read during the flush,
+# but the indexes are only changed once the transaction commits.
+@event.listens_for(Student, "after_update")
+def queue_face_index_update(mapper, connection, student):
+    state = inspect(student)
+    activation_changed = state.attrs.is_active.history.has_changes()
+    roster_changed = state.attrs.class_name.history.has_changes() or state.attrs.section.history.has_changes()
+    if not activation_changed and not roster_changed:
+        return
+    session = object_session(student)
+    if session is None:
+        return
+    updates = session.info.setdefault("face_index_updates", {})
+    # An earlier flush of the same transaction may already have changed is_active
+    activation_changed = activation_changed or updates.get(student.id, {}).get("activation_changed", False)
+    update = {
+        "is_active": student.is_active,
+        "class_name": student.class_name,
+        "section": student.section,
+        "activation_changed": activation_changed,
+        "embedding": None,
+        "thumbnail": None
+    }
+    if student.is_active:
+        stored = connection.execute(
+            select(FaceEmbedding.embedding).where(
+                FaceEmbedding.student_id == student.id,
+                FaceEmbedding.model_name == deepface_recognizer.model_name,
+                FaceEmbedding.detector_backend == deepface_recognizer.detector_backend
+            )
+        ).first()
+        if stored is not None:
+            update["embedding"] = embedding_store.from_bytes(stored.embedding)
+        if activation_changed and thumbnail_store.loaded:
+            stored = connection.execute(
+                select(FaceThumbnail.thumbnail).where(FaceThumbnail.student_id == student.id)
+            ).first()
+            if stored is not None:
+                update["thumbnail"] = thumbnail_store.from_bytes(stored.thumbnail)
+    updates[student.id] = update
+
+def apply_face_index_update(student_id: int, update: dict) -> None:
+    if not update["is_active"]:
+        roster_index.remove(student_id)
+        face_index.remove(student_id)
+        thumbnail_store.remove(student_id)
+        return
+    if update["embedding"] is None:
+        roster_index.remove(student_id)
+    else:
+        # Moves the student out of the roster of their old section
+        roster_index.upsert(student_id, update["class_name"], update["section"], update["embedding"])
+        if update["activation_changed"]:
+            face_index.add(student_id, update["embedding"])
+    if update["thumbnail"] is not None:
+        thumbnail_store.upsert(student_id, update["thumbnail"])
+
+@event.listens_for(Session, "after_commit")
+def apply_committed_face_index_updates(session):
+    for student_id, update in session.info.pop("face_index_updates", {}).items():
+        apply_face_index_update(student_id, update)
+
+@event.listens_for(Session, "after_rollback")
+def forget_face_index_updates(session):
+    session.info.pop("face_index_updates", None)
+
+# Columns that decide whether a cached token may still authenticate as the student
+PRINCIPAL_COLUMNS = ("is_active", "hashed_password", "email")
+
+@event.listens_for(Student, "after_update")
+def invalidate_cached_principal(mapper, connection, student):
+    state = inspect(student)
+    if not any(state.attrs[name].history.has_changes() for name in PRINCIPAL_COLUMNS):
+        return
+    principal_cache.invalidate(student.id)
+    # Requests running before the commit can still read and re-cache the old
+    # row, so drop the student's tokens again once the change is visible
+    session = object_session(student)
+    if session is not None:
+        session.info.setdefault("invalidated_principals", set()).add(student.id)
+
+@event.listens_for(Session, "after_commit")
+def invalidate_committed_principals(session):
+    for student_id in session.info.pop("invalidated_principals", ()):
+        principal_cache.invalidate(student_id)
+
+@event.listens_for(Session, "after_rollback")
+def forget_principal_invalidations(session):
+    session.info.pop("invalidated_principals", None)
+
+# Build and warm the face models before traffic arrives. Set FACE_MODEL_WARMUP=false
+# to skip it, e.g. for local development without the model weights.
+FACE_MODEL_WARMUP = os.getenv("FACE_MODEL_WARMUP", "true").lower() == "true"
+
+@app.on_event("startup")
+async def warm_up_face_models():
+    inference_executor.start()
+    if not FACE_MODEL_WARMUP:
+        return
+    # Warm up in the background so the server can answer /ready meanwhile
+    app.state.warm_up_task = asyncio.create_task(inference_executor.warm_up())
+
+ROLLUP_COMPACTION_INTERVAL_SECONDS = float(os.getenv("ROLLUP_COMPACTION_INTERVAL_SECONDS", "86400"))
+
+def compact_attendance_rollups() -> int:
+    db = SessionLocal()
+    try:
+        return attendance_rollups.compact(db)
+    finally:
+        db.close()
+
+async def compact_attendance_rollups_periodically():
+    while True:
+        try:
+            deleted = await asyncio.to_thread(compact_attendance_rollups)
+            print(f"Compacted attendance rollups: {deleted} expired buckets deleted")
+        except Exception as e:
+            print(f"Attendance rollup compaction error: {e}")
+        await asyncio.sleep(ROLLUP_COMPACTION_INTERVAL_SECONDS)
+
+@app.on_event("startup")
+async def start_rollup_compaction():
+    if ROLLUP_COMPACTION_INTERVAL_SECONDS > 0:
+        app.state.rollup_compaction_task = asyncio.create_task(compact_attendance_rollups_periodically())
+
+@app.on_event("shutdown")
+async def stop_inference_workers():
+    inference_executor.shutdown()
+    await google_face_recognizer.close()
+    await face_api.close()
+
+@app.get("/ready")
+async def readiness():
+    """
+    Readiness probe for the load balancer, 503 until the face models are warm
+    """
+    if not FACE_MODEL_WARMUP or inference_executor.is_ready:
+        return {"status": "ready"}
+    return JSONResponse(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        content={
+            "status": "error" if inference_executor.warm_up_error else "warming_up",
+            "detail": inference_executor.warm_up_error
+        }
+    )
+
 # Dependency to get current user
 async def get_current_user(
     token: Annotated[str, Depends(oauth2_scheme)],
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ) -> Student:
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
@@ -54,18 +233,43 @@ async def get_current_user(
         headers={"WWW-Authenticate": "Bearer"},
     )
     token_data = verify_token(token, credentials_exception)
-    user = db.query(Student).filter(Student.email == token_data.email).first()
-    if user is None:
+
+    # Most requests reuse a recent lookup of the same token. The cached student
+    # is detached, load it into a session before changing it.
+    snapshot = principal_cache.get(token)
+    if snapshot is not None:
+        if not snapshot["is_active"]:
+            raise credentials_exception
+        user = Student(**snapshot)
+        make_transient_to_detached(user)
+        return user
+
+    generation = principal_cache.generation
+    user = await db.scalar(select(Student).where(Student.email == token_data.email))
+    # Deactivated students keep valid tokens until they expire, but may not use them
+    if user is None or not user.is_active:
         raise credentials_exception
+    principal_cache.set(
+        token,
+        user.id,
+        {column.key: getattr(user, column.key) for column in Student.__table__.columns},
+        generation
+    )
     return user
 
+def require_self_or_staff(current_user: Student, student_id: int) -> None:
+    """403 unless the caller is the student themself or staff"""
+    if current_user.id != student_id and not is_staff(current_user.email):
+        raise HTTPException(status_code=403, detail="Not allowed to act for another student")
+
 @app.post("/token", response_model=student_schemas.Token)
 async def login_for_access_token(
     form_data: Annotated[OAuth2PasswordRequestForm, Depends()],
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    user = db.query(Student).filter(Student.email == form_data.username).first()
-    if not user or not verify_password(form_data.password, user.hashed_password):
+    user = await db.scalar(select(Student).where(Student.email == form_data.username))
+    # bcrypt is deliberately slow, keep it off the event loop
+    if not user or not await asyncio.to_thread(verify_password, form_data.password, user.hashed_password):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect email or password",
@@ -77,6 +281,20 @@ async def login_for_access_token(
     )
     return {"access_token": access_token, "token_type": "bearer"}
 
+@app.get("/students/me", response_model=student_schemas.Student)
+async def read_current_student(current_user: Student = Depends(get_current_user)):
+    """
+    The student the bearer token belongs to
+    """
+    return current_user
+
+async def read_photo(upload: UploadFile) -> bytes:
+    """Read an uploaded photo, 413 if it is over the upload size limit"""
+    try:
+        return await photo_storage.read_upload(upload)
+    except UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+
 @app.post("/attendance/", response_model=attendance_schemas.Attendance)
 async def create_attendance(
     student_id: int = Form(...),
@@ -84,24 +302,23 @@ async def create_attendance(
     status: str = Form(...),
     photo1: UploadFile = File(...),
     photo2: UploadFile = File(...),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     # Check if student exists
-    student = db.query(Student).filter(Student.id == student_id).first()
+    student = await db.get(Student, student_id)
     if not student:
         raise HTTPException(status_code=404, detail="Student not found")
+    class_name, section = student.class_name, student.section
+    # Hand the connection back to the pool before waiting on inference
+    await db.close()
 
     # Read photo contents
-    photo1_contents = await photo1.read()
-    photo2_contents = await photo2.read()
-    
-    # Convert to base64 for DeepFace
-    import base64
-    photo1_base64 = base64.b64encode(photo1_contents).decode('utf-8')
-    photo2_base64 = base64.b64encode(photo2_contents).decode('utf-8')
+    photo1_contents = await read_photo(photo1)
+    photo2_contents = await read_photo(photo2)
     
-    # Use DeepFace for face verification
-    result = deepface_recognizer.verify_faces(photo1_base64, photo2_base64)
+    # Use DeepFace for face verification, off the event loop. The raw upload
+    # bytes go straight to the decoder, no base64 round trip.
+    result = await embedding_batcher.verify(photo1_contents, photo2_contents)
     
     if not result["success"]:
         raise HTTPException(
@@ -109,101 +326,399 @@ async def create_attendance(
             detail=result.get("message", "Face verification failed")
         )
 
-    # Save photos
-    os.makedirs("uploads", exist_ok=True)
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    
-    # Save with original filenames
-    photo1_path = f"uploads/{photo1.filename}"
-    photo2_path = f"uploads/{photo2.filename}"
-    
-    with open(photo1_path, "wb") as f:
-        f.write(photo1_contents)
-    with open(photo2_path, "wb") as f:
-        f.write(photo2_contents)
+    # Save photos under their content hash, off the event loop
+    photo1_path, photo2_path = await asyncio.gather(
+        photo_storage.save(photo1_contents),
+        photo_storage.save(photo2_contents)
+    )
 
     # Create attendance record
-    db_attendance = Attendance(
-        student_id=student_id,
-        subject=subject,
-        status=status,
-        photo1_path=photo1_path,
-        photo2_path=photo2_path,
-        face_matched=result["is_verified"],
-        face_confidence=result["similarity_percentage"]
-    )
+    record = {
+        "student_id": student_id,
+        "subject": subject,
+        "status": status,
+        "timestamp": datetime.utcnow(),
+        "photo1_path": photo1_path,
+        "photo2_path": photo2_path,
+        "face_matched": result["is_verified"],
+        "face_confidence": result["similarity_percentage"]
+    }
+    db_attendance = Attendance(**record)
     
     db.add(db_attendance)
-    db.commit()
-    db.refresh(db_attendance)
+    # The subject summary and trend rollups are updated in the same transaction as the record
+    await db.run_sync(attendance_summaries.apply, [record])
+    await db.run_sync(attendance_rollups.apply, [
+        {**record, "class_name": class_name, "section": section}
+    ])
+    await db.commit()
+    await db.refresh(db_attendance)
     return db_attendance
 
+BULK_ATTENDANCE_MAX_BYTES = int(os.getenv("BULK_ATTENDANCE_MAX_BYTES", str(20 * 1024 * 1024)))
+BULK_ATTENDANCE_MAX_RECORDS = int(os.getenv("BULK_ATTENDANCE_MAX_RECORDS", "10000"))
+
+@app.post("/attendance/bulk/", response_model=attendance_schemas.BulkAttendanceResult)
+async def create_attendance_bulk(
+    request: Request,
+    current_user: Student = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Import a batch of attendance records, e.g. taken offline on a kiosk
+
+    The body is NDJSON (one record per line) or, with Content-Type text/csv,
+    CSV with a header row. Each record has student_id, subject and status, and
+    optionally timestamp, face_matched, face_confidence and photo1/photo2 as
+    the digest or path of a photo stored earlier. Valid records are inserted
+    in one transaction; invalid ones are reported per line and skipped.
+    Students may only import their own records, staff may import anyone's.
+    """
+    chunks = []
+    size = 0
+    async for chunk in request.stream():
+        size += len(chunk)
+        if size > BULK_ATTENDANCE_MAX_BYTES:
+            raise HTTPException(status_code=413, detail=f"Batch is larger than {BULK_ATTENDANCE_MAX_BYTES} bytes")
+        chunks.append(chunk)
+
+    records, errors = await asyncio.to_thread(
+        parse_records, b"".join(chunks), request.headers.get("content-type", "")
+    )
+    if len(records) + len(errors) > BULK_ATTENDANCE_MAX_RECORDS:
+        raise HTTPException(status_code=413, detail=f"Batch has more than {BULK_ATTENDANCE_MAX_RECORDS} records")
+    results = [{"line": line, "status": "error", "error": message} for line, message in errors]
+
+    # Every student in the batch is looked up in one query
+    student_ids = {record["student_id"] for _, record in records}
+    students = {
+        row.id: row for row in await db.execute(
+            select(Student.id, Student.class_name, Student.section).where(Student.id.in_(student_ids))
+        )
+    } if student_ids else {}
+    references = {reference for _, record in records for reference in (record["photo1"], record["photo2"]) if reference}
+    photo_paths = await asyncio.to_thread(
+        lambda: {reference: photo_storage.resolve(reference) for reference in references}
+    )
+
+    now = datetime.utcnow()
+    staff = is_staff(current_user.email)
+    lines = []
+    rows = []
+    for line, record in records:
+        if not staff and record["student_id"] != current_user.id:
+            results.append({"line": line, "status": "error", "error": f"not allowed to import records for student {record['student_id']}"})
+            continue
+        if record["student_id"] not in students:
+            results.append({"line": line, "status": "error", "error": f"student {record['student_id']} not found"})
+            continue
+        missing = [reference for reference in (record["photo1"], record["photo2"]) if reference and not photo_paths[reference]]
+        if missing:
+            results.append({"line": line, "status": "error", "error": f"photo not found: {missing[0]}"})
+            continue
+        lines.append(line)
+        rows.append({
+            "student_id": record["student_id"],
+            "subject": record["subject"],
+            "status": record["status"],
+            "timestamp": record["timestamp"] or now,
+            "photo1_path": photo_paths.get(record["photo1"]),
+            "photo2_path": photo_paths.get(record["photo2"]),
+            "face_matched": record["face_matched"],
+            "face_confidence": record["face_confidence"]
+        })
+
+    if rows:
+        # One executemany INSERT ... RETURNING, ids come back in parameter order
+        ids = await db.scalars(insert(Attendance).returning(Attendance.id, sort_by_parameter_order=True), rows)
+        results.extend({"line": line, "status": "created", "id": record_id} for line, record_id in zip(lines, ids))
+        await db.run_sync(attendance_summaries.apply, rows)
+        await db.run_sync(attendance_rollups.apply, [
+            {**row, "class_name": students[row["student_id"]].class_name, "section": students[row["student_id"]].section}
+            for row in rows
+        ])
+        await db.commit()
+
+    results.sort(key=lambda result: result["line"])
+    return {
+        "received": len(records) + len(errors),
+        "created": len(rows),
+        "failed": len(results) - len(rows),
+        "results": results
+    }
+
+@app.post("/attendance/classroom/", response_model=attendance_schemas.ClassroomAttendance)
+async def create_classroom_attendance(
+    class_name: str = Form(...),
+    section: str = Form(...),
+    subject: str = Form(...),
+    photo: UploadFile = File(...),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Take attendance for a whole section from one classroom photo
+    
+    Every face is detected once and embedded in a single batch, then matched
+    against the section's enrolled students. Matched students are marked
+    Present and everyone else in the section Absent, in one transaction.
+    """
+    students = (await db.execute(select(Student.id).where(
+        Student.class_name == class_name,
+        Student.section == section,
+        Student.is_active == True
+    ))).all()
+    if not students:
+        raise HTTPException(status_code=404, detail="No students found for this class and section")
+    # Hand the connection back to the pool before waiting on inference
+    await db.close()
+
+    photo_contents = await read_photo(photo)
+    result = await inference_executor.run("embed_all_faces", photo_contents)
+    if not result["success"]:
+        raise HTTPException(
+            status_code=400,
+            detail=result.get("message", "No faces detected in classroom photo")
+        )
+
+    # Save the photo once, all records of this session point at it
+    photo_path = await photo_storage.save(photo_contents)
+
+    faces = result["faces"]
+    matches = await db.run_sync(
+        roster_index.match_faces,
+        class_name,
+        section,
+        [face["embedding"] for face in faces],
+        min_similarity=deepface_recognizer.similarity_threshold()
+    )
+
+    rows = []
+    timestamp = datetime.utcnow()
+    for (student_id,) in students:
+        match = matches.get(student_id)
+        rows.append({
+            "student_id": student_id,
+            "subject": subject,
+            "status": "Present" if match else "Absent",
+            "timestamp": timestamp,
+            "photo1_path": photo_path,
+            "photo2_path": None,
+            "face_matched": match is not None,
+            "face_confidence": round(max(0.0, match[1]) * 100, 2) if match else 0.0
+        })
+
+    # One multi-row INSERT ... RETURNING in a single transaction
+    inserted = (await db.scalars(insert(Attendance).returning(Attendance), rows)).all()
+    records = [attendance_schemas.Attendance.model_validate(record) for record in inserted]
+    await db.run_sync(attendance_summaries.apply, rows)
+    await db.run_sync(attendance_rollups.apply, [
+        {**row, "class_name": class_name, "section": section} for row in rows
+    ])
+    await db.commit()
+
+    present = [row["student_id"] for row in rows if row["face_matched"]]
+    return {
+        "class_name": class_name,
+        "section": section,
+        "subject": subject,
+        "faces_detected": len(faces),
+        "unmatched_faces": len(faces) - len(matches),
+        "present_student_ids": present,
+        "absent_student_ids": [row["student_id"] for row in rows if not row["face_matched"]],
+        "records": records
+    }
+
+def verification_response(result: dict, student_id: int, model_used: str, detector_used: str) -> dict:
+    """Shape a recognizer result into the /face-verify/ response"""
+    return {
+        "success": result["success"],
+        "match_status": result.get("match_status", "ERROR"),
+        "is_verified": result.get("is_verified", False),
+        "similarity_percentage": result.get("similarity_percentage", 0),
+        "confidence_level": result.get("confidence_level", "LOW"),
+        "color": result.get("color", "red"),
+        "message": result.get("message", "Face verification completed"),
+        "model_used": result.get("model_used", model_used),
+        "detector_used": result.get("detector_used", detector_used),
+        "student_id": student_id
+    }
+
+@app.post("/face-enroll/")
+async def enroll_face(
+    reference_image: str = Form(...),  # Base64 encoded reference image
+    student_id: int = Form(...),
+    current_user: Student = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Embed a student's reference photo once and store the vector for later verification
+
+    Students may only enroll themselves, staff may enroll anyone.
+    """
+    require_self_or_staff(current_user, student_id)
+    student = await db.get(Student, student_id)
+    if not student:
+        raise HTTPException(status_code=404, detail="Student not found")
+    # Inactive students are kept out of the search indexes
+    if not student.is_active:
+        raise HTTPException(status_code=400, detail="Student is inactive")
+    # Hand the connection back to the pool before waiting on inference
+    await db.close()
+
+    try:
+        # Decode once for both the ArcFace embedding and the simple comparison thumbnail
+        reference = await asyncio.to_thread(DecodedImage.from_input, reference_image)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    result = await embedding_batcher.embed(reference)
+    if not result["success"]:
+        raise HTTPException(
+            status_code=400,
+            detail=result.get("message", "Face enrollment failed")
+        )
+
+    record = await db.run_sync(
+        embedding_store.save,
+        student_id,
+        result["embedding"],
+        model_name=deepface_recognizer.model_name,
+        detector_backend=deepface_recognizer.detector_backend
+    )
+    roster_index.upsert(student.id, student.class_name, student.section, result["embedding"])
+    # The face index reads and appends files, keep that off the event loop
+    await asyncio.to_thread(face_index.add, student.id, result["embedding"])
+    await db.run_sync(thumbnail_store.save, student_id, reference)
+    return {
+        "success": True,
+        "student_id": student_id,
+        "model_used": record.model_name,
+        "detector_used": record.detector_backend,
+        "dimension": record.dimension,
+        "message": "Face enrolled successfully"
+    }
+
 @app.post("/face-verify/")
 async def verify_faces(
-    reference_image: str = Form(...),  # Base64 encoded reference image
     live_image: str = Form(...),       # Base64 encoded live image
-    student_id: int = Form(...)
+    student_id: int = Form(...),
+    reference_image: Optional[str] = Form(None),  # Base64 encoded reference image, omit to use the enrolled embedding
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Verify faces using DeepFace with ArcFace model, with Google AI fallback
+    
+    When no reference image is sent, the live image is compared against the
+    student's enrolled embedding instead.
     """
+    return await verify_face_request(reference_image, live_image, student_id, db)
+
+@app.post("/face-verify/upload/")
+async def verify_faces_upload(
+    live_image: UploadFile = File(...),
+    student_id: int = Form(...),
+    reference_image: Optional[UploadFile] = File(None),  # Omit to use the enrolled embedding
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Same as /face-verify/, but with the images sent as binary multipart files
+    
+    Avoids the base64 overhead on the wire and the decode on the server.
+    """
+    live_contents = await read_photo(live_image)
+    reference_contents = await read_photo(reference_image) if reference_image is not None else None
+    return await verify_face_request(reference_contents, live_contents, student_id, db)
+
+async def verify_face_request(
+    reference_image: Optional[ImageInput],
+    live_image: ImageInput,
+    student_id: int,
+    db: AsyncSession
+) -> dict:
+    """Shared implementation of the base64 and binary /face-verify/ endpoints"""
+    reference_embedding = None
+    if reference_image is None:
+        reference_embedding = await db.run_sync(
+            embedding_store.get,
+            student_id,
+            model_name=deepface_recognizer.model_name,
+            detector_backend=deepface_recognizer.detector_backend
+        )
+        # Hand the connection back to the pool before waiting on inference
+        await db.close()
+        if reference_embedding is None:
+            return {
+                "success": False,
+                "match_status": "ERROR",
+                "is_verified": False,
+                "similarity_percentage": 0,
+                "confidence_level": "LOW",
+                "color": "red",
+                "message": "No enrolled face found for this student. Please enroll first or send a reference image.",
+                "model_used": "None",
+                "detector_used": "None",
+                "student_id": student_id
+            }
+        reference_key = reference_embedding.tobytes()
+    else:
+        reference_key = image_cache_bytes(reference_image)
+
+    # Retries usually resend identical images, so answer them from the cache
+    cache_key = verification_cache.make_key(
+        "face-verify",
+        "embedding" if reference_image is None else "image",
+        reference_key,
+        image_cache_bytes(live_image),
+        deepface_recognizer.model_name,
+        deepface_recognizer.detector_backend,
+        deepface_recognizer.distance_metric,
+        deepface_recognizer.similarity_threshold()
+    )
+    cached = await verification_cache.aget(cache_key)
+    if cached is not None:
+        return {**cached, "student_id": student_id}
+
+    response = await run_face_verification(reference_image, reference_embedding, live_image, student_id)
+    if response["success"]:
+        # Stage timings describe this run only, a cache hit runs no stages
+        await verification_cache.aset(cache_key, {key: value for key, value in response.items() if key != "stages"})
+    return response
+
+def image_cache_bytes(image: ImageInput) -> bytes:
+    """Decoded image bytes for cache keys, so the same image always hashes the same"""
     try:
-        # Try DeepFace first
-        try:
-            result = deepface_recognizer.verify_faces(reference_image, live_image)
-            if result["success"]:
-                return {
-                    "success": result["success"],
-                    "match_status": result.get("match_status", "ERROR"),
-                    "is_verified": result.get("is_verified", False),
-                    "similarity_percentage": result.get("similarity_percentage", 0),
-                    "confidence_level": result.get("confidence_level", "LOW"),
-                    "color": result.get("color", "red"),
-                    "message": result.get("message", "Face verification completed"),
-                    "model_used": result.get("model_used", "ArcFace"),
-                    "detector_used": result.get("detector_used", "RetinaFace"),
-                    "student_id": student_id
-                }
-        except Exception as deepface_error:
-            print(f"DeepFace error: {deepface_error}")
-        
-        # Fallback to Google AI
-        try:
-            result = google_face_recognizer.verify_faces(reference_image, live_image)
-            if result["success"]:
-                return {
-                    "success": result["success"],
-                    "match_status": result.get("match_status", "ERROR"),
-                    "is_verified": result.get("is_verified", False),
-                    "similarity_percentage": result.get("similarity_percentage", 0),
-                    "confidence_level": result.get("confidence_level", "LOW"),
-                    "color": result.get("color", "red"),
-                    "message": result.get("message", "Face verification completed"),
-                    "model_used": result.get("model_used", "Google Gemini"),
-                    "detector_used": result.get("detector_used", "Google Vision AI"),
-                    "student_id": student_id
-                }
-        except Exception as google_error:
-            print(f"Google AI error: {google_error}")
+        return bytes(image_bytes(image))
+    except (ValueError, IndexError):
+        return image.encode('utf-8')
+
+async def run_face_verification(
+    reference_image: Optional[ImageInput],
+    reference_embedding,
+    live_image: ImageInput,
+    student_id: int
+) -> dict:
+    """Run the recognizer cascade for /face-verify/"""
+    if reference_embedding is not None:
+        live = await embedding_batcher.embed(live_image)
+        if live["success"]:
+            result = deepface_recognizer.compare_embeddings(reference_embedding, live["embedding"])
+        else:
+            result = deepface_recognizer.embedding_error_result(live)
+        return verification_response(result, student_id, "ArcFace", "RetinaFace")
+
+    try:
+        # Decode both images once, off the event loop, and share them with every recognizer
+        reference_image, live_image = await asyncio.gather(
+            asyncio.to_thread(DecodedImage.from_input, reference_image),
+            asyncio.to_thread(DecodedImage.from_input, live_image)
+        )
         
-        # Fallback to simple image comparison
-        try:
-            result = simple_face_recognizer.verify_faces(reference_image, live_image)
-            if result["success"]:
-                return {
-                    "success": result["success"],
-                    "match_status": result.get("match_status", "ERROR"),
-                    "is_verified": result.get("is_verified", False),
-                    "similarity_percentage": result.get("similarity_percentage", 0),
-                    "confidence_level": result.get("confidence_level", "LOW"),
-                    "color": result.get("color", "red"),
-                    "message": result.get("message", "Face verification completed"),
-                    "model_used": result.get("model_used", "Simple Comparison"),
-                    "detector_used": result.get("detector_used", "OpenCV"),
-                    "student_id": student_id
-                }
-        except Exception as simple_error:
-            print(f"Simple face recognition error: {simple_error}")
+        stage, result, stages = await recognizer_cascade.run(reference_image, live_image)
+        if result is not None:
+            return {
+                **verification_response(result, student_id, stage.model_used, stage.detector_used),
+                "stages": stages
+            }
         
         # If all methods fail, return error
         return {
@@ -216,7 +731,8 @@ async def verify_faces(
             "message": "All face verification methods failed. Please try again.",
             "model_used": "None",
             "detector_used": "None",
-            "student_id": student_id
+            "student_id": student_id,
+            "stages": stages
         }
         
     except Exception as e:
@@ -231,14 +747,326 @@ async def verify_faces(
             "student_id": student_id
         }
 
+@app.post("/face-identify/")
+async def identify_face(
+    live_image: str = Form(...),       # Base64 encoded live image
+    class_name: str = Form(...),
+    section: str = Form(...),
+    top_k: int = Form(5),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Identify a live face among the enrolled students of one section (1:N)
+    """
+    live = await embedding_batcher.embed(live_image)
+    results = None
+    if live["success"]:
+        matches = await db.run_sync(roster_index.search, class_name, section, live["embedding"], top_k=max(1, top_k))
+        results = [(student_id, deepface_recognizer.similarity_result(similarity)) for student_id, similarity in matches]
+        model_used, detector_used = deepface_recognizer.model_name, deepface_recognizer.detector_backend
+    elif "simple" in recognizer_cascade.stage_names:
+        # ArcFace found no usable face, fall back to the section's thumbnails like the /face-verify/ cascade
+        try:
+            decoded = await asyncio.to_thread(DecodedImage.from_input, live_image)
+        except ValueError:
+            # Not an image at all, nothing to compare
+            decoded = None
+        if decoded is not None:
+            section_ids = (await db.scalars(select(Student.id).where(
+                Student.class_name == class_name,
+                Student.section == section,
+                Student.is_active == True
+            ))).all()
+            matches = await db.run_sync(thumbnail_store.rank, decoded, top_k=max(1, top_k), student_ids=section_ids)
+            results = [(student_id, simple_face_recognizer.similarity_result(percentage)) for student_id, percentage in matches]
+            model_used, detector_used = "Simple Image Comparison", "OpenCV"
+    if results is None:
+        return {
+            "success": False,
+            "class_name": class_name,
+            "section": section,
+            "candidates": [],
+            "message": live.get("message", "Face identification failed")
+        }
+
+    names = dict((await db.execute(
+        select(Student.id, Student.name).where(Student.id.in_([student_id for student_id, _ in results]))
+    )).all()) if results else {}
+
+    candidates = []
+    for student_id, result in results:
+        candidates.append({
+            "student_id": student_id,
+            "name": names.get(student_id),
+            "match_status": result["match_status"],
+            "is_verified": result["is_verified"],
+            "similarity_percentage": result["similarity_percentage"],
+            "confidence_level": result["confidence_level"],
+            "color": result["color"]
+        })
+
+    best_match = candidates[0] if candidates and candidates[0]["is_verified"] else None
+    return {
+        "success": True,
+        "class_name": class_name,
+        "section": section,
+        "candidates": candidates,
+        "student_id": best_match["student_id"] if best_match else None,
+        "model_used": model_used,
+        "detector_used": detector_used,
+        "message": f"Identified student {best_match['student_id']}" if best_match else "No enrolled student matched"
+    }
+
+@app.post("/face-search/")
+async def search_face(
+    live_image: str = Form(...),       # Base64 encoded live image
+    top_k: int = Form(5),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Search every enrolled student in the school for a face, e.g. for lost ID cards
+    """
+    live = await embedding_batcher.embed(live_image)
+    if not live["success"]:
+        return {
+            "success": False,
+            "candidates": [],
+            "message": live.get("message", "Face search failed")
+        }
+
+    matches = await asyncio.to_thread(face_index.search, live["embedding"], top_k=max(1, top_k))
+    students = {
+        student.id: student
+        for student in (await db.execute(
+            select(Student.id, Student.name, Student.class_name, Student.section).where(
+                Student.id.in_([student_id for student_id, _ in matches])
+            )
+        )).all()
+    } if matches else {}
+
+    candidates = []
+    for student_id, similarity in matches:
+        result = deepface_recognizer.similarity_result(similarity)
+        student = students.get(student_id)
+        candidates.append({
+            "student_id": student_id,
+            "name": student.name if student else None,
+            "class_name": student.class_name if student else None,
+            "section": student.section if student else None,
+            "match_status": result["match_status"],
+            "is_verified": result["is_verified"],
+            "similarity_percentage": result["similarity_percentage"],
+            "confidence_level": result["confidence_level"],
+            "color": result["color"]
+        })
+
+    return {
+        "success": True,
+        "candidates": candidates,
+        "model_used": deepface_recognizer.model_name,
+        "detector_used": deepface_recognizer.detector_backend,
+        "message": f"Found {sum(candidate['is_verified'] for candidate in candidates)} matching students"
+    }
+
+@app.get("/metrics")
+async def get_metrics():
+    """
+    Runtime counters for the inference pipeline
+    """
+    return {
+        "embedding_batcher": embedding_batcher.metrics(),
+        "verification_cache": verification_cache.metrics(),
+        "principal_cache": principal_cache.metrics(),
+        "recognizer_cascade": recognizer_cascade.metrics(),
+        "gemini": google_face_recognizer.metrics()
+    }
+
+# Only the columns the history response needs, not student_id or face_confidence
+ATTENDANCE_HISTORY_COLUMNS = [getattr(Attendance, name) for name in attendance_schemas.Attendance.model_fields]
+
 @app.get("/attendance/student/{student_id}", response_model=List[attendance_schemas.Attendance])
-def get_student_attendance(
+async def get_student_attendance(
+    student_id: int,
+    response: Response,
+    subject: Optional[str] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    limit: int = Query(50, ge=1, le=500),
+    cursor: Optional[str] = None,
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    A student's attendance history, newest first
+
+    Filter by subject and by timestamp (start inclusive, end exclusive). Pages
+    hold up to `limit` records; when there are more, the X-Next-Cursor response
+    header holds the `cursor` value for the next page.
+    """
+    query = select(*ATTENDANCE_HISTORY_COLUMNS).where(Attendance.student_id == student_id)
+    if subject is not None:
+        query = query.where(Attendance.subject == subject)
+    if start is not None:
+        query = query.where(Attendance.timestamp >= start)
+    if end is not None:
+        query = query.where(Attendance.timestamp < end)
+    if cursor is not None:
+        try:
+            last_timestamp, last_id = decode_cursor(cursor)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        query = query.where(tuple_(Attendance.timestamp, Attendance.id) < tuple_(last_timestamp, last_id))
+
+    # id breaks timestamp ties so the order, and every page boundary, is stable
+    query = query.order_by(Attendance.timestamp.desc(), Attendance.id.desc()).limit(limit + 1)
+    rows = (await db.execute(query)).all()
+    if len(rows) > limit:
+        rows = rows[:limit]
+        response.headers["X-Next-Cursor"] = encode_cursor(rows[-1].timestamp, rows[-1].id)
+    return rows
+
+@app.get("/attendance/student/{student_id}/summary", response_model=List[attendance_schemas.SubjectSummary])
+async def get_student_attendance_summary(
     student_id: int,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Per-subject attendance totals for a student, read from the maintained summary table
+    """
+    summaries = await db.scalars(
+        select(AttendanceSummary)
+        .where(AttendanceSummary.student_id == student_id)
+        .order_by(AttendanceSummary.subject)
+    )
+    return summaries.all()
+
+@app.get("/attendance/trends", response_model=List[attendance_schemas.TrendPoint])
+async def get_attendance_trends(
+    granularity: Literal["day", "week", "month"] = "week",
+    student_id: Optional[int] = None,
+    class_name: Optional[str] = None,
+    section: Optional[str] = None,
+    subject: Optional[str] = None,
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Attendance rate per day, week or month for a student or a section
+
+    Pass student_id, or class_name and section. Without a subject the buckets
+    cover all subjects. Reads one rollup row per bucket and subject, however
+    many attendance records there are.
+    """
+    if student_id is not None:
+        scope, scope_id = "student", str(student_id)
+    elif class_name is not None and section is not None:
+        scope, scope_id = "section", section_scope_id(class_name, section)
+    else:
+        raise HTTPException(status_code=400, detail="Pass student_id, or class_name and section")
+
+    query = select(
+        AttendanceRollup.bucket,
+        func.sum(AttendanceRollup.present_count).label("present_count"),
+        func.sum(AttendanceRollup.absent_count).label("absent_count"),
+        func.sum(AttendanceRollup.total_count).label("total_count")
+    ).where(
+        AttendanceRollup.granularity == granularity,
+        AttendanceRollup.scope == scope,
+        AttendanceRollup.scope_id == scope_id
+    )
+    if subject is not None:
+        query = query.where(AttendanceRollup.subject == subject)
+    if start is not None:
+        # Include the bucket that start falls in
+        query = query.where(AttendanceRollup.bucket >= bucket_start(granularity, start))
+    if end is not None:
+        query = query.where(AttendanceRollup.bucket < end)
+
+    rows = await db.execute(query.group_by(AttendanceRollup.bucket).order_by(AttendanceRollup.bucket))
+    return [
+        {
+            **row._asdict(),
+            "attendance_percentage": round(row.present_count * 100 / row.total_count, 2) if row.total_count else 0.0
+        }
+        for row in rows
+    ]
+
+@app.get("/attendance/export")
+async def export_attendance(
+    format: Literal["csv", "ndjson"] = "csv",
+    class_name: Optional[str] = None,
+    section: Optional[str] = None,
+    subject: Optional[str] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    current_user: Student = Depends(get_current_user)
+):
+    """
+    Stream attendance records with their students as CSV or NDJSON, for semester reports
+
+    Filter by class, section, subject and timestamp (start inclusive, end
+    exclusive). Rows are streamed in batches as they are read, never loaded
+    into memory all at once. Staff export every student, students only
+    their own records.
+    """
+    query = attendance_exporter.query(
+        class_name, section, subject, start, end,
+        student_id=None if is_staff(current_user.email) else current_user.id
+    )
+    return StreamingResponse(
+        attendance_exporter.aiter_chunks(query, format),
+        media_type=EXPORT_FORMATS[format],
+        headers={"Content-Disposition": f'attachment; filename="attendance.{format}"'}
+    )
+
+PHOTO_MEDIA_TYPES = {"jpg": "image/jpeg", "png": "image/png", "webp": "image/webp"}
+
+async def attendance_photo_path(db: AsyncSession, attendance_id: int, photo: int) -> str:
+    """Stored path of photo 1 or 2 of an attendance record, 404 if there is none"""
+    record = await db.get(Attendance, attendance_id)
+    # The photo is read or resized next, don't hold the connection meanwhile
+    await db.close()
+    if not record:
+        raise HTTPException(status_code=404, detail="Attendance record not found")
+    path = record.photo1_path if photo == 1 else record.photo2_path if photo == 2 else None
+    if not path:
+        raise HTTPException(status_code=404, detail="Photo not found")
+    return path
+
+@app.get("/attendance/{attendance_id}/preview")
+async def get_attendance_preview(
+    attendance_id: int,
+    photo: int = 1,
+    db: AsyncSession = Depends(get_async_db)
 ):
-    attendance_records = db.query(Attendance).filter(
-        Attendance.student_id == student_id
-    ).all()
-    return attendance_records
+    """
+    Small WebP/JPEG preview of an attendance photo, for the dashboard
+    """
+    preview_path = await photo_storage.preview(await attendance_photo_path(db, attendance_id, photo))
+    if preview_path is None:
+        raise HTTPException(status_code=404, detail="Photo not found")
+    return FileResponse(
+        preview_path,
+        media_type=PHOTO_MEDIA_TYPES.get(preview_path.rsplit(".", 1)[-1]),
+        headers={"Cache-Control": "private, max-age=86400"}
+    )
+
+@app.get("/attendance/{attendance_id}/photo")
+async def get_attendance_photo(
+    attendance_id: int,
+    photo: int = 1,
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Original attendance photo, read back from the pack archive if it has been archived
+    """
+    path = await attendance_photo_path(db, attendance_id, photo)
+    data = await asyncio.to_thread(photo_storage.read, path)
+    if data is None:
+        raise HTTPException(status_code=404, detail="Photo not found")
+    return Response(
+        content=data,
+        media_type=PHOTO_MEDIA_TYPES.get(photo_storage.extension(data), "application/octet-stream")
+    )
 
 # Assignment endpoints removed - not used in current system
\ No newline at end of file
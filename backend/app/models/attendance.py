@@ -1,9 +1,13 @@
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Boolean, Float
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Boolean, Float, Index
 from ..database.database import Base
 from datetime import datetime
 
 class Attendance(Base):
     __tablename__ = "attendance"
+    __table_args__ = (
+        # Serves a student's history, optionally for one subject, newest first
+        Index("ix_attendance_student_subject_timestamp", "student_id", "subject", "timestamp"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     student_id = Column(Integer, ForeignKey("students.id"))
@@ -0,0 +1,21 @@
+from sqlalchemy import Column, Integer, String, Date
+from ..database.database import Base
+
+class AttendanceRollup(Base):
+    """
+    Attendance counts per day, week or month bucket
+
+    scope is "student" (scope_id is the student id) or "section" (scope_id is
+    "<class_name>/<section>"). Week buckets start on Monday, month buckets on
+    the 1st. The primary key order serves range queries over bucket.
+    """
+    __tablename__ = "attendance_rollups"
+
+    granularity = Column(String, primary_key=True)  # day/week/month
+    scope = Column(String, primary_key=True)
+    scope_id = Column(String, primary_key=True)
+    subject = Column(String, primary_key=True)
+    bucket = Column(Date, primary_key=True)  # first day of the period
+    present_count = Column(Integer, default=0, nullable=False)
+    absent_count = Column(Integer, default=0, nullable=False)
+    total_count = Column(Integer, default=0, nullable=False)
@@ -0,0 +1,23 @@
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Float
+from ..database.database import Base
+
+class AttendanceSummary(Base):
+    """Running attendance totals per student and subject, kept in step with the attendance table"""
+    __tablename__ = "attendance_summaries"
+
+    student_id = Column(Integer, ForeignKey("students.id"), primary_key=True)
+    subject = Column(String, primary_key=True)
+    present_count = Column(Integer, default=0, nullable=False)
+    absent_count = Column(Integer, default=0, nullable=False)
+    total_count = Column(Integer, default=0, nullable=False)  # includes statuses other than Present/Absent
+    confidence_sum = Column(Float, default=0.0, nullable=False)  # sum of face_confidence
+    last_seen = Column(DateTime)  # latest Present record
+    last_marked = Column(DateTime)  # latest record of any status
+
+    @property
+    def attendance_percentage(self) -> float:
+        return round(self.present_count * 100 / self.total_count, 2) if self.total_count else 0.0
+
+    @property
+    def mean_face_confidence(self) -> float:
+        return round(self.confidence_sum / self.total_count, 2) if self.total_count else 0.0
@@ -0,0 +1,18 @@
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, LargeBinary, UniqueConstraint
+from ..database.database import Base
+from datetime import datetime
+
+class FaceEmbedding(Base):
+    __tablename__ = "face_embeddings"
+    __table_args__ = (
+        UniqueConstraint("student_id", "model_name", "detector_backend", name="uq_face_embedding_student_model"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    student_id = Column(Integer, ForeignKey("students.id"), index=True)
+    model_name = Column(String)  # e.g. ArcFace
+    detector_backend = Column(String)  # e.g. retinaface
+    dimension = Column(Integer)
+    embedding = Column(LargeBinary)  # float32 vector bytes
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
@@ -0,0 +1,12 @@
+from sqlalchemy import Column, Integer, DateTime, ForeignKey, LargeBinary
+from ..database.database import Base
+from datetime import datetime
+
+class FaceThumbnail(Base):
+    __tablename__ = "face_thumbnails"
+
+    student_id = Column(Integer, ForeignKey("students.id"), primary_key=True)
+    width = Column(Integer)
+    height = Column(Integer)
+    thumbnail = Column(LargeBinary)  # grayscale uint8 pixels, row-major
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
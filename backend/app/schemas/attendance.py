@@ -1,6 +1,6 @@
 from pydantic import BaseModel
-from datetime import datetime
-from typing import Optional
+from datetime import date, datetime
+from typing import List, Optional
 
 class AttendanceBase(BaseModel):
     subject: str
@@ -22,3 +22,45 @@ class Attendance(AttendanceBase):
 
     class Config:
         from_attributes = True
+
+class SubjectSummary(BaseModel):
+    subject: str
+    present_count: int
+    absent_count: int
+    total_count: int
+    attendance_percentage: float
+    mean_face_confidence: float
+    last_seen: Optional[datetime]
+    last_marked: Optional[datetime]
+
+    class Config:
+        from_attributes = True
+
+class BulkRecordResult(BaseModel):
+    line: int  # line of the uploaded batch
+    status: str  # created/error
+    id: Optional[int] = None
+    error: Optional[str] = None
+
+class BulkAttendanceResult(BaseModel):
+    received: int
+    created: int
+    failed: int
+    results: List[BulkRecordResult]
+
+class TrendPoint(BaseModel):
+    bucket: date  # first day of the day/week/month
+    present_count: int
+    absent_count: int
+    total_count: int
+    attendance_percentage: float
+
+class ClassroomAttendance(BaseModel):
+    class_name: str
+    section: str
+    subject: str
+    faces_detected: int
+    unmatched_faces: int
+    present_student_ids: List[int]
+    absent_student_ids: List[int]
+    records: List[Attendance]
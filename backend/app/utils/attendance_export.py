@@ -0,0 +1,108 @@
+import io
+import os
+import csv
+import json
+from datetime import datetime
+from typing import AsyncIterator, Iterator, Optional, Sequence
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from ..database.database import AsyncSessionLocal
+from ..models.attendance import Attendance
+from ..models.student import Student
+
+EXPORT_COLUMNS = [
+    Attendance.id,
+    Attendance.student_id,
+    Student.name,
+    Student.email,
+    Student.class_name,
+    Student.section,
+    Student.semester,
+    Attendance.subject,
+    Attendance.status,
+    Attendance.timestamp,
+    Attendance.face_matched,
+    Attendance.face_confidence,
+    Attendance.photo1_path,
+    Attendance.photo2_path
+]
+EXPORT_FORMATS = {"csv": "text/csv", "ndjson": "application/x-ndjson"}
+
+class AttendanceExporter:
+    """
+    Streams attendance records joined with their students as CSV or NDJSON
+
+    Rows are fetched batch_size at a time through a server-side cursor
+    (yield_per) and each batch is formatted into one text chunk, so memory
+    use depends on the batch size, not on how many rows are exported.
+    """
+
+    def __init__(self, batch_size: int = 1000):
+        self.batch_size = batch_size
+        self.field_names = [column.key for column in EXPORT_COLUMNS]
+        self.field_names[0] = "attendance_id"
+        self.field_names[2] = "student_name"
+
+    def query(
+        self,
+        class_name: Optional[str] = None,
+        section: Optional[str] = None,
+        subject: Optional[str] = None,
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None,
+        student_id: Optional[int] = None
+    ):
+        """Export query, oldest first; start is inclusive and end exclusive"""
+        query = select(*EXPORT_COLUMNS).join(Student, Student.id == Attendance.student_id)
+        if student_id is not None:
+            query = query.where(Attendance.student_id == student_id)
+        if class_name is not None:
+            query = query.where(Student.class_name == class_name)
+        if section is not None:
+            query = query.where(Student.section == section)
+        if subject is not None:
+            query = query.where(Attendance.subject == subject)
+        if start is not None:
+            query = query.where(Attendance.timestamp >= start)
+        if end is not None:
+            query = query.where(Attendance.timestamp < end)
+        return query.order_by(Attendance.timestamp, Attendance.id).execution_options(yield_per=self.batch_size)
+
+    def header(self, export_format: str) -> str:
+        if export_format == "csv":
+            return self.format_rows([self.field_names], export_format)
+        return ""
+
+    def format_rows(self, rows: Sequence[Sequence], export_format: str) -> str:
+        if export_format == "csv":
+            buffer = io.StringIO()
+            csv.writer(buffer).writerows(rows)
+            return buffer.getvalue()
+        return "".join(
+            json.dumps(dict(zip(self.field_names, row)), default=lambda value: value.isoformat()) + "\n"
+            for row in rows
+        )
+
+    def iter_chunks(self, db: Session, query, export_format: str) -> Iterator[str]:
+        """Text chunks of the export, read through a sync session"""
+        yield self.header(export_format)
+        for rows in db.execute(query).partitions():
+            yield self.format_rows(rows, export_format)
+
+    async def aiter_chunks(self, query, export_format: str) -> AsyncIterator[str]:
+        """
+        Text chunks of the export, read through an async session
+
+        The session is opened here rather than taken from a request
+        dependency, because it has to stay open until the response has been
+        streamed.
+        """
+        yield self.header(export_format)
+        async with AsyncSessionLocal() as db:
+            result = await db.stream(query)
+            async for rows in result.partitions():
+                yield self.format_rows(rows, export_format)
+
+# Create a global instance
+attendance_exporter = AttendanceExporter(batch_size=int(os.getenv("EXPORT_BATCH_SIZE", "1000")))
@@ -0,0 +1,297 @@
+import os
+from datetime import date, datetime, timedelta
+from types import SimpleNamespace
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+from sqlalchemy import case, delete, func, insert, literal, select, update
+from sqlalchemy.dialects import mysql, postgresql, sqlite
+from sqlalchemy.orm import Session
+
+from ..database.database import engine
+from ..models.attendance import Attendance
+from ..models.attendance_summary import AttendanceSummary
+from ..models.attendance_rollup import AttendanceRollup
+from ..models.student import Student
+
+# (table columns, incoming row) -> column assignments for a row whose key already exists
+Assignments = Callable[[object, object], dict]
+
+def upsert_statement(dialect_name: str, model, key_columns: Sequence[str], assignments: Assignments):
+    """
+    The dialect's single-statement upsert of model rows, None if it has none
+
+    PostgreSQL and SQLite use INSERT ... ON CONFLICT DO UPDATE, MySQL and
+    MariaDB INSERT ... ON DUPLICATE KEY UPDATE.
+    """
+    table = model.__table__.c
+    if dialect_name in ("postgresql", "sqlite"):
+        statement = (postgresql.insert if dialect_name == "postgresql" else sqlite.insert)(model)
+        return statement.on_conflict_do_update(
+            index_elements=[table[name] for name in key_columns],
+            set_=assignments(table, statement.excluded)
+        )
+    if dialect_name in ("mysql", "mariadb"):
+        statement = mysql.insert(model)
+        return statement.on_duplicate_key_update(assignments(table, statement.inserted))
+    print(f"No upsert statement for {dialect_name}, attendance aggregates are updated row by row")
+    return None
+
+def upsert_each(db: Session, model, key_columns: Sequence[str], assignments: Assignments, rows: List[dict]) -> None:
+    """Portable upsert for other dialects: UPDATE each row's key, INSERT the row if nothing matched"""
+    table = model.__table__.c
+    for row in rows:
+        new = SimpleNamespace(**{name: literal(value, table[name].type) for name, value in row.items()})
+        result = db.execute(
+            update(model).where(*(table[name] == row[name] for name in key_columns)).values(assignments(table, new))
+        )
+        if result.rowcount == 0:
+            db.execute(insert(model).values(row))
+
+def latest(current, new):
+    """The later of two nullable timestamps, in SQL"""
+    return case(
+        (current.is_(None), new),
+        (new.is_(None), current),
+        (new > current, new),
+        else_=current
+    )
+
+class AttendanceSummaryStore:
+    """
+    Maintains attendance_summaries incrementally
+
+    Every code path that inserts attendance records also calls apply() for
+    the same records in the same transaction, so the summary never
+    disagrees with the raw table. rebuild() recomputes it from
+    scratch, for existing databases and after manual edits.
+    """
+
+    key_columns = ("student_id", "subject")
+
+    def __init__(self, dialect_name: str):
+        self._statement = upsert_statement(dialect_name, AttendanceSummary, self.key_columns, self._assignments)
+
+    def deltas(self, records: Iterable[dict]) -> List[dict]:
+        """Collapse attendance rows into one increment per (student_id, subject)"""
+        totals: Dict[Tuple[int, str], dict] = {}
+        for record in records:
+            key = (record["student_id"], record["subject"])
+            delta = totals.get(key)
+            if delta is None:
+                delta = totals[key] = {
+                    "student_id": key[0],
+                    "subject": key[1],
+                    "present_count": 0,
+                    "absent_count": 0,
+                    "total_count": 0,
+                    "confidence_sum": 0.0,
+                    "last_seen": None,
+                    "last_marked": None
+                }
+            timestamp = record["timestamp"]
+            delta["total_count"] += 1
+            delta["confidence_sum"] += record.get("face_confidence") or 0.0
+            delta["last_marked"] = max(filter(None, (delta["last_marked"], timestamp)))
+            if record["status"] == "Present":
+                delta["present_count"] += 1
+                delta["last_seen"] = max(filter(None, (delta["last_seen"], timestamp)))
+            elif record["status"] == "Absent":
+                delta["absent_count"] += 1
+        return list(totals.values())
+
+    def apply(self, db: Session, records: Iterable[dict]) -> None:
+        """
+        Add the records to their summaries, in db's current transaction
+
+        Records need student_id, subject, status, timestamp and face_confidence.
+        The upsert runs as one executemany; from an AsyncSession use
+        await db.run_sync(attendance_summaries.apply, records).
+        """
+        deltas = self.deltas(records)
+        if not deltas:
+            return
+        if self._statement is not None:
+            db.execute(self._statement, deltas)
+        else:
+            upsert_each(db, AttendanceSummary, self.key_columns, self._assignments, deltas)
+
+    def _assignments(self, table, new) -> dict:
+        return {
+            "present_count": table.present_count + new.present_count,
+            "absent_count": table.absent_count + new.absent_count,
+            "total_count": table.total_count + new.total_count,
+            "confidence_sum": table.confidence_sum + new.confidence_sum,
+            "last_seen": latest(table.last_seen, new.last_seen),
+            "last_marked": latest(table.last_marked, new.last_marked)
+        }
+
+    def rebuild(self, db: Session, student_id: Optional[int] = None) -> int:
+        """
+        Recompute summaries from the attendance table, for one student or everyone
+
+        Returns:
+            Number of summary rows written
+        """
+        present = Attendance.status == "Present"
+        query = select(
+            Attendance.student_id,
+            Attendance.subject,
+            func.sum(case((present, 1), else_=0)),
+            func.sum(case((Attendance.status == "Absent", 1), else_=0)),
+            func.count(),
+            func.coalesce(func.sum(Attendance.face_confidence), 0.0),
+            func.max(case((present, Attendance.timestamp))),
+            func.max(Attendance.timestamp)
+        ).group_by(Attendance.student_id, Attendance.subject)
+        clear = delete(AttendanceSummary)
+        if student_id is not None:
+            query = query.where(Attendance.student_id == student_id)
+            clear = clear.where(AttendanceSummary.student_id == student_id)
+
+        db.execute(clear)
+        result = db.execute(insert(AttendanceSummary).from_select([
+            "student_id", "subject", "present_count", "absent_count", "total_count",
+            "confidence_sum", "last_seen", "last_marked"
+        ], query))
+        db.commit()
+        return result.rowcount
+
+GRANULARITIES = ("day", "week", "month")
+
+def bucket_start(granularity: str, day: date) -> date:
+    """First day of the day/week/month bucket containing day, weeks start on Monday"""
+    if granularity == "day":
+        return day
+    if granularity == "week":
+        return day - timedelta(days=day.weekday())
+    if granularity == "month":
+        return day.replace(day=1)
+    raise ValueError(f"Unknown granularity: {granularity}")
+
+def section_scope_id(class_name: str, section: str) -> str:
+    return f"{class_name}/{section}"
+
+class AttendanceRollupStore:
+    """
+    Maintains attendance_rollups incrementally, for trend charts
+
+    Like the subject summaries, every insert path calls apply() in its own
+    transaction, adding each record to its day, week and month
+    bucket for the student and for their section. compact() runs on a
+    schedule and drops day and week buckets past their retention, since the
+    coarser buckets still cover that time; month buckets are kept forever.
+    """
+
+    key_columns = ("granularity", "scope", "scope_id", "subject", "bucket")
+
+    def __init__(self, dialect_name: str, day_retention_days: int, week_retention_days: int):
+        self._statement = upsert_statement(dialect_name, AttendanceRollup, self.key_columns, self._assignments)
+        self.retention = {"day": day_retention_days, "week": week_retention_days}
+
+    def deltas(self, records: Iterable[dict]) -> List[dict]:
+        """
+        Collapse attendance rows into one increment per rollup key
+
+        Records need student_id, class_name, section, subject, status and timestamp.
+        """
+        totals: Dict[tuple, dict] = {}
+        for record in records:
+            day = record["timestamp"].date()
+            scopes = (
+                ("student", str(record["student_id"])),
+                ("section", section_scope_id(record["class_name"], record["section"]))
+            )
+            for granularity in GRANULARITIES:
+                bucket = bucket_start(granularity, day)
+                for scope, scope_id in scopes:
+                    key = (granularity, scope, scope_id, record["subject"], bucket)
+                    delta = totals.get(key)
+                    if delta is None:
+                        delta = totals[key] = dict(
+                            zip(("granularity", "scope", "scope_id", "subject", "bucket"), key),
+                            present_count=0,
+                            absent_count=0,
+                            total_count=0
+                        )
+                    delta["total_count"] += 1
+                    if record["status"] == "Present":
+                        delta["present_count"] += 1
+                    elif record["status"] == "Absent":
+                        delta["absent_count"] += 1
+        return list(totals.values())
+
+    def apply(self, db: Session, records: Iterable[dict]) -> None:
+        """
+        Add the records to their buckets, in db's current transaction
+
+        Like AttendanceSummaryStore.apply(). A batch touches many buckets, so
+        the statement is compiled once and the driver runs it per bucket,
+        rather than compiling one huge multi-row VALUES.
+        """
+        deltas = self.deltas(records)
+        if not deltas:
+            return
+        if self._statement is not None:
+            db.execute(self._statement, deltas)
+        else:
+            upsert_each(db, AttendanceRollup, self.key_columns, self._assignments, deltas)
+
+    def _assignments(self, table, new) -> dict:
+        return {
+            "present_count": table.present_count + new.present_count,
+            "absent_count": table.absent_count + new.absent_count,
+            "total_count": table.total_count + new.total_count
+        }
+
+    def compact(self, db: Session, today: Optional[date] = None) -> int:
+        """
+        Delete day and week buckets older than their retention
+
+        Returns:
+            Number of rollup rows deleted
+        """
+        today = today or datetime.utcnow().date()
+        deleted = 0
+        for granularity, days in self.retention.items():
+            if days <= 0:
+                continue
+            cutoff = bucket_start(granularity, today - timedelta(days=days))
+            deleted += db.execute(delete(AttendanceRollup).where(
+                AttendanceRollup.granularity == granularity,
+                AttendanceRollup.bucket < cutoff
+            )).rowcount
+        db.commit()
+        return deleted
+
+    def rebuild(self, db: Session, batch_size: int = 10000) -> int:
+        """
+        Recompute every bucket from the attendance table, then compact
+
+        Records are attributed to the student's current section.
+
+        Returns:
+            Number of rollup rows written
+        """
+        rows = db.execute(
+            select(
+                Attendance.student_id, Student.class_name, Student.section,
+                Attendance.subject, Attendance.status, Attendance.timestamp
+            )
+            .join(Student, Student.id == Attendance.student_id)
+            .where(Attendance.timestamp.is_not(None))
+            .execution_options(yield_per=batch_size)
+        )
+        deltas = self.deltas(row._asdict() for row in rows)
+
+        db.execute(delete(AttendanceRollup))
+        for start in range(0, len(deltas), batch_size):
+            db.execute(insert(AttendanceRollup), deltas[start:start + batch_size])
+        db.commit()
+        return len(deltas) - self.compact(db)
+
+# Create global instances
+attendance_summaries = AttendanceSummaryStore(engine.dialect.name)
+attendance_rollups = AttendanceRollupStore(
+    engine.dialect.name,
+    day_retention_days=int(os.getenv("ROLLUP_DAY_RETENTION_DAYS", "180")),
+    week_retention_days=int(os.getenv("ROLLUP_WEEK_RETENTION_DAYS", "730"))
+)
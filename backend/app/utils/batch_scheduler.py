@@ -0,0 +1,106 @@
+import os
+import asyncio
+from collections import Counter
+from typing import Any, Dict, List, Tuple
+
+from .deepface_recognition import deepface_recognizer
+from .image_preprocessing import ImageLike
+from .inference_executor import InferenceExecutor, inference_executor
+
+class EmbeddingBatcher:
+    """
+    Collects concurrent embedding requests into batched ArcFace calls
+
+    A batch is flushed when it reaches EMBEDDING_BATCH_SIZE images or when the
+    first queued request has waited EMBEDDING_BATCH_WINDOW_MS, whichever comes
+    first. Each batch runs as one embed_images call on the inference executor,
+    and several batches can be in flight at once on different workers.
+    """
+
+    def __init__(self, executor: InferenceExecutor):
+        self.executor = executor
+        self.max_batch_size = int(os.getenv("EMBEDDING_BATCH_SIZE", "16"))
+        self.batch_window_ms = float(os.getenv("EMBEDDING_BATCH_WINDOW_MS", "5"))
+        self._pending: List[Tuple[ImageLike, asyncio.Future]] = []
+        self._flush_handle = None
+        # Metrics
+        self.in_flight = 0
+        self.total_requests = 0
+        self.total_batches = 0
+        self.batch_size_counts = Counter()
+
+    async def embed(self, image_base64: ImageLike) -> Dict[str, Any]:
+        """Queue one image and wait for its embedding result"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((image_base64, future))
+        self.total_requests += 1
+
+        if len(self._pending) >= self.max_batch_size:
+            self._flush()
+        elif self._flush_handle is None:
+            self._flush_handle = loop.call_later(self.batch_window_ms / 1000, self._flush)
+
+        return await future
+
+    async def verify(self, reference_image_base64: ImageLike, live_image_base64: ImageLike) -> Dict[str, Any]:
+        """Embed both images through the batcher and compare them, like DeepFace.verify"""
+        reference, live = await asyncio.gather(
+            self.embed(reference_image_base64),
+            self.embed(live_image_base64)
+        )
+        for embedding_result in (reference, live):
+            if not embedding_result["success"]:
+                return deepface_recognizer.embedding_error_result(embedding_result)
+        return deepface_recognizer.compare_embeddings(reference["embedding"], live["embedding"])
+
+    def _flush(self) -> None:
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        if not self._pending:
+            return
+
+        batch = self._pending[:self.max_batch_size]
+        self._pending = self._pending[self.max_batch_size:]
+        if self._pending:
+            # Leftovers start a new window rather than waiting for more traffic
+            loop = asyncio.get_running_loop()
+            self._flush_handle = loop.call_later(self.batch_window_ms / 1000, self._flush)
+
+        self.total_batches += 1
+        self.batch_size_counts[len(batch)] += 1
+        asyncio.ensure_future(self._run_batch(batch))
+
+    async def _run_batch(self, batch: List[Tuple[ImageLike, asyncio.Future]]) -> None:
+        self.in_flight += len(batch)
+        try:
+            results = await self.executor.run("embed_images", [image for image, _ in batch])
+        except Exception as e:
+            results = [{
+                "success": False,
+                "error": str(e),
+                "message": f"Error extracting face embedding: {str(e)}"
+            }] * len(batch)
+        finally:
+            self.in_flight -= len(batch)
+
+        for (_, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+
+    def metrics(self) -> Dict[str, Any]:
+        batched_requests = sum(size * count for size, count in self.batch_size_counts.items())
+        return {
+            "queue_depth": len(self._pending),
+            "in_flight": self.in_flight,
+            "total_requests": self.total_requests,
+            "total_batches": self.total_batches,
+            "mean_batch_size": round(batched_requests / self.total_batches, 2) if self.total_batches else 0,
+            "batch_size_histogram": dict(sorted(self.batch_size_counts.items())),
+            "max_batch_size": self.max_batch_size,
+            "batch_window_ms": self.batch_window_ms
+        }
+
+# Create a global instance
+embedding_batcher = EmbeddingBatcher(inference_executor)
@@ -0,0 +1,137 @@
+import io
+import csv
+import json
+import math
+from datetime import datetime, timezone
+from typing import List, Optional, Tuple
+
+FIELDS = ("student_id", "subject", "status", "timestamp", "photo1", "photo2", "face_matched", "face_confidence")
+TRUE_VALUES = {"1", "true", "yes", "y", "t"}
+FALSE_VALUES = {"0", "false", "no", "n", "f", ""}
+
+class BulkRecordError(ValueError):
+    """A record of a bulk upload that cannot be imported"""
+
+def _optional(value) -> Optional[object]:
+    # CSV has no null, an empty cell means the field was not given
+    return None if value is None or value == "" else value
+
+def _parse_timestamp(value) -> Optional[datetime]:
+    value = _optional(value)
+    if value is None:
+        return None
+    try:
+        timestamp = datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+    except ValueError:
+        raise BulkRecordError(f"invalid timestamp: {value}")
+    # Timestamps are stored as naive UTC, like datetime.utcnow() elsewhere
+    if timestamp.tzinfo is not None:
+        timestamp = timestamp.astimezone(timezone.utc).replace(tzinfo=None)
+    return timestamp
+
+def _parse_bool(value) -> bool:
+    if isinstance(value, bool):
+        return value
+    if value is None:
+        return False
+    text = str(value).strip().lower()
+    if text in TRUE_VALUES:
+        return True
+    if text in FALSE_VALUES:
+        return False
+    raise BulkRecordError(f"invalid face_matched: {value}")
+
+def _parse_photo(raw: dict, name: str) -> Optional[str]:
+    value = _optional(raw.get(name))
+    if value is not None and not isinstance(value, str):
+        raise BulkRecordError(f"invalid {name}: must be a photo digest or path")
+    return value
+
+def validate_record(raw: dict) -> dict:
+    """
+    Check and normalize one record's fields, before it is matched against the database
+
+    Returns:
+        student_id, subject, status, timestamp (None for now), photo1, photo2
+        (stored photo references or None), face_matched and face_confidence
+    """
+    if not isinstance(raw, dict):
+        raise BulkRecordError("record must be an object")
+    unknown = set(raw) - set(FIELDS)
+    if unknown:
+        raise BulkRecordError(f"unknown fields: {', '.join(sorted(unknown))}")
+
+    student_id = _optional(raw.get("student_id"))
+    if student_id is None:
+        raise BulkRecordError("student_id is required")
+    try:
+        student_id = int(student_id)
+    except (TypeError, ValueError):
+        raise BulkRecordError(f"invalid student_id: {student_id}")
+
+    subject = _optional(raw.get("subject"))
+    status = _optional(raw.get("status"))
+    if not isinstance(subject, str) or not subject.strip():
+        raise BulkRecordError("subject is required")
+    if not isinstance(status, str) or not status.strip():
+        raise BulkRecordError("status is required")
+
+    confidence = _optional(raw.get("face_confidence"))
+    try:
+        confidence = float(confidence) if confidence is not None else 0.0
+    except (TypeError, ValueError):
+        raise BulkRecordError(f"invalid face_confidence: {confidence}")
+    # nan or inf would poison the confidence sums in the attendance summaries
+    if not math.isfinite(confidence):
+        raise BulkRecordError(f"invalid face_confidence: {confidence}")
+
+    return {
+        "student_id": student_id,
+        "subject": subject.strip(),
+        "status": status.strip(),
+        "timestamp": _parse_timestamp(raw.get("timestamp")),
+        "photo1": _parse_photo(raw, "photo1"),
+        "photo2": _parse_photo(raw, "photo2"),
+        "face_matched": _parse_bool(raw.get("face_matched")),
+        "face_confidence": confidence
+    }
+
+def parse_records(body: bytes, content_type: str) -> Tuple[List[Tuple[int, dict]], List[Tuple[int, str]]]:
+    """
+    Parse an NDJSON or CSV (with a header row) batch of attendance records
+
+    Lines are numbered from 1, counting the CSV header, so errors point at
+    the line of the uploaded file.
+
+    Returns:
+        ([(line, record)], [(line, error message)])
+    """
+    try:
+        text = body.decode("utf-8-sig")
+    except UnicodeDecodeError:
+        return [], [(0, "batch is not valid UTF-8")]
+
+    records = []
+    errors = []
+    if "csv" in content_type:
+        reader = csv.DictReader(io.StringIO(text))
+        for row in reader:
+            line = reader.line_num
+            if None in row:
+                errors.append((line, "more cells than header columns"))
+                continue
+            try:
+                records.append((line, validate_record(row)))
+            except BulkRecordError as e:
+                errors.append((line, str(e)))
+    else:
+        for line, row in enumerate(text.splitlines(), start=1):
+            if not row.strip():
+                continue
+            try:
+                records.append((line, validate_record(json.loads(row))))
+            except json.JSONDecodeError as e:
+                errors.append((line, f"invalid JSON: {e.msg}"))
+            except BulkRecordError as e:
+                errors.append((line, str(e)))
+    return records, errors
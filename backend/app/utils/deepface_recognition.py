@@ -1,12 +1,9 @@
-import os
-import base64
-import tempfile
-from typing import Dict, Any
+from typing import Dict, Any, List, Optional
 from deepface import DeepFace
-import cv2
+from deepface.commons import distance as dst
+from deepface.commons import functions
 import numpy as np
-from PIL import Image
-import io
+from .image_preprocessing import ImageLike, GROUP_PHOTO_MAX_SIDE, as_decoded_image
 
 class DeepFaceRecognition:
     def __init__(self):
@@ -14,111 +11,107 @@ class DeepFaceRecognition:
         self.detector_backend = "retinaface"
         self.distance_metric = "cosine"
         self.threshold = 0.6  # Similarity threshold (0.6 = 60% similarity)
+        self.is_ready = False  # Set once the models are built and warmed up
+        self.warm_up_error = None
     
-    def base64_to_image(self, base64_string: str) -> np.ndarray:
-        """Convert base64 string to OpenCV image array"""
+    def warm_up(self) -> bool:
+        """
+        Build the recognition and detection models and run a dummy forward pass
+        
+        DeepFace builds models lazily and caches them per process, so without
+        this the first request pays for weight loading and graph tracing.
+        
+        Returns:
+            True if the models are ready to serve requests
+        """
         try:
-            # Remove data URL prefix if present
-            if base64_string.startswith('data:image'):
-                base64_string = base64_string.split(',')[1]
+            DeepFace.build_model(self.model_name)
             
-            # Decode base64
-            image_data = base64.b64decode(base64_string)
+            # A blank frame has no face, so skip enforcement and let the whole
+            # image go through the detector and the embedding model once
+            dummy_img = np.zeros((224, 224, 3), dtype=np.uint8)
+            DeepFace.represent(
+                img_path=dummy_img,
+                model_name=self.model_name,
+                detector_backend=self.detector_backend,
+                enforce_detection=False
+            )
             
-            # Convert to PIL Image
-            pil_image = Image.open(io.BytesIO(image_data))
-            
-            # Convert to RGB if necessary
-            if pil_image.mode != 'RGB':
-                pil_image = pil_image.convert('RGB')
-            
-            # Convert to OpenCV format
-            opencv_image = cv2.cvtColor(np.array(pil_image), cv2.COLOR_RGB2BGR)
-            
-            return opencv_image
+            self.is_ready = True
+            self.warm_up_error = None
         except Exception as e:
-            raise ValueError(f"Error converting base64 to image: {str(e)}")
+            self.warm_up_error = str(e)
+            print(f"DeepFace warm-up error: {e}")
+        return self.is_ready
+    
+    def build_match_result(self, is_verified: bool, distance: float, threshold: float) -> Dict[str, Any]:
+        """Turn a DeepFace distance and threshold into the API match result"""
+        # DeepFace hands back numpy scalars, which FastAPI cannot serialize
+        is_verified = bool(is_verified)
+        distance = float(distance)
+        threshold = float(threshold)
+        
+        # Calculate similarity percentage (inverse of distance)
+        # Cosine distance: 0 = identical, 1 = completely different
+        # Convert to similarity percentage: (1 - distance) * 100
+        similarity_percentage = max(0, (1 - distance) * 100)
+        
+        # Determine match status based on verification and similarity
+        if is_verified and similarity_percentage >= 60:
+            match_status = "MATCH"
+            confidence_level = "HIGH"
+            color = "green"
+        elif similarity_percentage >= 40:
+            match_status = "POSSIBLE_MATCH"
+            confidence_level = "MEDIUM"
+            color = "orange"
+        else:
+            match_status = "NO_MATCH"
+            confidence_level = "LOW"
+            color = "red"
+        
+        return {
+            "success": True,
+            "match_status": match_status,
+            "is_verified": is_verified,
+            "similarity_percentage": round(similarity_percentage, 2),
+            "distance": round(distance, 4),
+            "threshold": round(threshold, 4),
+            "confidence_level": confidence_level,
+            "color": color,
+            "model_used": self.model_name,
+            "detector_used": self.detector_backend,
+            "message": f"Face {match_status.lower().replace('_', ' ')} with {similarity_percentage:.1f}% similarity"
+        }
     
-    def verify_faces(self, reference_image_base64: str, live_image_base64: str) -> Dict[str, Any]:
+    def verify_faces(self, reference_image_base64: ImageLike, live_image_base64: ImageLike) -> Dict[str, Any]:
         """
         Compare two faces using DeepFace with ArcFace model
         
         Args:
-            reference_image_base64: Base64 encoded reference image
-            live_image_base64: Base64 encoded live captured image
+            reference_image_base64: Base64 encoded, raw or decoded reference image
+            live_image_base64: Base64 encoded, raw or decoded live captured image
             
         Returns:
             Dict containing match result, confidence, and details
         """
         try:
-            # Convert base64 strings to images
-            reference_img = self.base64_to_image(reference_image_base64)
-            live_img = self.base64_to_image(live_image_base64)
+            reference_img = as_decoded_image(reference_image_base64).pixels
+            live_img = as_decoded_image(live_image_base64).pixels
             
-            # Save images to temporary files for DeepFace
-            with tempfile.NamedTemporaryFile(suffix='.jpg', delete=False) as ref_file:
-                cv2.imwrite(ref_file.name, reference_img)
-                ref_path = ref_file.name
+            # DeepFace accepts BGR numpy arrays directly, so the decoded
+            # pixels go straight to the detector without a JPEG round trip
+            result = DeepFace.verify(
+                img1_path=reference_img,
+                img2_path=live_img,
+                model_name=self.model_name,
+                detector_backend=self.detector_backend,
+                distance_metric=self.distance_metric
+            )
             
-            with tempfile.NamedTemporaryFile(suffix='.jpg', delete=False) as live_file:
-                cv2.imwrite(live_file.name, live_img)
-                live_path = live_file.name
-            
-            try:
-                # Use DeepFace to verify faces
-                result = DeepFace.verify(
-                    img1_path=ref_path,
-                    img2_path=live_path,
-                    model_name=self.model_name,
-                    detector_backend=self.detector_backend,
-                    distance_metric=self.distance_metric
-                )
-                
-                # Extract results
-                is_verified = result['verified']
-                distance = result['distance']
-                threshold = result['threshold']
-                
-                # Calculate similarity percentage (inverse of distance)
-                # Cosine distance: 0 = identical, 1 = completely different
-                # Convert to similarity percentage: (1 - distance) * 100
-                similarity_percentage = max(0, (1 - distance) * 100)
-                
-                # Determine match status based on verification and similarity
-                if is_verified and similarity_percentage >= 60:
-                    match_status = "MATCH"
-                    confidence_level = "HIGH"
-                    color = "green"
-                elif similarity_percentage >= 40:
-                    match_status = "POSSIBLE_MATCH"
-                    confidence_level = "MEDIUM"
-                    color = "orange"
-                else:
-                    match_status = "NO_MATCH"
-                    confidence_level = "LOW"
-                    color = "red"
-                
-                return {
-                    "success": True,
-                    "match_status": match_status,
-                    "is_verified": is_verified,
-                    "similarity_percentage": round(similarity_percentage, 2),
-                    "distance": round(distance, 4),
-                    "threshold": round(threshold, 4),
-                    "confidence_level": confidence_level,
-                    "color": color,
-                    "model_used": self.model_name,
-                    "detector_used": self.detector_backend,
-                    "message": f"Face {match_status.lower().replace('_', ' ')} with {similarity_percentage:.1f}% similarity"
-                }
-                
-            finally:
-                # Clean up temporary files
-                try:
-                    os.unlink(ref_path)
-                    os.unlink(live_path)
-                except:
-                    pass
+            return self.build_match_result(
+                result['verified'], result['distance'], result['threshold']
+            )
                     
         except Exception as e:
             return {
@@ -129,53 +122,190 @@ class DeepFaceRecognition:
                 "message": f"Error during face verification: {str(e)}"
             }
     
-    def extract_face_embedding(self, image_base64: str) -> Dict[str, Any]:
+    def detect_faces(self, img: np.ndarray) -> List[Any]:
+        """
+        Detect and align every face in an image at the model's input size
+        
+        Detection runs on the downscaled image from as_decoded_image, and each
+        aligned face is cropped and resized straight to the model resolution.
+        
+        Returns:
+            List of (face pixels, region, detector confidence), raises ValueError if none
+        """
+        return functions.extract_faces(
+            img=img,
+            target_size=functions.find_target_size(model_name=self.model_name),
+            detector_backend=self.detector_backend,
+            grayscale=False,
+            enforce_detection=True,
+            align=True
+        )
+    
+    def predict_embeddings(self, faces: List[np.ndarray]) -> np.ndarray:
+        """Run ArcFace once over a batch of aligned faces"""
+        model = DeepFace.build_model(self.model_name)
+        return model.predict(np.stack(faces), verbose=0)
+    
+    def extract_face_embedding(self, image_base64: ImageLike) -> Dict[str, Any]:
         """
         Extract face embedding from a single image
         
         Args:
-            image_base64: Base64 encoded image
+            image_base64: Base64 encoded, raw or decoded image
             
         Returns:
             Dict containing embedding and face detection info
         """
-        try:
-            # Convert base64 to image
-            img = self.base64_to_image(image_base64)
-            
-            # Save to temporary file
-            with tempfile.NamedTemporaryFile(suffix='.jpg', delete=False) as temp_file:
-                cv2.imwrite(temp_file.name, img)
-                temp_path = temp_file.name
+        return self.embed_images([image_base64])[0]
+    
+    def embed_images(self, images_base64: List[ImageLike]) -> List[Dict[str, Any]]:
+        """
+        Extract face embeddings from several images with one batched model call
+        
+        Detection still runs per image, but all detected faces go through
+        ArcFace in a single forward pass. This is the same pipeline as
+        DeepFace.represent, which only handles one image at a time.
+        
+        Args:
+            images_base64: Base64 encoded, raw or decoded images
             
+        Returns:
+            One dict per image, in order, as returned by extract_face_embedding
+        """
+        results: List[Optional[Dict[str, Any]]] = [None] * len(images_base64)
+        faces = []
+        regions = []
+        face_indexes = []
+        
+        for index, image_base64 in enumerate(images_base64):
             try:
-                # Extract embedding using DeepFace
-                embedding = DeepFace.represent(
-                    img_path=temp_path,
-                    model_name=self.model_name,
-                    detector_backend=self.detector_backend
-                )
-                
-                return {
-                    "success": True,
-                    "embedding": embedding[0]["embedding"],
-                    "face_region": embedding[0].get("region", {}),
-                    "model_used": self.model_name
+                face_objs = self.detect_faces(as_decoded_image(image_base64).pixels)
+                # Like DeepFace.represent callers, use the first detected face
+                face_pixels, region, _ = face_objs[0]
+                faces.append(face_pixels[0])
+                regions.append(region)
+                face_indexes.append(index)
+            except Exception as e:
+                results[index] = {
+                    "success": False,
+                    "error": str(e),
+                    "message": f"Error extracting face embedding: {str(e)}"
                 }
-                
-            finally:
-                # Clean up temporary file
-                try:
-                    os.unlink(temp_path)
-                except:
-                    pass
-                    
+        
+        if faces:
+            try:
+                embeddings = self.predict_embeddings(faces)
+                for index, region, embedding in zip(face_indexes, regions, embeddings):
+                    results[index] = {
+                        "success": True,
+                        "embedding": embedding.tolist(),
+                        "face_region": region,
+                        "model_used": self.model_name
+                    }
+            except Exception as e:
+                for index in face_indexes:
+                    results[index] = {
+                        "success": False,
+                        "error": str(e),
+                        "message": f"Error extracting face embedding: {str(e)}"
+                    }
+        
+        return results
+    
+    def embed_all_faces(self, image_base64: ImageLike) -> Dict[str, Any]:
+        """
+        Detect every face in one image, e.g. a classroom photo, and embed them in one batch
+        
+        Args:
+            image_base64: Base64 encoded, raw or decoded image
+            
+        Returns:
+            Dict containing one embedding and region per detected face
+        """
+        try:
+            # Faces in a group photo are small, so keep more pixels than for a selfie
+            face_objs = self.detect_faces(as_decoded_image(image_base64, max_side=GROUP_PHOTO_MAX_SIDE).pixels)
+            embeddings = self.predict_embeddings([face_pixels[0] for face_pixels, _, _ in face_objs])
+            
+            return {
+                "success": True,
+                "faces": [
+                    {
+                        "embedding": embedding.tolist(),
+                        "face_region": region,
+                        "detector_confidence": float(confidence)
+                    }
+                    for (_, region, confidence), embedding in zip(face_objs, embeddings)
+                ],
+                "model_used": self.model_name
+            }
+            
+        except Exception as e:
+            return {
+                "success": False,
+                "error": str(e),
+                "faces": [],
+                "message": f"Error detecting faces: {str(e)}"
+            }
+    
+    def compare_embeddings(self, reference_embedding, live_embedding) -> Dict[str, Any]:
+        """Compare two embeddings with the DeepFace cosine distance and threshold"""
+        distance = float(dst.findCosineDistance(
+            np.asarray(reference_embedding, dtype=np.float64),
+            np.asarray(live_embedding, dtype=np.float64)
+        ))
+        threshold = dst.findThreshold(self.model_name, self.distance_metric)
+        return self.build_match_result(distance <= threshold, distance, threshold)
+
+    def similarity_threshold(self) -> float:
+        """Lowest cosine similarity that DeepFace counts as the same person"""
+        return 1 - dst.findThreshold(self.model_name, self.distance_metric)
+
+    def similarity_result(self, similarity: float) -> Dict[str, Any]:
+        """Build the match result for a cosine similarity computed elsewhere, e.g. a roster search"""
+        distance = 1 - similarity
+        threshold = dst.findThreshold(self.model_name, self.distance_metric)
+        return self.build_match_result(distance <= threshold, distance, threshold)
+
+    def verify_against_embedding(self, reference_embedding, live_image_base64: ImageLike) -> Dict[str, Any]:
+        """
+        Compare a live image against a stored reference embedding
+        
+        Only the live image goes through detection and ArcFace, the reference
+        side is the vector saved at enrollment time.
+        
+        Args:
+            reference_embedding: Enrolled embedding for the student
+            live_image_base64: Base64 encoded, raw or decoded live captured image
+            
+        Returns:
+            Dict containing match result, confidence, and details
+        """
+        try:
+            live = self.extract_face_embedding(live_image_base64)
+            if not live["success"]:
+                return self.embedding_error_result(live)
+            
+            return self.compare_embeddings(reference_embedding, live["embedding"])
+            
         except Exception as e:
             return {
                 "success": False,
                 "error": str(e),
-                "message": f"Error extracting face embedding: {str(e)}"
+                "match_status": "ERROR",
+                "similarity_percentage": 0,
+                "message": f"Error during face verification: {str(e)}"
             }
+    
+    def embedding_error_result(self, embedding_result: Dict[str, Any]) -> Dict[str, Any]:
+        """Turn a failed embedding result into a failed verification result"""
+        return {
+            "success": False,
+            "error": embedding_result.get("error"),
+            "match_status": "ERROR",
+            "similarity_percentage": 0,
+            "message": embedding_result.get("message", "Error extracting face embedding")
+        }
 
 # Create a global instance
 deepface_recognizer = DeepFaceRecognition()
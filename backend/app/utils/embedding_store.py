@@ -0,0 +1,75 @@
+from datetime import datetime
+from typing import Optional
+import numpy as np
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from ..models.face_embedding import FaceEmbedding
+
+class EmbeddingStore:
+    """Persists enrolled reference embeddings so each student's photo is embedded once"""
+
+    def to_bytes(self, embedding) -> bytes:
+        return np.asarray(embedding, dtype=np.float32).tobytes()
+
+    def from_bytes(self, data: bytes) -> np.ndarray:
+        return np.frombuffer(data, dtype=np.float32)
+
+    def save(
+        self,
+        db: Session,
+        student_id: int,
+        embedding,
+        model_name: str,
+        detector_backend: str
+    ) -> FaceEmbedding:
+        """Insert or replace the reference embedding for a student and model"""
+        vector = np.asarray(embedding, dtype=np.float32)
+        for attempt in range(2):
+            record = db.query(FaceEmbedding).filter(
+                FaceEmbedding.student_id == student_id,
+                FaceEmbedding.model_name == model_name,
+                FaceEmbedding.detector_backend == detector_backend
+            ).first()
+
+            if record is None:
+                record = FaceEmbedding(
+                    student_id=student_id,
+                    model_name=model_name,
+                    detector_backend=detector_backend
+                )
+                db.add(record)
+
+            record.dimension = int(vector.shape[0])
+            record.embedding = self.to_bytes(vector)
+            record.updated_at = datetime.utcnow()
+            try:
+                db.commit()
+                break
+            except IntegrityError:
+                db.rollback()
+                # A concurrent enrollment inserted the row first, update it on the second attempt
+                if attempt:
+                    raise
+        db.refresh(record)
+        return record
+
+    def get(
+        self,
+        db: Session,
+        student_id: int,
+        model_name: str,
+        detector_backend: str
+    ) -> Optional[np.ndarray]:
+        """Return the stored reference embedding, or None if the student is not enrolled"""
+        record = db.query(FaceEmbedding.embedding).filter(
+            FaceEmbedding.student_id == student_id,
+            FaceEmbedding.model_name == model_name,
+            FaceEmbedding.detector_backend == detector_backend
+        ).first()
+        if record is None:
+            return None
+        return self.from_bytes(record.embedding)
+
+# Create a global instance
+embedding_store = EmbeddingStore()
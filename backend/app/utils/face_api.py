@@ -2,44 +2,90 @@ import asyncio
 import aiohttp
 from typing import Tuple, Optional
 import os
-from base64 import b64encode
-import json
+
+from .result_cache import ResultCache
 
 class FaceAPI:
+    """
+    Azure Face API client
+
+    All calls share one pooled aiohttp session with keep-alive, created on
+    first use and closed with close(). Face IDs returned by detect are cached
+    by image hash for as long as Azure keeps them valid, so a reference image
+    that was already detected skips the detect call.
+    """
+
     def __init__(self):
         # You would typically get these from environment variables
-        self.endpoint = os.getenv('AZURE_FACE_ENDPOINT', 'https://your-face-api-endpoint.cognitiveservices.azure.com/')
+        self.endpoint = os.getenv('AZURE_FACE_ENDPOINT', 'https://your-face-api-endpoint.cognitiveservices.azure.com/').rstrip('/')
         self.key = os.getenv('AZURE_FACE_KEY', 'your-face-api-key')
-        
+
         # API endpoints
         self.detect_url = f"{self.endpoint}/face/v1.0/detect"
         self.verify_url = f"{self.endpoint}/face/v1.0/verify"
-        
-        self.headers = {
-            'Content-Type': 'application/octet-stream',
-            'Ocp-Apim-Subscription-Key': self.key
-        }
+
+        # Connection pool settings
+        self.max_connections = int(os.getenv('AZURE_FACE_MAX_CONNECTIONS', '20'))
+        self.max_connections_per_host = int(os.getenv('AZURE_FACE_MAX_CONNECTIONS_PER_HOST', '10'))
+        self.keepalive_seconds = float(os.getenv('AZURE_FACE_KEEPALIVE_SECONDS', '30'))
+        self.timeout = aiohttp.ClientTimeout(total=float(os.getenv('AZURE_FACE_TIMEOUT_SECONDS', '10')))
+        self._session: Optional[aiohttp.ClientSession] = None
+
+        # Azure keeps a face ID for faceIdTimeToLive seconds (at most 24h). Cache it a
+        # minute less so a cached ID never expires between lookup and verify.
+        self.face_id_ttl_seconds = int(os.getenv('AZURE_FACE_ID_TTL_SECONDS', '86400'))
+        self.face_id_cache = ResultCache(
+            max_entries=int(os.getenv('AZURE_FACE_ID_CACHE_MAX_ENTRIES', '4096')),
+            ttl_seconds=max(0, self.face_id_ttl_seconds - 60)
+        )
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self.max_connections,
+                limit_per_host=self.max_connections_per_host,
+                keepalive_timeout=self.keepalive_seconds
+            )
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=self.timeout,
+                headers={'Ocp-Apim-Subscription-Key': self.key}
+            )
+        return self._session
+
+    async def close(self) -> None:
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
 
     async def detect_face(self, image_data: bytes) -> Tuple[bool, Optional[str]]:
         """
         Detect face in image and return face ID
         """
+        cache_key = self.face_id_cache.make_key("azure-face-id", self.endpoint, image_data)
+        cached = self.face_id_cache.get(cache_key)
+        if cached is not None:
+            return True, cached["face_id"]
+
         try:
-            async with aiohttp.ClientSession() as session:
-                async with session.post(
-                    self.detect_url,
-                    headers=self.headers,
-                    data=image_data
-                ) as response:
-                    if response.status != 200:
-                        return False, None
-                    
-                    result = await response.json()
-                    if not result:
-                        return False, None
-                    
-                    return True, result[0].get('faceId')
-                    
+            async with self._get_session().post(
+                self.detect_url,
+                headers={'Content-Type': 'application/octet-stream'},
+                params={'returnFaceId': 'true', 'faceIdTimeToLive': str(self.face_id_ttl_seconds)},
+                data=image_data
+            ) as response:
+                if response.status != 200:
+                    return False, None
+
+                result = await response.json()
+                if not result:
+                    return False, None
+
+                face_id = result[0].get('faceId')
+                if face_id:
+                    self.face_id_cache.set(cache_key, {"face_id": face_id})
+                return True, face_id
+
         except Exception as e:
             print(f"Error detecting face: {str(e)}")
             return False, None
@@ -53,25 +99,17 @@ class FaceAPI:
                 "faceId1": face_id1,
                 "faceId2": face_id2
             }
-            
-            async with aiohttp.ClientSession() as session:
-                async with session.post(
-                    self.verify_url,
-                    headers={
-                        'Content-Type': 'application/json',
-                        'Ocp-Apim-Subscription-Key': self.key
-                    },
-                    json=data
-                ) as response:
-                    if response.status != 200:
-                        return False, 0.0
-                    
-                    result = await response.json()
-                    is_identical = result.get('isIdentical', False)
-                    confidence = result.get('confidence', 0.0)
-                    
-                    return is_identical, confidence
-                    
+
+            async with self._get_session().post(self.verify_url, json=data) as response:
+                if response.status != 200:
+                    return False, 0.0
+
+                result = await response.json()
+                is_identical = result.get('isIdentical', False)
+                confidence = result.get('confidence', 0.0)
+
+                return is_identical, confidence
+
         except Exception as e:
             print(f"Error verifying faces: {str(e)}")
             return False, 0.0
@@ -80,8 +118,11 @@ class FaceAPI:
         """
         Compare two face images and return result with confidence
         """
-        # Detect faces in both images
-        success1, face_id1 = await self.detect_face(image1_data)
+        # Detect faces in both images at the same time
+        (success1, face_id1), (success2, face_id2) = await asyncio.gather(
+            self.detect_face(image1_data),
+            self.detect_face(image2_data)
+        )
         if not success1:
             return {
                 "success": False,
@@ -89,7 +130,6 @@ class FaceAPI:
                 "confidence": 0.0
             }
 
-        success2, face_id2 = await self.detect_face(image2_data)
         if not success2:
             return {
                 "success": False,
@@ -99,9 +139,12 @@ class FaceAPI:
 
         # Compare the faces
         is_match, confidence = await self.verify_faces(face_id1, face_id2)
-        
+
         return {
             "success": is_match,
             "message": "Face matched" if is_match else "Faces do not match",
             "confidence": confidence
         }
+
+# Create a global instance
+face_api = FaceAPI()
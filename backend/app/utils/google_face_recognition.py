@@ -1,139 +1,168 @@
 import os
+import re
 import base64
-import tempfile
-from typing import Dict, Any
-import google.generativeai as genai
-from PIL import Image
-import io
+import asyncio
+from typing import Dict, Any, Optional
+import aiohttp
+from .image_preprocessing import ImageLike, as_decoded_image
+from .resilience import CircuitBreaker, TokenBucket
+from .result_cache import ResultCache
+
+# Create a prompt for face comparison
+PROMPT = """
+            Please analyze these two images and determine if they show the same person.
+            
+            Image 1: Reference photo
+            Image 2: Live captured photo
+            
+            Please provide:
+            1. Are these the same person? (YES/NO/UNCERTAIN)
+            2. Confidence level (0-100%)
+            3. Brief explanation of your analysis
+            
+            Focus on facial features, structure, and characteristics.
+            """
+
+class GeminiUnavailable(RuntimeError):
+    """Gemini was not called: no API key is configured, or its circuit is open"""
 
 class GoogleFaceRecognition:
+    """
+    Face comparison through the Gemini REST API
+
+    Calls are async and share one HTTP session. At most GEMINI_MAX_CONCURRENCY
+    requests are in flight, and a token bucket keeps them under
+    GEMINI_REQUESTS_PER_MINUTE. Images are sent as small JPEGs, parsed
+    verdicts are cached per image pair, and a circuit breaker stops calling
+    the API after repeated errors.
+    """
+
     def __init__(self):
         self.api_key = os.getenv('GOOGLE_API_KEY')
-        if self.api_key:
-            genai.configure(api_key=self.api_key)
-            self.model = genai.GenerativeModel('gemini-1.5-flash')
-        else:
-            self.model = None
+        # Point at a local stub server in tests
+        self.api_base = os.getenv('GEMINI_API_BASE', 'https://generativelanguage.googleapis.com').rstrip('/')
+        self.model_name = os.getenv('GEMINI_MODEL', 'gemini-1.5-flash')
+        self.image_max_side = int(os.getenv('GEMINI_IMAGE_MAX_SIDE', '512'))
+        self.timeout = aiohttp.ClientTimeout(total=float(os.getenv('GEMINI_TIMEOUT_SECONDS', '10')))
+        self.concurrency = asyncio.Semaphore(int(os.getenv('GEMINI_MAX_CONCURRENCY', '4')))
+        requests_per_minute = float(os.getenv('GEMINI_REQUESTS_PER_MINUTE', '60'))
+        self.rate_limiter = TokenBucket(
+            rate=requests_per_minute / 60,
+            capacity=float(os.getenv('GEMINI_BURST', '5'))
+        )
+        self.breaker = CircuitBreaker(
+            'gemini',
+            failure_threshold=int(os.getenv('GEMINI_BREAKER_FAILURES', '5')),
+            reset_seconds=float(os.getenv('GEMINI_BREAKER_RESET_SECONDS', '60'))
+        )
+        self.verdict_cache = ResultCache(
+            max_entries=int(os.getenv('GEMINI_CACHE_MAX_ENTRIES', '1024')),
+            ttl_seconds=float(os.getenv('GEMINI_CACHE_TTL_SECONDS', '3600'))
+        )
+        self._session: Optional[aiohttp.ClientSession] = None
+        # Metrics
+        self.api_calls = 0
+    
+    def _get_session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(timeout=self.timeout)
+        return self._session
+    
+    async def close(self) -> None:
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
     
-    def base64_to_image(self, base64_string: str) -> Image.Image:
-        """Convert base64 string to PIL Image"""
+    async def generate_content(self, reference_jpeg: bytes, live_jpeg: bytes) -> str:
+        """Send the prompt and both images to Gemini and return the response text"""
+        payload = {
+            "contents": [{
+                "parts": [
+                    {"text": PROMPT},
+                    {"inline_data": {"mime_type": "image/jpeg", "data": base64.b64encode(reference_jpeg).decode('ascii')}},
+                    {"inline_data": {"mime_type": "image/jpeg", "data": base64.b64encode(live_jpeg).decode('ascii')}}
+                ]
+            }]
+        }
+        async with self.concurrency:
+            await self.rate_limiter.acquire()
+            self.api_calls += 1
+            async with self._get_session().post(
+                f"{self.api_base}/v1beta/models/{self.model_name}:generateContent",
+                headers={'x-goog-api-key': self.api_key},
+                json=payload
+            ) as response:
+                if response.status != 200:
+                    raise RuntimeError(f"Gemini API returned {response.status}: {(await response.text())[:200]}")
+                data = await response.json()
+        return data["candidates"][0]["content"]["parts"][0]["text"]
+    
+    def _jpeg(self, image: ImageLike) -> bytes:
+        return as_decoded_image(image).encode_jpeg(self.image_max_side)
+    
+    async def compare_faces(self, reference_image: ImageLike, live_image: ImageLike) -> Dict[str, Any]:
+        """
+        Like verify_faces, but raises instead of returning an error result
+        
+        Used by the recognizer cascade, whose circuit breaker has to see a
+        missing key, an open circuit or an API error as a failure.
+        
+        Raises:
+            GeminiUnavailable: no API key, or the circuit is open
+            Exception: whatever the API call raised
+        """
+        if not self.api_key:
+            raise GeminiUnavailable("Google API key not found. Please set GOOGLE_API_KEY environment variable.")
+        
+        # Gemini does not need full resolution to compare faces, send small JPEGs
+        reference_jpeg, live_jpeg = await asyncio.gather(
+            asyncio.to_thread(self._jpeg, reference_image),
+            asyncio.to_thread(self._jpeg, live_image)
+        )
+        
+        cache_key = self.verdict_cache.make_key("gemini", self.model_name, PROMPT, reference_jpeg, live_jpeg)
+        cached = await self.verdict_cache.aget(cache_key)
+        if cached is not None:
+            return cached
+        
+        if not self.breaker.allow():
+            raise GeminiUnavailable("Google AI is temporarily disabled after repeated errors.")
+        
         try:
-            # Remove data URL prefix if present
-            if base64_string.startswith('data:image'):
-                base64_string = base64_string.split(',')[1]
-            
-            # Decode base64
-            image_data = base64.b64decode(base64_string)
-            
-            # Convert to PIL Image
-            pil_image = Image.open(io.BytesIO(image_data))
-            
-            # Convert to RGB if necessary
-            if pil_image.mode != 'RGB':
-                pil_image = pil_image.convert('RGB')
-            
-            return pil_image
-        except Exception as e:
-            raise ValueError(f"Error converting base64 to image: {str(e)}")
+            response_text = await self.generate_content(reference_jpeg, live_jpeg)
+        except asyncio.CancelledError:
+            self.breaker.release()
+            raise
+        except Exception:
+            self.breaker.record_failure()
+            raise
+        self.breaker.record_success()
+        
+        result = self.parse_verdict(response_text)
+        await self.verdict_cache.aset(cache_key, result)
+        return result
     
-    def verify_faces(self, reference_image_base64: str, live_image_base64: str) -> Dict[str, Any]:
+    async def verify_faces(self, reference_image_base64: ImageLike, live_image_base64: ImageLike) -> Dict[str, Any]:
         """
         Compare two faces using Google Generative AI
         
         Args:
-            reference_image_base64: Base64 encoded reference image
-            live_image_base64: Base64 encoded live captured image
+            reference_image_base64: Base64 encoded, raw or decoded reference image
+            live_image_base64: Base64 encoded, raw or decoded live captured image
             
         Returns:
             Dict containing match result, confidence, and details
         """
         try:
-            if not self.model:
-                return {
-                    "success": False,
-                    "error": "Google API key not configured",
-                    "match_status": "ERROR",
-                    "similarity_percentage": 0,
-                    "message": "Google API key not found. Please set GOOGLE_API_KEY environment variable."
-                }
-            
-            # Convert base64 strings to images
-            reference_img = self.base64_to_image(reference_image_base64)
-            live_img = self.base64_to_image(live_image_base64)
-            
-            # Create a prompt for face comparison
-            prompt = """
-            Please analyze these two images and determine if they show the same person.
-            
-            Image 1: Reference photo
-            Image 2: Live captured photo
-            
-            Please provide:
-            1. Are these the same person? (YES/NO/UNCERTAIN)
-            2. Confidence level (0-100%)
-            3. Brief explanation of your analysis
-            
-            Focus on facial features, structure, and characteristics.
-            """
-            
-            # Prepare images for the model
-            images = [reference_img, live_img]
-            
-            # Generate response
-            response = self.model.generate_content([prompt] + images)
-            
-            # Parse the response
-            response_text = response.text.lower()
-            
-            # Extract match status
-            if 'yes' in response_text and 'same person' in response_text:
-                match_status = "MATCH"
-                is_verified = True
-            elif 'no' in response_text and 'same person' in response_text:
-                match_status = "NO_MATCH"
-                is_verified = False
-            else:
-                match_status = "POSSIBLE_MATCH"
-                is_verified = False
-            
-            # Extract confidence percentage
-            import re
-            confidence_match = re.search(r'(\d+)%', response_text)
-            if confidence_match:
-                similarity_percentage = float(confidence_match.group(1))
-            else:
-                # Default confidence based on match status
-                if match_status == "MATCH":
-                    similarity_percentage = 85.0
-                elif match_status == "NO_MATCH":
-                    similarity_percentage = 15.0
-                else:
-                    similarity_percentage = 50.0
-            
-            # Determine color and confidence level
-            if match_status == "MATCH" and similarity_percentage >= 70:
-                color = "green"
-                confidence_level = "HIGH"
-            elif match_status == "POSSIBLE_MATCH" or (match_status == "MATCH" and similarity_percentage < 70):
-                color = "orange"
-                confidence_level = "MEDIUM"
-            else:
-                color = "red"
-                confidence_level = "LOW"
-            
+            return await self.compare_faces(reference_image_base64, live_image_base64)
+        except GeminiUnavailable as e:
             return {
-                "success": True,
-                "match_status": match_status,
-                "is_verified": is_verified,
-                "similarity_percentage": round(similarity_percentage, 2),
-                "confidence_level": confidence_level,
-                "color": color,
-                "model_used": "Google Gemini 1.5 Flash",
-                "detector_used": "Google Vision AI",
-                "message": f"Face {match_status.lower().replace('_', ' ')} with {similarity_percentage:.1f}% confidence (Google AI)",
-                "raw_response": response_text
+                "success": False,
+                "error": str(e),
+                "match_status": "ERROR",
+                "similarity_percentage": 0,
+                "message": str(e)
             }
-            
         except Exception as e:
             return {
                 "success": False,
@@ -142,6 +171,67 @@ class GoogleFaceRecognition:
                 "similarity_percentage": 0,
                 "message": f"Error during Google AI face verification: {str(e)}"
             }
+    
+    def parse_verdict(self, response_text: str) -> Dict[str, Any]:
+        """Turn Gemini's free-text answer into the API match result"""
+        # Parse the response
+        response_text = response_text.lower()
+        
+        # Extract match status
+        if 'yes' in response_text and 'same person' in response_text:
+            match_status = "MATCH"
+            is_verified = True
+        elif 'no' in response_text and 'same person' in response_text:
+            match_status = "NO_MATCH"
+            is_verified = False
+        else:
+            match_status = "POSSIBLE_MATCH"
+            is_verified = False
+        
+        # Extract confidence percentage
+        confidence_match = re.search(r'(\d+)%', response_text)
+        if confidence_match:
+            similarity_percentage = float(confidence_match.group(1))
+        else:
+            # Default confidence based on match status
+            if match_status == "MATCH":
+                similarity_percentage = 85.0
+            elif match_status == "NO_MATCH":
+                similarity_percentage = 15.0
+            else:
+                similarity_percentage = 50.0
+        
+        # Determine color and confidence level
+        if match_status == "MATCH" and similarity_percentage >= 70:
+            color = "green"
+            confidence_level = "HIGH"
+        elif match_status == "POSSIBLE_MATCH" or (match_status == "MATCH" and similarity_percentage < 70):
+            color = "orange"
+            confidence_level = "MEDIUM"
+        else:
+            color = "red"
+            confidence_level = "LOW"
+        
+        return {
+            "success": True,
+            "match_status": match_status,
+            "is_verified": is_verified,
+            "similarity_percentage": round(similarity_percentage, 2),
+            "confidence_level": confidence_level,
+            "color": color,
+            "model_used": "Google Gemini 1.5 Flash",
+            "detector_used": "Google Vision AI",
+            "message": f"Face {match_status.lower().replace('_', ' ')} with {similarity_percentage:.1f}% confidence (Google AI)",
+            "raw_response": response_text
+        }
+
+    def metrics(self) -> Dict[str, Any]:
+        return {
+            "api_calls": self.api_calls,
+            "rate_limit_wait_seconds": round(self.rate_limiter.total_wait_seconds, 3),
+            "breaker": self.breaker.metrics(),
+            "verdict_cache": self.verdict_cache.metrics()
+        }
 
 # Create a global instance
 google_face_recognizer = GoogleFaceRecognition()
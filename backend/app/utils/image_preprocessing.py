@@ -0,0 +1,114 @@
+import os
+import io
+import base64
+from typing import Optional, Union
+import cv2
+import numpy as np
+from PIL import Image, ImageOps
+
+# Images reach the recognizers either as base64 strings (form fields, optionally
+# with a data URL prefix) or as raw encoded bytes from a binary upload.
+ImageInput = Union[str, bytes, bytearray, memoryview]
+
+# Longest side, in pixels, that images are scaled down to before face detection.
+# A face selfie needs far less than a 12 MP phone photo; classroom photos keep
+# more pixels because each face only covers a small part of the frame.
+MAX_IMAGE_SIDE = int(os.getenv("FACE_MAX_IMAGE_SIDE", "1280"))
+GROUP_PHOTO_MAX_SIDE = int(os.getenv("GROUP_PHOTO_MAX_SIDE", "2560"))
+
+def image_bytes(image: ImageInput) -> Union[bytes, bytearray, memoryview]:
+    """Return the encoded image bytes, decoding base64 only when given a string"""
+    if isinstance(image, str):
+        # Remove data URL prefix if present
+        if image.startswith('data:image'):
+            image = image.split(',')[1]
+        return base64.b64decode(image)
+    return image
+
+def decode_pil_image(image: ImageInput, max_side: Optional[int] = MAX_IMAGE_SIDE) -> Image.Image:
+    """
+    Decode an image to an upright RGB PIL image no larger than max_side
+
+    JPEGs are decoded in draft mode, which lets libjpeg scale by 1/2, 1/4 or
+    1/8 while decoding, so a large photo is never fully decompressed. The
+    EXIF orientation is applied so phone photos are upright for the detector.
+    Pass max_side=None to keep the full resolution.
+    """
+    try:
+        pil_image = Image.open(io.BytesIO(image_bytes(image)))
+        if max_side:
+            pil_image.draft('RGB', (max_side, max_side))
+        pil_image = ImageOps.exif_transpose(pil_image)
+
+        # Convert to RGB if necessary
+        if pil_image.mode != 'RGB':
+            pil_image = pil_image.convert('RGB')
+
+        if max_side and max(pil_image.size) > max_side:
+            pil_image.thumbnail((max_side, max_side), Image.BILINEAR)
+        return pil_image
+    except Exception as e:
+        raise ValueError(f"Error decoding image: {str(e)}")
+
+def decode_image(image: ImageInput, max_side: Optional[int] = MAX_IMAGE_SIDE) -> np.ndarray:
+    """Decode an image to an OpenCV BGR array, see decode_pil_image"""
+    return cv2.cvtColor(np.asarray(decode_pil_image(image, max_side)), cv2.COLOR_RGB2BGR)
+
+class DecodedImage:
+    """
+    An image decoded once per request and shared by every recognizer
+
+    Holds the BGR pixel array. The grayscale and thumbnail views are derived
+    on first use and cached. Pickling (e.g. to an inference worker) keeps
+    only the pixels, the views are rebuilt on the other side if needed.
+    """
+
+    def __init__(self, pixels: np.ndarray):
+        self.pixels = pixels
+        self._gray = None
+        self._thumbnails = {}
+
+    @classmethod
+    def from_input(cls, image: ImageInput, max_side: Optional[int] = MAX_IMAGE_SIDE) -> "DecodedImage":
+        return cls(decode_image(image, max_side))
+
+    @property
+    def gray(self) -> np.ndarray:
+        if self._gray is None:
+            self._gray = cv2.cvtColor(self.pixels, cv2.COLOR_BGR2GRAY)
+        return self._gray
+
+    def thumbnail(self, width: int = 100, height: int = 100) -> np.ndarray:
+        """Grayscale thumbnail, cached per size"""
+        size = (width, height)
+        if size not in self._thumbnails:
+            self._thumbnails[size] = cv2.resize(self.gray, size)
+        return self._thumbnails[size]
+
+    def encode_jpeg(self, max_side: Optional[int] = None, quality: int = 85) -> bytes:
+        """JPEG bytes of the image, scaled down to max_side first if given"""
+        pixels = self.pixels
+        height, width = pixels.shape[:2]
+        if max_side and max(height, width) > max_side:
+            scale = max_side / max(height, width)
+            size = (max(1, round(width * scale)), max(1, round(height * scale)))
+            pixels = cv2.resize(pixels, size, interpolation=cv2.INTER_AREA)
+        ok, encoded = cv2.imencode('.jpg', pixels, [cv2.IMWRITE_JPEG_QUALITY, quality])
+        if not ok:
+            raise ValueError("Error encoding image")
+        return encoded.tobytes()
+
+    def __getstate__(self):
+        return {"pixels": self.pixels}
+
+    def __setstate__(self, state):
+        self.__init__(state["pixels"])
+
+# Anything the recognizers accept: encoded input or an already decoded image
+ImageLike = Union[ImageInput, DecodedImage]
+
+def as_decoded_image(image: ImageLike, max_side: Optional[int] = MAX_IMAGE_SIDE) -> DecodedImage:
+    """Decode encoded input, pass an already decoded image through unchanged"""
+    if isinstance(image, DecodedImage):
+        return image
+    return DecodedImage.from_input(image, max_side)
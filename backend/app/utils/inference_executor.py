@@ -0,0 +1,155 @@
+import os
+import asyncio
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Optional, Tuple
+
+# Nothing in this module may import TensorFlow at the top level: worker processes
+# import it to unpickle the initializer, and the thread caps below only take effect
+# if they are set before TensorFlow is loaded.
+
+# Set in each worker by _init_worker, see InferenceExecutor.warm_up
+_warm_up_barrier = None
+
+def _init_worker(tf_threads: int, warm_up_barrier) -> None:
+    """Cap TensorFlow threads and warm the models once per worker process"""
+    global _warm_up_barrier
+    _warm_up_barrier = warm_up_barrier
+    for var in ("TF_NUM_INTRAOP_THREADS", "OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS"):
+        os.environ[var] = str(tf_threads)
+    os.environ["TF_NUM_INTEROP_THREADS"] = "1"
+
+    import tensorflow as tf
+    tf.config.threading.set_intra_op_parallelism_threads(tf_threads)
+    tf.config.threading.set_inter_op_parallelism_threads(1)
+
+    from .deepface_recognition import deepface_recognizer
+    deepface_recognizer.warm_up()
+
+def _worker_status() -> Tuple[bool, Optional[str]]:
+    from .deepface_recognition import deepface_recognizer
+    return deepface_recognizer.is_ready, deepface_recognizer.warm_up_error
+
+def _warm_worker_status(timeout: float) -> Tuple[bool, Optional[str]]:
+    """
+    Status of this worker, once every worker of the pool has one of these calls
+
+    A worker only takes calls after its initializer has warmed the models, and
+    holds this one until all workers have reached the barrier, so no worker can
+    answer for another.
+    """
+    try:
+        _warm_up_barrier.wait(timeout)
+    except threading.BrokenBarrierError:
+        return False, f"Not every inference worker was warm after {timeout:.0f}s"
+    return _worker_status()
+
+def _call_recognizer(method_name: str, *args) -> Any:
+    from .deepface_recognition import deepface_recognizer
+    return getattr(deepface_recognizer, method_name)(*args)
+
+class InferenceExecutor:
+    """
+    Runs DeepFace calls in a pool of worker processes so they never block the event loop
+
+    Each worker loads its own copy of the models at start-up. Set INFERENCE_WORKERS=0
+    to run inference in a thread of the API process instead (useful for development).
+    """
+
+    def __init__(self):
+        cpu_count = os.cpu_count() or 1
+        self.max_workers = int(os.getenv("INFERENCE_WORKERS", str(cpu_count)))
+        # Split the cores between workers so TensorFlow does not oversubscribe them
+        default_threads = max(1, cpu_count // max(1, self.max_workers))
+        self.tf_threads = int(os.getenv("INFERENCE_TF_THREADS", str(default_threads)))
+        self.warm_up_timeout = float(os.getenv("INFERENCE_WARMUP_TIMEOUT_SECONDS", "600"))
+        self.is_ready = False
+        self.warm_up_error = None
+        self._pool = None
+        self._warms_up = False
+        self._warm_up_task = None
+
+    def start(self) -> None:
+        if self.max_workers > 0 and self._pool is None:
+            # spawn instead of fork: forking a process that has TensorFlow loaded is unsafe
+            context = multiprocessing.get_context("spawn")
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=context,
+                initializer=_init_worker,
+                initargs=(self.tf_threads, context.Barrier(self.max_workers))
+            )
+
+    def _replace_broken_pool(self, pool: ProcessPoolExecutor, warm_up: bool) -> None:
+        """Start a new pool after a worker died, e.g. killed by the OOM killer"""
+        if self._pool is not pool:
+            # A concurrent call already replaced it
+            return
+        print("Inference worker pool is broken, starting a new one")
+        pool.shutdown(wait=False, cancel_futures=True)
+        self._pool = None
+        self.is_ready = False
+        self.start()
+        if warm_up:
+            # /ready reports warming_up until the new workers are warm
+            self._warm_up_task = asyncio.get_running_loop().create_task(self.warm_up())
+
+    async def warm_up(self) -> bool:
+        """Start every worker and wait until each one has its models loaded"""
+        self._warms_up = True
+        self.start()
+        loop = asyncio.get_running_loop()
+        pool = self._pool
+        try:
+            if pool is None:
+                from .deepface_recognition import deepface_recognizer
+                await loop.run_in_executor(None, deepface_recognizer.warm_up)
+                statuses = [_worker_status()]
+            else:
+                # One concurrent task per worker, each held at a barrier until
+                # every worker has one, so each worker reports its own status
+                statuses = await asyncio.gather(*[
+                    loop.run_in_executor(pool, _warm_worker_status, self.warm_up_timeout)
+                    for _ in range(self.max_workers)
+                ])
+        except BrokenProcessPool as e:
+            self.warm_up_error = f"An inference worker died during warm-up: {e}"
+            print(f"Inference warm-up error: {self.warm_up_error}")
+            # Don't warm up again here, a worker that dies while loading the models would do so forever
+            self._replace_broken_pool(pool, warm_up=False)
+            return False
+        except Exception as e:
+            self.warm_up_error = str(e)
+            print(f"Inference warm-up error: {e}")
+            return False
+
+        errors = [error for ready, error in statuses if not ready]
+        self.is_ready = not errors
+        self.warm_up_error = errors[0] if errors else None
+        return self.is_ready
+
+    async def run(self, method_name: str, *args) -> Any:
+        """Await a DeepFaceRecognition method, e.g. run("verify_faces", ref, live)"""
+        self.start()
+        loop = asyncio.get_running_loop()
+        if self._pool is None:
+            from .deepface_recognition import deepface_recognizer
+            return await loop.run_in_executor(None, getattr(deepface_recognizer, method_name), *args)
+        pool = self._pool
+        try:
+            return await loop.run_in_executor(pool, _call_recognizer, method_name, *args)
+        except BrokenProcessPool:
+            # This call fails, but later ones get a working pool
+            self._replace_broken_pool(pool, warm_up=self._warms_up)
+            raise
+
+    def shutdown(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+        self.is_ready = False
+
+# Create a global instance
+inference_executor = InferenceExecutor()
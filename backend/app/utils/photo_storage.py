@@ -0,0 +1,312 @@
+import os
+import io
+import re
+import mmap
+import time
+import asyncio
+import sqlite3
+import hashlib
+import tempfile
+import threading
+from typing import Dict, Optional, Tuple
+from fastapi import UploadFile
+
+from .image_preprocessing import decode_pil_image
+
+DIGEST_PATTERN = re.compile(r"^[0-9a-f]{64}$")
+
+class UploadTooLarge(ValueError):
+    """Raised when an upload is bigger than the configured limit"""
+
+class PackArchive:
+    """
+    Append-only pack files for cold photo originals
+
+    Photos are appended to <directory>/pack-00001.pack until it reaches
+    max_pack_bytes, then a new pack is started. A small SQLite index maps each
+    photo's digest to (pack, offset, length), and packs are read through mmap,
+    so a read costs one index lookup and one slice.
+    """
+
+    def __init__(self, directory: str, max_pack_bytes: int):
+        self.directory = directory
+        self.max_pack_bytes = max_pack_bytes
+        self._index = None
+        self._maps: Dict[int, Tuple[mmap.mmap, int]] = {}  # pack -> (map, mapped length)
+        self._lock = threading.Lock()
+
+    def _index_connection(self) -> sqlite3.Connection:
+        if self._index is None:
+            os.makedirs(self.directory, exist_ok=True)
+            self._index = sqlite3.connect(os.path.join(self.directory, "index.db"), timeout=5, check_same_thread=False)
+            self._index.execute("PRAGMA journal_mode=WAL")
+            self._index.execute(
+                "CREATE TABLE IF NOT EXISTS photos ("
+                "digest TEXT PRIMARY KEY, extension TEXT, pack INTEGER, offset INTEGER, length INTEGER)"
+            )
+        return self._index
+
+    def pack_path(self, pack: int) -> str:
+        return os.path.join(self.directory, f"pack-{pack:05d}.pack")
+
+    def contains(self, digest: str) -> bool:
+        return self.extension(digest) is not None
+
+    def extension(self, digest: str) -> Optional[str]:
+        """Extension the photo was stored with, None if it is not in a pack"""
+        with self._lock:
+            row = self._index_connection().execute(
+                "SELECT extension FROM photos WHERE digest = ?", (digest,)
+            ).fetchone()
+            return row[0] if row else None
+
+    def read(self, digest: str) -> Optional[bytes]:
+        with self._lock:
+            row = self._index_connection().execute(
+                "SELECT pack, offset, length FROM photos WHERE digest = ?", (digest,)
+            ).fetchone()
+            if row is None:
+                return None
+            pack, offset, length = row
+            mapped = self._maps.get(pack)
+            if mapped is None or offset + length > mapped[1]:
+                # The newest pack keeps growing, remap it when a read goes past the old end
+                if mapped is not None:
+                    mapped[0].close()
+                with open(self.pack_path(pack), "rb") as f:
+                    size = os.fstat(f.fileno()).st_size
+                    mapped = (mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ), size)
+                self._maps[pack] = mapped
+            return mapped[0][offset:offset + length]
+
+    def append(self, photos) -> int:
+        """
+        Append (digest, extension, path) photos to the packs and index them
+
+        Returns:
+            Number of photos archived. The caller deletes the loose files.
+        """
+        with self._lock:
+            index = self._index_connection()
+            pack = index.execute("SELECT MAX(pack) FROM photos").fetchone()[0] or 1
+            count = 0
+            out = open(self.pack_path(pack), "ab")
+            try:
+                for digest, extension, path in photos:
+                    if index.execute("SELECT 1 FROM photos WHERE digest = ?", (digest,)).fetchone():
+                        count += 1
+                        continue
+                    with open(path, "rb") as f:
+                        data = f.read()
+                    if out.tell() > 0 and out.tell() + len(data) > self.max_pack_bytes:
+                        out.close()
+                        pack += 1
+                        out = open(self.pack_path(pack), "ab")
+                    offset = out.tell()
+                    out.write(data)
+                    # Data must be on disk before the index points at it
+                    out.flush()
+                    os.fsync(out.fileno())
+                    with index:
+                        index.execute(
+                            "INSERT INTO photos (digest, extension, pack, offset, length) VALUES (?, ?, ?, ?, ?)",
+                            (digest, extension, pack, offset, len(data))
+                        )
+                    count += 1
+            finally:
+                out.close()
+            return count
+
+class PhotoStorage:
+    """
+    Content-addressed storage for attendance photos
+
+    A photo is stored as <root>/ab/cd/<sha256>.<ext>, named by the hash of its
+    bytes, so identical uploads are stored once and two students can never
+    overwrite each other's photos. The two levels of shard directories keep
+    every directory small. Disk writes run in a worker thread.
+
+    A small WebP (or JPEG) preview is written next to it under
+    <root>/previews at ingest. archive() moves old originals into pack
+    files, and read() finds a photo in either place by its original path.
+    """
+
+    def __init__(
+        self,
+        root: str,
+        max_upload_bytes: int,
+        preview_max_side: int = 320,
+        preview_format: str = "webp",
+        max_pack_bytes: int = 1024 * 1024 * 1024,
+        chunk_size: int = 64 * 1024
+    ):
+        self.root = root
+        self.max_upload_bytes = max_upload_bytes
+        self.preview_max_side = preview_max_side
+        self.preview_format = preview_format
+        self.chunk_size = chunk_size
+        self.packs = PackArchive(os.path.join(root, "packs"), max_pack_bytes)
+
+    async def read_upload(self, upload: UploadFile) -> bytes:
+        """Read an upload in chunks, failing as soon as it passes the size limit"""
+        if upload.size is not None and upload.size > self.max_upload_bytes:
+            raise UploadTooLarge(f"{upload.filename} is larger than {self.max_upload_bytes} bytes")
+
+        chunks = []
+        total = 0
+        while True:
+            chunk = await upload.read(self.chunk_size)
+            if not chunk:
+                break
+            total += len(chunk)
+            if total > self.max_upload_bytes:
+                raise UploadTooLarge(f"{upload.filename} is larger than {self.max_upload_bytes} bytes")
+            chunks.append(chunk)
+        return b"".join(chunks)
+
+    def extension(self, data: bytes) -> str:
+        """File extension from the image signature, not the client-supplied name"""
+        if data.startswith(b"\xff\xd8\xff"):
+            return "jpg"
+        if data.startswith(b"\x89PNG\r\n\x1a\n"):
+            return "png"
+        if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+            return "webp"
+        return "bin"
+
+    def path_for(self, digest: str, extension: str) -> str:
+        return os.path.join(self.root, digest[:2], digest[2:4], f"{digest}.{extension}")
+
+    def preview_path_for(self, digest: str) -> str:
+        extension = "webp" if self.preview_format == "webp" else "jpg"
+        return os.path.join(self.root, "previews", digest[:2], digest[2:4], f"{digest}.{extension}")
+
+    def _write_file(self, path: str, data: bytes) -> None:
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        # Write to a temporary name and rename, so readers never see a partial file
+        fd, temp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(temp_path, path)
+        except BaseException:
+            os.unlink(temp_path)
+            raise
+
+    def _write_preview(self, digest: str, data: bytes) -> Optional[str]:
+        path = self.preview_path_for(digest)
+        if os.path.exists(path):
+            return path
+        try:
+            image = decode_pil_image(data, max_side=self.preview_max_side)
+        except ValueError as e:
+            print(f"Photo preview error: {e}")
+            return None
+        preview = io.BytesIO()
+        if self.preview_format == "webp":
+            image.save(preview, format="WEBP", quality=75, method=4)
+        else:
+            image.save(preview, format="JPEG", quality=75, optimize=True)
+        self._write_file(path, preview.getvalue())
+        return path
+
+    def _write(self, data: bytes) -> str:
+        digest = hashlib.sha256(data).hexdigest()
+        path = self.path_for(digest, self.extension(data))
+        if not os.path.exists(path) and not self.packs.contains(digest):
+            self._write_file(path, data)
+        self._write_preview(digest, data)
+        return path
+
+    async def save(self, data: bytes) -> str:
+        """Store the photo and its preview if it is new and return the photo path"""
+        return await asyncio.to_thread(self._write, data)
+
+    def _digest(self, path: str) -> Optional[str]:
+        name = os.path.basename(path).split(".")[0]
+        return name if DIGEST_PATTERN.match(name) else None
+
+    def resolve(self, reference: str) -> Optional[str]:
+        """
+        Stored path of a photo given its SHA-256 digest or stored path
+
+        For records that point at a photo uploaded earlier instead of carrying
+        it. Returns None when no such photo is stored.
+        """
+        digest = reference if DIGEST_PATTERN.match(reference) else self._digest(reference)
+        if digest is None:
+            return None
+        for extension in ("jpg", "png", "webp", "bin"):
+            path = self.path_for(digest, extension)
+            if os.path.exists(path):
+                return path
+        extension = self.packs.extension(digest)
+        return self.path_for(digest, extension) if extension else None
+
+    def read(self, path: str) -> Optional[bytes]:
+        """Original photo bytes, from the loose file or from a pack"""
+        try:
+            with open(path, "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            pass
+        digest = self._digest(path)
+        return self.packs.read(digest) if digest else None
+
+    def _preview(self, path: str) -> Optional[str]:
+        digest = self._digest(path)
+        if digest and os.path.exists(self.preview_path_for(digest)):
+            return self.preview_path_for(digest)
+        # Photos stored before previews existed get one on first request
+        data = self.read(path)
+        if data is None:
+            return None
+        return self._write_preview(digest or hashlib.sha256(data).hexdigest(), data)
+
+    async def preview(self, path: str) -> Optional[str]:
+        """Path of the photo's preview file, or None if the photo does not exist"""
+        return await asyncio.to_thread(self._preview, path)
+
+    def archive(self, older_than_seconds: float) -> int:
+        """
+        Move originals older than the given age into pack files
+
+        Previews stay as files so the dashboard keeps serving them directly.
+
+        Returns:
+            Number of photos archived
+        """
+        cutoff = time.time() - older_than_seconds
+        candidates = []
+        for first in sorted(os.listdir(self.root)) if os.path.isdir(self.root) else []:
+            first_dir = os.path.join(self.root, first)
+            if len(first) != 2 or not os.path.isdir(first_dir):
+                continue
+            for second in sorted(os.listdir(first_dir)):
+                shard = os.path.join(first_dir, second)
+                for name in sorted(os.listdir(shard)):
+                    path = os.path.join(shard, name)
+                    digest, _, extension = name.partition(".")
+                    if DIGEST_PATTERN.match(digest) and os.path.getmtime(path) < cutoff:
+                        candidates.append((digest, extension, path))
+
+        archived = self.packs.append(candidates)
+        for _, _, path in candidates[:archived]:
+            os.unlink(path)
+            # Drop shard directories that are now empty
+            for directory in (os.path.dirname(path), os.path.dirname(os.path.dirname(path))):
+                try:
+                    os.rmdir(directory)
+                except OSError:
+                    break
+        return archived
+
+# Create a global instance
+photo_storage = PhotoStorage(
+    root=os.getenv("PHOTO_STORAGE_DIR", "uploads"),
+    max_upload_bytes=int(os.getenv("MAX_UPLOAD_BYTES", str(10 * 1024 * 1024))),
+    preview_max_side=int(os.getenv("PHOTO_PREVIEW_MAX_SIDE", "320")),
+    preview_format=os.getenv("PHOTO_PREVIEW_FORMAT", "webp").lower(),
+    max_pack_bytes=int(os.getenv("PHOTO_PACK_MAX_BYTES", str(1024 * 1024 * 1024)))
+)
@@ -0,0 +1,101 @@
+import os
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Set
+
+class PrincipalCache:
+    """
+    Bounded TTL cache of authenticated students, keyed by access token
+
+    get_current_user still checks every token's signature and expiry, the
+    cache only saves loading the same student from the database on every
+    request. Entries are column snapshots, not ORM instances, so nothing is
+    shared between sessions. invalidate() drops every token of a student and
+    is called when a student's is_active, password or email changes. It only
+    reaches this process; other workers catch up within ttl_seconds.
+    """
+
+    def __init__(self, max_entries: int = 10000, ttl_seconds: float = 60):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()  # key -> (expires_at, student_id, snapshot)
+        self._keys_by_student: Dict[int, Set[str]] = {}
+        self._lock = threading.Lock()
+        # Bumped by invalidate(), so a lookup that raced an update does not cache what it read
+        self.generation = 0
+        # Metrics
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def make_key(self, token: str) -> str:
+        return hashlib.blake2b(token.encode("utf-8"), digest_size=20).hexdigest()
+
+    def get(self, token: str) -> Optional[Dict[str, Any]]:
+        key = self.make_key(token)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[0] > now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return entry[2]
+                self._forget(key)
+            self.misses += 1
+            return None
+
+    def set(self, token: str, student_id: int, snapshot: Dict[str, Any], generation: int) -> None:
+        """
+        Cache a student loaded for token
+
+        generation is the value of self.generation read before the database
+        lookup; if a student was invalidated since, the snapshot may be stale
+        and is not stored.
+        """
+        key = self.make_key(token)
+        with self._lock:
+            if generation != self.generation:
+                return
+            self._forget(key)
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, student_id, snapshot)
+            self._keys_by_student.setdefault(student_id, set()).add(key)
+            while len(self._entries) > self.max_entries:
+                self._forget(next(iter(self._entries)))
+
+    def invalidate(self, student_id: int) -> None:
+        with self._lock:
+            self.generation += 1
+            self.invalidations += 1
+            for key in self._keys_by_student.pop(student_id, ()):
+                self._entries.pop(key, None)
+
+    def _forget(self, key: str) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        keys = self._keys_by_student.get(entry[1])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._keys_by_student[entry[1]]
+
+    def metrics(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0,
+            "invalidations": self.invalidations,
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl_seconds
+        }
+
+# Create a global instance
+principal_cache = PrincipalCache(
+    max_entries=int(os.getenv("PRINCIPAL_CACHE_MAX_ENTRIES", "10000")),
+    ttl_seconds=float(os.getenv("PRINCIPAL_CACHE_TTL_SECONDS", "60"))
+)
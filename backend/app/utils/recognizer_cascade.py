@@ -0,0 +1,204 @@
+import os
+import time
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from .batch_scheduler import embedding_batcher
+from .google_face_recognition import google_face_recognizer
+from .simple_face_recognition import simple_face_recognizer
+from .image_preprocessing import DecodedImage
+from .resilience import CircuitBreaker, LatencyTracker
+
+VerifyFunction = Callable[[DecodedImage, DecodedImage], Awaitable[Dict[str, Any]]]
+
+class RecognizerStage:
+    """One backend of the verification cascade, with its own timeout, breaker and latency stats"""
+
+    def __init__(self, name: str, verify: VerifyFunction, model_used: str, detector_used: str, timeout: float):
+        self.name = name
+        self.verify = verify
+        self.model_used = model_used
+        self.detector_used = detector_used
+        # e.g. FACE_STAGE_TIMEOUT_GOOGLE=3
+        self.timeout = float(os.getenv(f"FACE_STAGE_TIMEOUT_{name.upper()}", str(timeout)))
+        self.breaker = CircuitBreaker(
+            name,
+            failure_threshold=int(os.getenv("FACE_BREAKER_FAILURES", "5")),
+            reset_seconds=float(os.getenv("FACE_BREAKER_RESET_SECONDS", "30"))
+        )
+        self.latency = LatencyTracker()
+
+    def metrics(self) -> Dict[str, Any]:
+        p95 = self.latency.percentile(0.95)
+        return {
+            "timeout_seconds": self.timeout,
+            "p95_ms": round(p95 * 1000, 1) if p95 is not None else None,
+            "breaker": self.breaker.metrics()
+        }
+
+# All recognizers that FACE_RECOGNIZER_CASCADE can refer to, by name
+recognizer_registry: Dict[str, RecognizerStage] = {}
+
+def register_recognizer(name: str, verify: VerifyFunction, model_used: str, detector_used: str, timeout: float) -> None:
+    recognizer_registry[name] = RecognizerStage(name, verify, model_used, detector_used, timeout)
+
+class RecognizerCascade:
+    """
+    Runs verification backends in order until one of them succeeds
+
+    Every stage gets the shorter of its own timeout and what is left of the
+    request deadline. A stage whose circuit breaker is open is skipped. With
+    hedging on, the next stage is started as soon as the running one takes
+    longer than its p95 latency, and the first successful result wins.
+    """
+
+    def __init__(self, stage_names: List[str], deadline: float, hedging: bool):
+        unknown = [name for name in stage_names if name not in recognizer_registry]
+        if unknown:
+            raise ValueError(f"Unknown face recognizers: {', '.join(unknown)}")
+        self.stage_names = stage_names
+        self.deadline = deadline
+        self.hedging = hedging
+
+    @property
+    def stages(self) -> List[RecognizerStage]:
+        return [recognizer_registry[name] for name in self.stage_names]
+
+    async def run(
+        self,
+        reference: DecodedImage,
+        live: DecodedImage
+    ) -> Tuple[Optional[RecognizerStage], Optional[Dict[str, Any]], List[Dict[str, Any]]]:
+        """
+        Returns:
+            (winning stage, its result, per-stage report), stage and result are None if all failed
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.deadline
+        waiting = list(self.stages)
+        running: Dict[asyncio.Task, Tuple[RecognizerStage, Dict[str, Any]]] = {}
+        report: List[Dict[str, Any]] = []
+        last_started = None  # (stage, start time) of the most recently started stage
+
+        def start_next_stage() -> None:
+            nonlocal last_started
+            while waiting:
+                stage = waiting.pop(0)
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    report.append({"stage": stage.name, "status": "deadline_exceeded", "duration_ms": 0})
+                    continue
+                if not stage.breaker.allow():
+                    report.append({"stage": stage.name, "status": "circuit_open", "duration_ms": 0})
+                    continue
+                entry = {"stage": stage.name, "status": "running", "duration_ms": 0, "hedged": bool(running)}
+                report.append(entry)
+                task = asyncio.ensure_future(
+                    self._run_stage(stage, reference, live, min(stage.timeout, remaining), entry)
+                )
+                running[task] = (stage, entry)
+                last_started = (stage, loop.time())
+                return
+
+        start_next_stage()
+        try:
+            while running:
+                hedge_delay = None
+                if self.hedging and waiting and last_started is not None:
+                    stage, started_at = last_started
+                    p95 = stage.latency.percentile(0.95)
+                    if p95 is not None:
+                        hedge_delay = max(0.0, started_at + p95 - loop.time())
+
+                done, _ = await asyncio.wait(running, timeout=hedge_delay, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    # The running stage is slower than usual, start the next one alongside it
+                    last_started = None
+                    start_next_stage()
+                    continue
+
+                for task in done:
+                    stage, _ = running.pop(task)
+                    result = task.result()
+                    if result is not None:
+                        return stage, result, report
+                # A stage failed, fall through to the next one
+                start_next_stage()
+            return None, None, report
+        finally:
+            # Stop whatever is still running once a winner is found
+            for task in running:
+                task.cancel()
+            await asyncio.gather(*running, return_exceptions=True)
+            for stage, entry in running.values():
+                if entry["status"] == "running":
+                    # Cancelled before it got to run
+                    stage.breaker.release()
+                    entry["status"] = "cancelled"
+
+    async def _run_stage(
+        self,
+        stage: RecognizerStage,
+        reference: DecodedImage,
+        live: DecodedImage,
+        timeout: float,
+        entry: Dict[str, Any]
+    ) -> Optional[Dict[str, Any]]:
+        """Run one stage and fill in its report entry, returns the result only if it succeeded"""
+        start = time.perf_counter()
+        result = None
+        try:
+            result = await asyncio.wait_for(stage.verify(reference, live), timeout=timeout)
+            # The backend answered, even if it could not match the faces (e.g. no face found)
+            stage.breaker.record_success()
+            if result.get("success"):
+                stage.latency.record(time.perf_counter() - start)
+                entry["status"] = "success"
+            else:
+                entry["status"] = "failed"
+                entry["message"] = result.get("message")
+                result = None
+        except asyncio.TimeoutError:
+            stage.breaker.record_failure()
+            entry["status"] = "timeout"
+        except asyncio.CancelledError:
+            stage.breaker.release()
+            entry["status"] = "cancelled"
+            raise
+        except Exception as e:
+            print(f"{stage.name} recognizer error: {e}")
+            stage.breaker.record_failure()
+            entry["status"] = "error"
+            entry["message"] = str(e)
+        finally:
+            entry["duration_ms"] = round((time.perf_counter() - start) * 1000, 1)
+        return result
+
+    def metrics(self) -> Dict[str, Any]:
+        return {
+            "stages": self.stage_names,
+            "deadline_seconds": self.deadline,
+            "hedging": self.hedging,
+            **{stage.name: stage.metrics() for stage in self.stages}
+        }
+
+async def _deepface_verify(reference: DecodedImage, live: DecodedImage) -> Dict[str, Any]:
+    return await embedding_batcher.verify(reference, live)
+
+async def _google_verify(reference: DecodedImage, live: DecodedImage) -> Dict[str, Any]:
+    # Raises on API errors, so the stage's breaker counts them as failures
+    return await google_face_recognizer.compare_faces(reference, live)
+
+async def _simple_verify(reference: DecodedImage, live: DecodedImage) -> Dict[str, Any]:
+    return await asyncio.to_thread(simple_face_recognizer.verify_faces, reference, live)
+
+register_recognizer("deepface", _deepface_verify, "ArcFace", "RetinaFace", timeout=8)
+register_recognizer("google", _google_verify, "Google Gemini", "Google Vision AI", timeout=5)
+register_recognizer("simple", _simple_verify, "Simple Comparison", "OpenCV", timeout=1)
+
+# Create a global instance
+recognizer_cascade = RecognizerCascade(
+    stage_names=[name.strip() for name in os.getenv("FACE_RECOGNIZER_CASCADE", "deepface,google,simple").split(",") if name.strip()],
+    deadline=float(os.getenv("FACE_VERIFY_DEADLINE_SECONDS", "10")),
+    hedging=os.getenv("FACE_RECOGNIZER_HEDGING", "false").lower() == "true"
+)
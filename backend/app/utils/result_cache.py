@@ -0,0 +1,164 @@
+import os
+import json
+import time
+import asyncio
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Union
+
+class ResultCache:
+    """
+    Content-addressed cache for recognizer results
+
+    The first tier is an in-process LRU with a TTL and a size bound. If a disk
+    path is given, results are also written to a small SQLite file so that
+    other worker processes (and restarts) can reuse them. Async callers use
+    aget() and aset(), which keep the disk tier off the event loop.
+    """
+
+    def __init__(self, max_entries: int = 1024, ttl_seconds: float = 300, disk_path: Optional[str] = None):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.disk_path = disk_path
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+        # Disk reads and writes are serialized separately, so memory hits never wait on them
+        self._disk_lock = threading.Lock()
+        self._disk = None
+        self._writes = 0
+        # Metrics
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def make_key(self, *parts: Union[bytes, str]) -> str:
+        """Hash the given byte strings and config values into a cache key"""
+        digest = hashlib.blake2b(digest_size=20)
+        for part in parts:
+            data = part if isinstance(part, bytes) else str(part).encode("utf-8")
+            # Length prefix so ("ab", "c") and ("a", "bc") do not collide
+            digest.update(len(data).to_bytes(8, "little"))
+            digest.update(data)
+        return digest.hexdigest()
+
+    def _disk_connection(self) -> sqlite3.Connection:
+        if self._disk is None:
+            os.makedirs(os.path.dirname(self.disk_path) or ".", exist_ok=True)
+            self._disk = sqlite3.connect(self.disk_path, timeout=5, check_same_thread=False)
+            self._disk.execute("PRAGMA journal_mode=WAL")
+            self._disk.execute(
+                "CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, value TEXT, expires_at REAL)"
+            )
+        return self._disk
+
+    def _memory_get(self, key: str, now: float) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at > now:
+                    self._entries.move_to_end(key)
+                    self.memory_hits += 1
+                    return value
+                del self._entries[key]
+        return None
+
+    def _disk_get(self, key: str, now: float) -> Optional[Dict[str, Any]]:
+        with self._disk_lock:
+            disk = self._disk_connection()
+            try:
+                row = disk.execute(
+                    "SELECT value, expires_at FROM results WHERE key = ? AND expires_at > ?", (key, now)
+                ).fetchone()
+            except sqlite3.Error as e:
+                print(f"Result cache disk error: {e}")
+                row = None
+        if row is None:
+            return None
+        value = json.loads(row[0])
+        with self._lock:
+            self._remember(key, value, row[1])
+            self.disk_hits += 1
+        return value
+
+    def _disk_set(self, key: str, value: Dict[str, Any], expires_at: float) -> None:
+        with self._disk_lock:
+            disk = self._disk_connection()
+            try:
+                with disk:
+                    disk.execute(
+                        "INSERT OR REPLACE INTO results (key, value, expires_at) VALUES (?, ?, ?)",
+                        (key, json.dumps(value), expires_at)
+                    )
+                    # Opportunistic cleanup keeps the file from growing without bound
+                    self._writes += 1
+                    if self._writes % 100 == 0:
+                        disk.execute("DELETE FROM results WHERE expires_at <= ?", (time.time(),))
+            except sqlite3.Error as e:
+                print(f"Result cache disk error: {e}")
+
+    def _miss(self) -> None:
+        with self._lock:
+            self.misses += 1
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        now = time.time()
+        value = self._memory_get(key, now)
+        if value is None and self.disk_path is not None:
+            value = self._disk_get(key, now)
+        if value is None:
+            self._miss()
+        return value
+
+    def set(self, key: str, value: Dict[str, Any]) -> None:
+        expires_at = time.time() + self.ttl_seconds
+        with self._lock:
+            self._remember(key, value, expires_at)
+        if self.disk_path is not None:
+            self._disk_set(key, value, expires_at)
+
+    async def aget(self, key: str) -> Optional[Dict[str, Any]]:
+        """Like get(), for the event loop: the disk tier is read in a worker thread"""
+        now = time.time()
+        value = self._memory_get(key, now)
+        if value is None and self.disk_path is not None:
+            value = await asyncio.to_thread(self._disk_get, key, now)
+        if value is None:
+            self._miss()
+        return value
+
+    async def aset(self, key: str, value: Dict[str, Any]) -> None:
+        """Like set(), for the event loop: the disk tier is written in a worker thread"""
+        expires_at = time.time() + self.ttl_seconds
+        with self._lock:
+            self._remember(key, value, expires_at)
+        if self.disk_path is not None:
+            await asyncio.to_thread(self._disk_set, key, value, expires_at)
+
+    def _remember(self, key: str, value: Dict[str, Any], expires_at: float) -> None:
+        self._entries[key] = (expires_at, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def metrics(self) -> Dict[str, Any]:
+        lookups = self.memory_hits + self.disk_hits + self.misses
+        return {
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": round((self.memory_hits + self.disk_hits) / lookups, 4) if lookups else 0,
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl_seconds,
+            "disk_tier": self.disk_path is not None
+        }
+
+# Cache for /face-verify/ results. Set VERIFY_CACHE_PATH to share it between workers.
+verification_cache = ResultCache(
+    max_entries=int(os.getenv("VERIFY_CACHE_MAX_ENTRIES", "1024")),
+    ttl_seconds=float(os.getenv("VERIFY_CACHE_TTL_SECONDS", "300")),
+    disk_path=os.getenv("VERIFY_CACHE_PATH") or None
+)
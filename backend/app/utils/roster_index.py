@@ -0,0 +1,172 @@
+import os
+import time
+from typing import Dict, List, Tuple
+import numpy as np
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from ..models.face_embedding import FaceEmbedding
+from ..models.student import Student
+from .embedding_store import embedding_store
+from .deepface_recognition import deepface_recognizer
+from .student_rows import StudentRows
+
+class Roster(StudentRows):
+    """Contiguous float32 matrix of L2-normalized embeddings for one section"""
+
+    def __init__(self, dimension: int, capacity: int = 64):
+        super().__init__((dimension,), np.float32, capacity)
+        self.dimension = dimension
+
+    def search(self, query: np.ndarray, top_k: int) -> List[Tuple[int, float]]:
+        if self.size == 0:
+            return []
+        # One matrix-vector product gives the cosine similarity to every student
+        scores = self.data[:self.size] @ query
+        top_k = min(top_k, self.size)
+        top = np.argpartition(-scores, top_k - 1)[:top_k]
+        top = top[np.argsort(-scores[top])]
+        return [(int(self.student_ids[i]), float(scores[i])) for i in top]
+
+    def match_faces(self, queries: np.ndarray, min_similarity: float) -> Dict[int, Tuple[int, float]]:
+        """
+        Assign each face to at most one student and each student to at most one face
+
+        Pairs are taken greedily from the most to the least similar, which is
+        what a teacher would do by eye and is optimal for well-separated faces.
+
+        Returns:
+            student_id -> (face index, cosine similarity)
+        """
+        if self.size == 0 or len(queries) == 0:
+            return {}
+        # (faces, students) similarity matrix in one product
+        scores = queries @ self.data[:self.size].T
+        matches: Dict[int, Tuple[int, float]] = {}
+        used_faces = set()
+        for flat in np.argsort(-scores, axis=None):
+            face, row = divmod(int(flat), self.size)
+            score = float(scores[face, row])
+            if score < min_similarity:
+                break
+            student_id = int(self.student_ids[row])
+            if face in used_faces or student_id in matches:
+                continue
+            matches[student_id] = (face, score)
+            used_faces.add(face)
+        return matches
+
+class RosterIndex:
+    """
+    In-memory 1:N identification over a section's enrolled embeddings
+
+    Rosters are keyed by (class_name, section), loaded from the database on
+    first use and then kept up to date as students enroll in this process.
+    At most every check_seconds a roster's version (enrolled count, sum of
+    student ids and latest embedding update) is compared with the database,
+    and the roster is reloaded if another worker or the CLI changed it.
+    """
+
+    def __init__(self, model_name: str, detector_backend: str, check_seconds: float = 5):
+        self.model_name = model_name
+        self.detector_backend = detector_backend
+        self.check_seconds = check_seconds
+        self._rosters: Dict[Tuple[str, str], Roster] = {}
+        self._versions: Dict[Tuple[str, str], tuple] = {}
+        self._checked_at: Dict[Tuple[str, str], float] = {}
+
+    def normalize(self, embedding) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm > 0 else vector
+
+    def get_roster(self, db: Session, class_name: str, section: str) -> Roster:
+        key = (class_name, section)
+        roster = self._rosters.get(key)
+        now = time.monotonic()
+        if roster is not None and now - self._checked_at[key] < self.check_seconds:
+            return roster
+        version = self._version(db, class_name, section)
+        if roster is None or version != self._versions[key]:
+            roster = self._load(db, class_name, section)
+            self._rosters[key] = roster
+            self._versions[key] = version
+        self._checked_at[key] = now
+        return roster
+
+    def _filter(self, query, class_name: str, section: str):
+        return query.join(
+            Student, Student.id == FaceEmbedding.student_id
+        ).filter(
+            Student.class_name == class_name,
+            Student.section == section,
+            Student.is_active == True,
+            FaceEmbedding.model_name == self.model_name,
+            FaceEmbedding.detector_backend == self.detector_backend
+        )
+
+    def _version(self, db: Session, class_name: str, section: str) -> tuple:
+        return tuple(self._filter(
+            db.query(func.count(FaceEmbedding.id), func.sum(FaceEmbedding.student_id), func.max(FaceEmbedding.updated_at)),
+            class_name,
+            section
+        ).one())
+
+    def _load(self, db: Session, class_name: str, section: str) -> Roster:
+        records = self._filter(
+            db.query(FaceEmbedding.student_id, FaceEmbedding.embedding), class_name, section
+        ).all()
+
+        vectors = [self.normalize(embedding_store.from_bytes(record.embedding)) for record in records]
+        dimension = len(vectors[0]) if vectors else 512
+        roster = Roster(dimension, capacity=max(64, len(vectors)))
+        for record, vector in zip(records, vectors):
+            roster.upsert(record.student_id, vector)
+        return roster
+
+    def upsert(self, student_id: int, class_name: str, section: str, embedding) -> None:
+        """Add or refresh a student's embedding in an already loaded roster, moving it from any other"""
+        # Drop the student from any other section they were loaded under
+        for key, roster in self._rosters.items():
+            if key != (class_name, section):
+                roster.remove(student_id)
+
+        roster = self._rosters.get((class_name, section))
+        if roster is not None:
+            roster.upsert(student_id, self.normalize(embedding))
+
+    def remove(self, student_id: int) -> None:
+        for roster in self._rosters.values():
+            roster.remove(student_id)
+
+    def search(
+        self,
+        db: Session,
+        class_name: str,
+        section: str,
+        embedding,
+        top_k: int = 5
+    ) -> List[Tuple[int, float]]:
+        """Return up to top_k (student_id, cosine similarity) pairs, best first"""
+        roster = self.get_roster(db, class_name, section)
+        return roster.search(self.normalize(embedding), top_k)
+
+    def match_faces(
+        self,
+        db: Session,
+        class_name: str,
+        section: str,
+        embeddings: List,
+        min_similarity: float
+    ) -> Dict[int, Tuple[int, float]]:
+        """Match several faces from one photo against a section, see Roster.match_faces"""
+        roster = self.get_roster(db, class_name, section)
+        queries = np.stack([self.normalize(embedding) for embedding in embeddings]) if embeddings else np.zeros((0, roster.dimension), dtype=np.float32)
+        return roster.match_faces(queries, min_similarity)
+
+# Create a global instance
+roster_index = RosterIndex(
+    deepface_recognizer.model_name,
+    deepface_recognizer.detector_backend,
+    check_seconds=float(os.getenv("ROSTER_VERSION_CHECK_SECONDS", "5"))
+)
@@ -1,51 +1,20 @@
 import os
-import base64
 import tempfile
-from typing import Dict, Any
+from typing import Dict, Any, List, Optional, Tuple
 import cv2
 import numpy as np
-from PIL import Image
-import io
+from .image_preprocessing import ImageLike, DecodedImage, as_decoded_image
 
 class SimpleFaceRecognition:
     def __init__(self):
         self.threshold = 0.6  # Similarity threshold
     
-    def base64_to_image(self, base64_string: str) -> np.ndarray:
-        """Convert base64 string to OpenCV image array"""
-        try:
-            # Remove data URL prefix if present
-            if base64_string.startswith('data:image'):
-                base64_string = base64_string.split(',')[1]
-            
-            # Decode base64
-            image_data = base64.b64decode(base64_string)
-            
-            # Convert to PIL Image
-            pil_image = Image.open(io.BytesIO(image_data))
-            
-            # Convert to RGB if necessary
-            if pil_image.mode != 'RGB':
-                pil_image = pil_image.convert('RGB')
-            
-            # Convert to OpenCV format
-            opencv_image = cv2.cvtColor(np.array(pil_image), cv2.COLOR_RGB2BGR)
-            
-            return opencv_image
-        except Exception as e:
-            raise ValueError(f"Error converting base64 to image: {str(e)}")
-    
-    def calculate_image_similarity(self, img1: np.ndarray, img2: np.ndarray) -> float:
+    def calculate_image_similarity(self, img1: DecodedImage, img2: DecodedImage) -> float:
         """Calculate similarity between two images using pixel comparison"""
         try:
-            # Resize images to same size for comparison
-            height, width = 100, 100
-            img1_resized = cv2.resize(img1, (width, height))
-            img2_resized = cv2.resize(img2, (width, height))
-            
-            # Convert to grayscale for comparison
-            gray1 = cv2.cvtColor(img1_resized, cv2.COLOR_BGR2GRAY)
-            gray2 = cv2.cvtColor(img2_resized, cv2.COLOR_BGR2GRAY)
+            # Compare same-size grayscale thumbnails
+            gray1 = img1.thumbnail(100, 100)
+            gray2 = img2.thumbnail(100, 100)
             
             # Calculate structural similarity
             diff = cv2.absdiff(gray1, gray2)
@@ -56,53 +25,92 @@ class SimpleFaceRecognition:
             print(f"Error calculating similarity: {e}")
             return 0.0
     
-    def verify_faces(self, reference_image_base64: str, live_image_base64: str) -> Dict[str, Any]:
+    def batch_similarity(self, live_thumbnail: np.ndarray, reference_thumbnails: np.ndarray) -> np.ndarray:
+        """
+        Similarity of one grayscale thumbnail to each of an (N, height, width) stack
+        
+        Same measure as calculate_image_similarity, computed for all N
+        references in one vectorized operation.
+        """
+        # max - min is the absolute difference without widening the uint8 stack
+        diff = np.maximum(reference_thumbnails, live_thumbnail) - np.minimum(reference_thumbnails, live_thumbnail)
+        mean_diff = diff.reshape(len(diff), -1).sum(axis=1, dtype=np.uint32) / live_thumbnail.size
+        return np.clip(1.0 - mean_diff / 255.0, 0.0, 1.0)
+    
+    def rank_references(
+        self,
+        live_image: ImageLike,
+        reference_thumbnails: np.ndarray,
+        student_ids: np.ndarray,
+        top_k: Optional[int] = None
+    ) -> List[Tuple[int, float]]:
+        """
+        Compare a live image against many reference thumbnails
+        
+        Returns:
+            (student_id, similarity percentage) pairs, best first
+        """
+        if len(reference_thumbnails) == 0:
+            return []
+        height, width = reference_thumbnails.shape[1:]
+        scores = self.batch_similarity(as_decoded_image(live_image).thumbnail(width, height), reference_thumbnails)
+        top_k = len(scores) if top_k is None else min(top_k, len(scores))
+        top = np.argpartition(-scores, top_k - 1)[:top_k]
+        top = top[np.argsort(-scores[top])]
+        return [(int(student_ids[i]), round(float(scores[i]) * 100, 2)) for i in top]
+    
+    def similarity_result(self, similarity_percentage: float) -> Dict[str, Any]:
+        """Match status, confidence level and color for a similarity percentage"""
+        # Determine match status based on similarity
+        if similarity_percentage >= 70:
+            match_status = "MATCH"
+            is_verified = True
+            color = "green"
+            confidence_level = "HIGH"
+        elif similarity_percentage >= 40:
+            match_status = "POSSIBLE_MATCH"
+            is_verified = False
+            color = "orange"
+            confidence_level = "MEDIUM"
+        else:
+            match_status = "NO_MATCH"
+            is_verified = False
+            color = "red"
+            confidence_level = "LOW"
+        
+        return {
+            "match_status": match_status,
+            "is_verified": is_verified,
+            "similarity_percentage": round(similarity_percentage, 2),
+            "confidence_level": confidence_level,
+            "color": color,
+            "message": f"Face {match_status.lower().replace('_', ' ')} with {similarity_percentage:.1f}% similarity"
+        }
+    
+    def verify_faces(self, reference_image_base64: ImageLike, live_image_base64: ImageLike) -> Dict[str, Any]:
         """
         Compare two faces using simple image similarity
         
         Args:
-            reference_image_base64: Base64 encoded reference image
-            live_image_base64: Base64 encoded live captured image
+            reference_image_base64: Base64 encoded, raw or decoded reference image
+            live_image_base64: Base64 encoded, raw or decoded live captured image
             
         Returns:
             Dict containing match result, confidence, and details
         """
         try:
-            # Convert base64 strings to images
-            reference_img = self.base64_to_image(reference_image_base64)
-            live_img = self.base64_to_image(live_image_base64)
+            reference_img = as_decoded_image(reference_image_base64)
+            live_img = as_decoded_image(live_image_base64)
             
             # Calculate similarity
             similarity = self.calculate_image_similarity(reference_img, live_img)
             similarity_percentage = similarity * 100
             
-            # Determine match status based on similarity
-            if similarity_percentage >= 70:
-                match_status = "MATCH"
-                is_verified = True
-                color = "green"
-                confidence_level = "HIGH"
-            elif similarity_percentage >= 40:
-                match_status = "POSSIBLE_MATCH"
-                is_verified = False
-                color = "orange"
-                confidence_level = "MEDIUM"
-            else:
-                match_status = "NO_MATCH"
-                is_verified = False
-                color = "red"
-                confidence_level = "LOW"
-            
             return {
                 "success": True,
-                "match_status": match_status,
-                "is_verified": is_verified,
-                "similarity_percentage": round(similarity_percentage, 2),
-                "confidence_level": confidence_level,
-                "color": color,
+                **self.similarity_result(similarity_percentage),
                 "model_used": "Simple Image Comparison",
-                "detector_used": "OpenCV",
-                "message": f"Face {match_status.lower().replace('_', ' ')} with {similarity_percentage:.1f}% similarity"
+                "detector_used": "OpenCV"
             }
             
         except Exception as e:
@@ -0,0 +1,43 @@
+from typing import Dict, Tuple
+import numpy as np
+
+class StudentRows:
+    """
+    Contiguous NumPy array with one row per student, for vectorized comparisons
+
+    Live rows are always data[:size], so a query is compared against every
+    student in one operation. Removing a student moves the last row into
+    the gap, and the array doubles in size when it fills up.
+    """
+
+    def __init__(self, row_shape: Tuple[int, ...], dtype, capacity: int = 64):
+        self.data = np.zeros((capacity, *row_shape), dtype=dtype)
+        self.student_ids = np.zeros(capacity, dtype=np.int64)
+        self.rows: Dict[int, int] = {}  # student_id -> row
+        self.size = 0
+
+    def upsert(self, student_id: int, value: np.ndarray) -> None:
+        row = self.rows.get(student_id)
+        if row is None:
+            if self.size == len(self.data):
+                # Grow geometrically so enrolling a whole school stays cheap
+                self.data = np.concatenate([self.data, np.zeros_like(self.data)])
+                self.student_ids = np.concatenate([self.student_ids, np.zeros_like(self.student_ids)])
+            row = self.size
+            self.size += 1
+            self.rows[student_id] = row
+            self.student_ids[row] = student_id
+        self.data[row] = value
+
+    def remove(self, student_id: int) -> None:
+        row = self.rows.pop(student_id, None)
+        if row is None:
+            return
+        # Move the last row into the gap to keep the live rows contiguous
+        last = self.size - 1
+        if row != last:
+            moved_id = int(self.student_ids[last])
+            self.data[row] = self.data[last]
+            self.student_ids[row] = moved_id
+            self.rows[moved_id] = row
+        self.size -= 1
@@ -0,0 +1,132 @@
+import os
+import time
+from datetime import datetime
+from typing import List, Optional, Sequence, Tuple
+import numpy as np
+from sqlalchemy import func
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from ..models.face_thumbnail import FaceThumbnail
+from ..models.student import Student
+from .image_preprocessing import ImageLike, as_decoded_image
+from .simple_face_recognition import simple_face_recognizer
+from .student_rows import StudentRows
+
+class ThumbnailStore:
+    """
+    Reference thumbnails of every active enrolled student, for SimpleFaceRecognition
+
+    Thumbnails are 100x100 grayscale uint8 images kept in one contiguous
+    (N, 100, 100) array, so a live photo is compared against all of them in a
+    single NumPy operation. They are persisted as raw pixels in
+    face_thumbnails and loaded from the database on first use. Like the
+    section rosters, at most every check_seconds their version (count, sum of
+    student ids and latest update) is compared with the database, and they are
+    reloaded if another worker or the CLI changed them.
+    """
+
+    def __init__(self, width: int = 100, height: int = 100, capacity: int = 64, check_seconds: float = 5):
+        self.width = width
+        self.height = height
+        self.capacity = capacity
+        self.check_seconds = check_seconds
+        self.thumbnails = StudentRows((height, width), np.uint8, capacity)
+        self.loaded = False
+        self._version = None
+        self._checked_at = 0.0
+
+    def _filter(self, query):
+        return query.join(
+            Student, Student.id == FaceThumbnail.student_id
+        ).filter(
+            Student.is_active == True,
+            FaceThumbnail.width == self.width,
+            FaceThumbnail.height == self.height
+        )
+
+    def _current_version(self, db: Session) -> tuple:
+        return tuple(self._filter(
+            db.query(func.count(FaceThumbnail.student_id), func.sum(FaceThumbnail.student_id), func.max(FaceThumbnail.updated_at))
+        ).one())
+
+    def load(self, db: Session) -> None:
+        # Taken before reading, so a change made meanwhile shows up at the next check
+        version = self._current_version(db)
+        records = self._filter(db.query(FaceThumbnail.student_id, FaceThumbnail.thumbnail)).all()
+        thumbnails = StudentRows((self.height, self.width), np.uint8, max(self.capacity, len(records)))
+        for record in records:
+            thumbnails.upsert(record.student_id, self.from_bytes(record.thumbnail))
+        self.thumbnails = thumbnails
+        self._version = version
+        self._checked_at = time.monotonic()
+        self.loaded = True
+
+    def refresh(self, db: Session) -> None:
+        """Load the thumbnails on first use, and reload them if the database has changed"""
+        now = time.monotonic()
+        if self.loaded and now - self._checked_at < self.check_seconds:
+            return
+        if not self.loaded or self._current_version(db) != self._version:
+            self.load(db)
+        self._checked_at = now
+
+    def to_bytes(self, thumbnail: np.ndarray) -> bytes:
+        return np.ascontiguousarray(thumbnail, dtype=np.uint8).tobytes()
+
+    def from_bytes(self, data: bytes) -> np.ndarray:
+        return np.frombuffer(data, dtype=np.uint8).reshape(self.height, self.width)
+
+    def upsert(self, student_id: int, thumbnail: np.ndarray) -> None:
+        self.thumbnails.upsert(student_id, thumbnail)
+
+    def remove(self, student_id: int) -> None:
+        self.thumbnails.remove(student_id)
+
+    def save(self, db: Session, student_id: int, image: ImageLike) -> np.ndarray:
+        """Store a student's reference thumbnail, replacing any previous one"""
+        thumbnail = as_decoded_image(image).thumbnail(self.width, self.height)
+        for attempt in range(2):
+            record = db.get(FaceThumbnail, student_id)
+            if record is None:
+                record = FaceThumbnail(student_id=student_id)
+                db.add(record)
+            record.width = self.width
+            record.height = self.height
+            record.thumbnail = self.to_bytes(thumbnail)
+            record.updated_at = datetime.utcnow()
+            try:
+                db.commit()
+                break
+            except IntegrityError:
+                db.rollback()
+                # A concurrent enrollment inserted the row first, update it on the second attempt
+                if attempt:
+                    raise
+        if self.loaded:
+            self.upsert(student_id, thumbnail)
+        return thumbnail
+
+    def rank(
+        self,
+        db: Session,
+        live_image: ImageLike,
+        top_k: Optional[int] = None,
+        student_ids: Optional[Sequence[int]] = None
+    ) -> List[Tuple[int, float]]:
+        """
+        Return (student_id, similarity percentage) for the closest reference thumbnails, best first
+
+        student_ids limits the comparison to those students, e.g. one section.
+        """
+        self.refresh(db)
+        size = self.thumbnails.size
+        if student_ids is None:
+            references, ids = self.thumbnails.data[:size], self.thumbnails.student_ids[:size]
+        else:
+            rows = [self.thumbnails.rows[student_id] for student_id in student_ids if student_id in self.thumbnails.rows]
+            references, ids = self.thumbnails.data[rows], self.thumbnails.student_ids[rows]
+        return simple_face_recognizer.rank_references(live_image, references, ids, top_k)
+
+# Create a global instance
+thumbnail_store = ThumbnailStore(check_seconds=float(os.getenv("THUMBNAIL_VERSION_CHECK_SECONDS", "5")))
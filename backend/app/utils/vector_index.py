@@ -0,0 +1,406 @@
+import os
+import json
+import threading
+from contextlib import contextmanager
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+import numpy as np
+from sqlalchemy.orm import Session
+
+from ..models.face_embedding import FaceEmbedding
+from ..models.student import Student
+from .embedding_store import embedding_store
+from .deepface_recognition import deepface_recognizer
+
+try:
+    import fcntl
+except ImportError:
+    # Windows has no flock, run a single worker process there
+    fcntl = None
+
+class IVFIndex:
+    """
+    Inverted-file (IVF) approximate nearest-neighbour index over face embeddings
+
+    The base segment is built by spherical k-means: vectors are grouped by their
+    nearest centroid and stored contiguously per list, so a search only scans
+    the nprobe lists closest to the query. Base arrays are .npy files opened
+    with mmap, so only the probed lists are paged in.
+
+    Inserts and deletes after a build go to an append-only delta log that is
+    scanned exhaustively and masks older base entries. Other processes pick up
+    new log records on their next search. Rebuilding folds the log back into a
+    fresh base segment. Appends hold index.lock shared and a rebuild holds it
+    exclusively while it copies the old log and swaps meta.json, so no update
+    lands in a log that is about to be dropped.
+
+    One instance may be used from several threads, e.g. through
+    asyncio.to_thread; its in-memory state is guarded by a lock.
+
+    Files in the index directory:
+        meta.json                  current generation, model and sizes
+        centroids-<gen>.npy        (nlist, dim) float32
+        offsets-<gen>.npy          (nlist + 1,) int64, list boundaries
+        vectors-<gen>.npy          (count, dim) float32, grouped by list
+        ids-<gen>.npy              (count,) int64 student ids
+        delta-<gen>.log            records of int64 id (negative = delete) + dim float32
+        index.lock                 flock between appends and rebuilds
+    """
+
+    def __init__(self, path: str, model_name: str, detector_backend: str, nprobe: Optional[int] = None):
+        self.path = path
+        self.model_name = model_name
+        self.detector_backend = detector_backend
+        self.nprobe = nprobe or int(os.getenv("FACE_INDEX_NPROBE", "16"))
+        self.generation = None
+        self.dimension = None
+        self._meta_mtime = None
+        self._lock = threading.RLock()
+        self._reset_delta()
+        self._set_empty_base()
+
+    # Layout
+
+    def _file(self, name: str, generation: Optional[int] = None) -> str:
+        if generation is not None:
+            stem, ext = os.path.splitext(name)
+            name = f"{stem}-{generation}{ext}"
+        return os.path.join(self.path, name)
+
+    @contextmanager
+    def _log_lock(self, exclusive: bool):
+        """Hold index.lock across processes, shared for appends and exclusive for a generation swap"""
+        if fcntl is None:
+            yield
+            return
+        os.makedirs(self.path, exist_ok=True)
+        with open(self._file("index.lock"), "a") as f:
+            fcntl.flock(f, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _record_dtype(self) -> np.dtype:
+        return np.dtype([("id", "<i8"), ("vector", "<f4", (self.dimension,))])
+
+    def _set_empty_base(self) -> None:
+        dimension = self.dimension or 0
+        self.centroids = np.zeros((0, dimension), dtype=np.float32)
+        self.offsets = np.zeros(1, dtype=np.int64)
+        self.vectors = np.zeros((0, dimension), dtype=np.float32)
+        self.ids = np.zeros(0, dtype=np.int64)
+
+    def _reset_delta(self) -> None:
+        self._log_offset = 0
+        self._delta: Dict[int, np.ndarray] = {}
+        self._masked: Set[int] = set()  # ids whose base entry is superseded by the log
+        self._delta_ids = np.zeros(0, dtype=np.int64)
+        self._delta_matrix = None
+        self._masked_array = np.zeros(0, dtype=np.int64)
+
+    # Loading and refreshing
+
+    def load(self) -> None:
+        """(Re)load the current generation from disk"""
+        with self._lock:
+            meta_path = self._file("meta.json")
+            self._reset_delta()
+            if not os.path.exists(meta_path):
+                self.generation = None
+                self._set_empty_base()
+                return
+
+            with open(meta_path) as f:
+                meta = json.load(f)
+            self._meta_mtime = os.stat(meta_path).st_mtime_ns
+            if meta["model_name"] != self.model_name or meta["detector_backend"] != self.detector_backend:
+                print(f"Face index at {self.path} was built for {meta['model_name']}, rebuild it for {self.model_name}")
+                self.generation = None
+                self._set_empty_base()
+                return
+
+            self.generation = meta["generation"]
+            self.dimension = meta["dimension"]
+            self.centroids = np.load(self._file("centroids.npy", self.generation))
+            self.offsets = np.load(self._file("offsets.npy", self.generation))
+            self.vectors = np.load(self._file("vectors.npy", self.generation), mmap_mode="r")
+            self.ids = np.load(self._file("ids.npy", self.generation), mmap_mode="r")
+            self._replay_log()
+
+    def refresh(self) -> None:
+        """Pick up a rebuild or new log records written by another process"""
+        with self._lock:
+            meta_path = self._file("meta.json")
+            try:
+                meta_mtime = os.stat(meta_path).st_mtime_ns
+            except FileNotFoundError:
+                meta_mtime = None
+            if meta_mtime != self._meta_mtime:
+                self.load()
+            elif self.generation is not None:
+                self._replay_log()
+
+    def _replay_log(self) -> None:
+        log_path = self._file("delta.log", self.generation)
+        try:
+            size = os.stat(log_path).st_size
+        except FileNotFoundError:
+            return
+        record_dtype = self._record_dtype()
+        # Only read whole records; a concurrent writer may be mid-append
+        count = (size - self._log_offset) // record_dtype.itemsize
+        if count <= 0:
+            return
+
+        records = np.fromfile(log_path, dtype=record_dtype, count=count, offset=self._log_offset)
+        self._log_offset += count * record_dtype.itemsize
+        for record_id, vector in zip(records["id"], records["vector"]):
+            student_id = abs(int(record_id))
+            self._masked.add(student_id)
+            if record_id > 0:
+                self._delta[student_id] = vector
+            else:
+                self._delta.pop(student_id, None)
+
+        self._delta_ids = np.fromiter(self._delta.keys(), dtype=np.int64, count=len(self._delta))
+        self._delta_matrix = np.stack(list(self._delta.values())) if self._delta else None
+        self._masked_array = np.fromiter(self._masked, dtype=np.int64, count=len(self._masked))
+
+    # Updates
+
+    def normalize(self, embedding) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm > 0 else vector
+
+    def _append(self, record_id: int, vector: Optional[np.ndarray]) -> None:
+        with self._lock:
+            self.refresh()
+            if self.generation is None:
+                if vector is None:
+                    return
+                # First write ever: create an empty base so the log has a home
+                self.dimension = len(vector)
+                self.build([])
+
+            with self._log_lock(exclusive=False):
+                # A rebuild may have swapped generations since the refresh above
+                self.refresh()
+                record = np.zeros(1, dtype=self._record_dtype())
+                record["id"] = record_id
+                if vector is not None:
+                    record["vector"] = vector
+                # A single O_APPEND write keeps records from concurrent writers intact
+                with open(self._file("delta.log", self.generation), "ab") as f:
+                    f.write(record.tobytes())
+            self._replay_log()
+
+    def add(self, student_id: int, embedding) -> None:
+        """Insert or replace a student's embedding"""
+        self._append(int(student_id), self.normalize(embedding))
+
+    def remove(self, student_id: int) -> None:
+        """Remove a student, e.g. when they are deactivated"""
+        self._append(-int(student_id), None)
+
+    # Search
+
+    def _top_k(self, ids: np.ndarray, scores: np.ndarray, top_k: int) -> List[Tuple[int, float]]:
+        if len(scores) == 0:
+            return []
+        top_k = min(top_k, len(scores))
+        top = np.argpartition(-scores, top_k - 1)[:top_k]
+        top = top[np.argsort(-scores[top])]
+        return [(int(ids[i]), float(scores[i])) for i in top]
+
+    def _scan(self, ids: np.ndarray, vectors: np.ndarray, query: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        scores = vectors @ query
+        if len(self._masked_array):
+            live = ~np.isin(ids, self._masked_array)
+            return ids[live], scores[live]
+        return np.asarray(ids), scores
+
+    def _delta_candidates(self, query: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        if self._delta_matrix is None:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+        return self._delta_ids, self._delta_matrix @ query
+
+    def search(self, embedding, top_k: int = 10, nprobe: Optional[int] = None) -> List[Tuple[int, float]]:
+        """Return up to top_k (student_id, cosine similarity) pairs, best first"""
+        with self._lock:
+            self.refresh()
+            query = self.normalize(embedding)
+            id_parts, score_parts = [], []
+
+            nlist = len(self.centroids)
+            if nlist:
+                nprobe = min(nprobe or self.nprobe, nlist)
+                probe = np.argpartition(-(self.centroids @ query), nprobe - 1)[:nprobe]
+                for list_no in probe:
+                    start, end = self.offsets[list_no], self.offsets[list_no + 1]
+                    if start == end:
+                        continue
+                    ids, scores = self._scan(self.ids[start:end], self.vectors[start:end], query)
+                    id_parts.append(ids)
+                    score_parts.append(scores)
+
+            ids, scores = self._delta_candidates(query)
+            id_parts.append(ids)
+            score_parts.append(scores)
+            return self._top_k(np.concatenate(id_parts), np.concatenate(score_parts), top_k)
+
+    def search_exact(self, embedding, top_k: int = 10) -> List[Tuple[int, float]]:
+        """Brute-force search over every vector, the ground truth for benchmarks"""
+        with self._lock:
+            self.refresh()
+            query = self.normalize(embedding)
+            base_ids, base_scores = self._scan(self.ids, self.vectors, query)
+            delta_ids, delta_scores = self._delta_candidates(query)
+            return self._top_k(
+                np.concatenate([base_ids, delta_ids]),
+                np.concatenate([base_scores, delta_scores]),
+                top_k
+            )
+
+    def __len__(self) -> int:
+        with self._lock:
+            self.refresh()
+            base_live = len(self.ids) - int(np.isin(self.ids, self._masked_array).sum()) if len(self._masked_array) else len(self.ids)
+            return base_live + len(self._delta)
+
+    # Building
+
+    def _kmeans(self, vectors: np.ndarray, nlist: int, iterations: int = 10) -> np.ndarray:
+        """Spherical k-means on normalized vectors"""
+        rng = np.random.default_rng(0)
+        centroids = vectors[rng.choice(len(vectors), nlist, replace=False)].copy()
+        for _ in range(iterations):
+            assignments = self._assign(vectors, centroids)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assignments, vectors)
+            norms = np.linalg.norm(sums, axis=1, keepdims=True)
+            # Empty lists keep their previous centroid
+            non_empty = norms[:, 0] > 0
+            centroids[non_empty] = sums[non_empty] / norms[non_empty]
+        return centroids
+
+    def _assign(self, vectors: np.ndarray, centroids: np.ndarray, block: int = 8192) -> np.ndarray:
+        assignments = np.empty(len(vectors), dtype=np.int64)
+        for start in range(0, len(vectors), block):
+            assignments[start:start + block] = np.argmax(vectors[start:start + block] @ centroids.T, axis=1)
+        return assignments
+
+    def log_position(self) -> int:
+        """Current size of the delta log, taken before reading the rebuild source"""
+        with self._lock:
+            self.refresh()
+            if self.generation is None:
+                return 0
+            try:
+                return os.path.getsize(self._file("delta.log", self.generation))
+            except FileNotFoundError:
+                return 0
+
+    def build(
+        self,
+        items: Iterable[Tuple[int, np.ndarray]],
+        nlist: Optional[int] = None,
+        log_start: Optional[int] = None
+    ) -> int:
+        """
+        Write a new base generation from (student_id, embedding) pairs
+
+        Log records appended after log_start (by default, the log size when the
+        build starts) are carried over into the new generation's log, so updates
+        made while the source was being read are not lost. Returns the number of
+        indexed vectors.
+        """
+        with self._lock:
+            os.makedirs(self.path, exist_ok=True)
+            self.refresh()
+            old_generation = self.generation
+            old_log = self._file("delta.log", old_generation) if old_generation is not None else None
+            old_log_start = log_start if log_start is not None else self.log_position()
+
+            items = list(items)
+            ids = np.array([student_id for student_id, _ in items], dtype=np.int64)
+            if items:
+                vectors = np.stack([self.normalize(vector) for _, vector in items])
+                self.dimension = vectors.shape[1]
+            else:
+                vectors = np.zeros((0, self.dimension or 0), dtype=np.float32)
+
+            if len(vectors):
+                nlist = min(nlist or int(os.getenv("FACE_INDEX_NLIST", "0")) or max(1, int(4 * np.sqrt(len(vectors)))), len(vectors))
+                centroids = self._kmeans(vectors, nlist)
+                assignments = self._assign(vectors, centroids)
+                order = np.argsort(assignments, kind="stable")
+                vectors, ids = vectors[order], ids[order]
+                offsets = np.zeros(nlist + 1, dtype=np.int64)
+                offsets[1:] = np.cumsum(np.bincount(assignments, minlength=nlist))
+            else:
+                centroids = np.zeros((0, vectors.shape[1]), dtype=np.float32)
+                offsets = np.zeros(1, dtype=np.int64)
+
+            generation = (old_generation or 0) + 1
+            np.save(self._file("centroids.npy", generation), centroids.astype(np.float32))
+            np.save(self._file("offsets.npy", generation), offsets)
+            np.save(self._file("vectors.npy", generation), vectors.astype(np.float32))
+            np.save(self._file("ids.npy", generation), ids)
+
+            meta = {
+                "generation": generation,
+                "model_name": self.model_name,
+                "detector_backend": self.detector_backend,
+                "dimension": self.dimension,
+                "nlist": len(centroids),
+                "count": len(ids)
+            }
+            # Appends wait until the new generation is live, so none land in the old log after the copy
+            with self._log_lock(exclusive=True):
+                # Carry over log records written since the build started
+                with open(self._file("delta.log", generation), "wb") as new_log:
+                    if old_log and os.path.exists(old_log):
+                        with open(old_log, "rb") as f:
+                            f.seek(old_log_start)
+                            new_log.write(f.read())
+
+                meta_tmp = self._file("meta.json.tmp")
+                with open(meta_tmp, "w") as f:
+                    json.dump(meta, f)
+                os.replace(meta_tmp, self._file("meta.json"))
+
+            # Processes still holding the old mmaps keep them until they reload
+            if old_generation is not None:
+                for name in ("centroids.npy", "offsets.npy", "vectors.npy", "ids.npy", "delta.log"):
+                    try:
+                        os.unlink(self._file(name, old_generation))
+                    except FileNotFoundError:
+                        pass
+
+            self.load()
+            return len(ids)
+
+def load_enrolled_embeddings(db: Session, model_name: str, detector_backend: str) -> List[Tuple[int, np.ndarray]]:
+    """Active students' enrolled embeddings, the source of truth for index rebuilds"""
+    records = db.query(FaceEmbedding.student_id, FaceEmbedding.embedding).join(
+        Student, Student.id == FaceEmbedding.student_id
+    ).filter(
+        Student.is_active == True,
+        FaceEmbedding.model_name == model_name,
+        FaceEmbedding.detector_backend == detector_backend
+    ).all()
+    return [(record.student_id, embedding_store.from_bytes(record.embedding)) for record in records]
+
+def rebuild_face_index(db: Session) -> int:
+    """Rebuild the school-wide face index from the face_embeddings table"""
+    log_start = face_index.log_position()
+    items = load_enrolled_embeddings(db, face_index.model_name, face_index.detector_backend)
+    return face_index.build(items, log_start=log_start)
+
+# Create a global instance
+face_index = IVFIndex(
+    os.getenv("FACE_INDEX_DIR", "face_index"),
+    deepface_recognizer.model_name,
+    deepface_recognizer.detector_backend
+)
@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+"""
+Load test for the async database layer
+
+Fills a temporary SQLite database with students and attendance records and
+drives a mix of logins and attendance history requests at it concurrently,
+once through handlers that use the blocking session inside `async def` (how
+/token and the history endpoint used to work) and once through the async
+session. Besides throughput it measures event loop lag with a heartbeat
+task, which is what every other request on the server waits for.
+
+Usage:
+    python bench_async_db.py --requests 400 --concurrency 32
+"""
+import os
+import sys
+import time
+import asyncio
+import argparse
+import tempfile
+import statistics
+sys.path.append('.')
+
+# Point the app at a throwaway database before it creates its engines
+os.environ["DATABASE_URL"] = f"sqlite:///{tempfile.mkdtemp(prefix='bench_db_')}/bench.db"
+
+import httpx
+from fastapi import Depends, FastAPI, HTTPException, Form
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.database.database import Base, SessionLocal, engine, get_async_db
+from app.models.attendance import Attendance
+from app.models.student import Student
+from app.utils.security import get_password_hash, verify_password
+
+def seed(students: int, records_per_student: int) -> None:
+    Base.metadata.create_all(bind=engine)
+    hashed = get_password_hash("password")
+    db = SessionLocal()
+    db.add_all(
+        Student(id=i, email=f"student{i}@example.com", name=f"Student {i}", hashed_password=hashed,
+                class_name="CS", section="A", semester=1)
+        for i in range(1, students + 1)
+    )
+    db.add_all(
+        Attendance(student_id=i, subject=f"Subject {j % 5}", status="Present", face_matched=True)
+        for i in range(1, students + 1) for j in range(records_per_student)
+    )
+    db.commit()
+    db.close()
+
+def history_rows(records) -> list:
+    return [{"id": r.id, "subject": r.subject, "status": r.status} for r in records]
+
+app = FastAPI()
+
+# The blocking handlers close their session before returning. With Depends(get_db)
+# the session is closed by the event loop after the response, so once the pool
+# is exhausted a blocked handler waits for a connection the loop can never return.
+@app.post("/blocking/token")
+async def blocking_token(username: str = Form(...), password: str = Form(...)):
+    with SessionLocal() as db:
+        user = db.query(Student).filter(Student.email == username).first()
+        if not user or not verify_password(password, user.hashed_password):
+            raise HTTPException(status_code=401)
+    return {"ok": True}
+
+@app.get("/blocking/attendance/student/{student_id}")
+async def blocking_history(student_id: int):
+    with SessionLocal() as db:
+        return history_rows(db.query(Attendance).filter(Attendance.student_id == student_id).all())
+
+@app.post("/async/token")
+async def async_token(username: str = Form(...), password: str = Form(...), db: AsyncSession = Depends(get_async_db)):
+    user = await db.scalar(select(Student).where(Student.email == username))
+    if not user or not await asyncio.to_thread(verify_password, password, user.hashed_password):
+        raise HTTPException(status_code=401)
+    return {"ok": True}
+
+@app.get("/async/attendance/student/{student_id}")
+async def async_history(student_id: int, db: AsyncSession = Depends(get_async_db)):
+    records = await db.scalars(select(Attendance).where(Attendance.student_id == student_id))
+    return history_rows(records.all())
+
+async def heartbeat(lags: list, stop: asyncio.Event, interval: float = 0.005) -> None:
+    """Record how late a 5 ms sleep wakes up, i.e. how long the loop was blocked"""
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        lags.append((time.perf_counter() - start - interval) * 1000)
+
+async def run(prefix: str, args) -> dict:
+    transport = httpx.ASGITransport(app=app)
+    semaphore = asyncio.Semaphore(args.concurrency)
+    latencies = []
+
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        async def one(i: int) -> None:
+            student_id = i % args.students + 1
+            async with semaphore:
+                start = time.perf_counter()
+                # One login for every login_every history requests
+                if i % args.login_every == 0:
+                    response = await client.post(f"{prefix}/token", data={
+                        "username": f"student{student_id}@example.com", "password": "password"
+                    })
+                else:
+                    response = await client.get(f"{prefix}/attendance/student/{student_id}")
+                response.raise_for_status()
+                latencies.append((time.perf_counter() - start) * 1000)
+
+        lags = []
+        stop = asyncio.Event()
+        monitor = asyncio.create_task(heartbeat(lags, stop))
+        start = time.perf_counter()
+        await asyncio.gather(*(one(i) for i in range(args.requests)))
+        elapsed = time.perf_counter() - start
+        stop.set()
+        await monitor
+
+    latencies.sort()
+    return {
+        "throughput": args.requests / elapsed,
+        "p50": statistics.median(latencies),
+        "p95": latencies[int(len(latencies) * 0.95) - 1],
+        "lag_max": max(lags, default=0.0),
+        "lag_mean": statistics.mean(lags) if lags else 0.0,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--students', type=int, default=200)
+    parser.add_argument('--records-per-student', type=int, default=50)
+    parser.add_argument('--requests', type=int, default=400)
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--login-every', type=int, default=10)
+    args = parser.parse_args()
+
+    seed(args.students, args.records_per_student)
+    print(f"🔍 {args.students} students, {args.students * args.records_per_student} attendance records, "
+          f"{args.requests} requests at concurrency {args.concurrency}\n")
+
+    print(f"{'session':>10} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'max lag ms':>11} {'mean lag ms':>12}")
+    for name in ("blocking", "async"):
+        result = asyncio.run(run(f"/{name}", args))
+        print(f"{name:>10} {result['throughput']:>8.1f} {result['p50']:>8.1f} {result['p95']:>8.1f} "
+              f"{result['lag_max']:>11.1f} {result['lag_mean']:>12.2f}")
+
+if __name__ == "__main__":
+    main()
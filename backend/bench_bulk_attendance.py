@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+Throughput benchmark for bulk attendance ingestion
+
+Posts NDJSON and CSV batches of attendance records to /attendance/bulk/
+against a temporary SQLite database and reports rows per second, next to
+replaying the same records one request and one commit at a time, which is
+what an offline kiosk had to do before.
+
+Usage:
+    python bench_bulk_attendance.py --students 500 --batch-sizes 100 1000 10000
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import tempfile
+sys.path.append('.')
+
+# Throwaway database, and no face model loading: this only exercises the write path
+os.environ["DATABASE_URL"] = f"sqlite:///{tempfile.mkdtemp(prefix='bench_bulk_')}/bench.db"
+os.environ.setdefault("INFERENCE_WORKERS", "0")
+os.environ.setdefault("FACE_MODEL_WARMUP", "false")
+# Batches are posted as student 1, acting as a staff kiosk that imports for everyone
+os.environ["STAFF_EMAILS"] = "student1@example.com"
+
+import httpx
+
+from app.main import app
+from app.database.database import SessionLocal
+from app.models.student import Student
+from app.utils.security import create_access_token
+
+SUBJECTS = ["Math", "Physics", "Chemistry", "English", "History"]
+
+def seed(students: int) -> None:
+    db = SessionLocal()
+    db.add_all(
+        Student(id=i, email=f"student{i}@example.com", name=f"Student {i}", hashed_password="x",
+                class_name="CS", section=f"S{i % 10}", semester=1)
+        for i in range(1, students + 1)
+    )
+    db.commit()
+    db.close()
+
+def make_records(count: int, students: int):
+    return [
+        {
+            "student_id": i % students + 1,
+            "subject": SUBJECTS[i % len(SUBJECTS)],
+            "status": "Present" if i % 4 else "Absent",
+            "timestamp": f"2026-{i % 12 + 1:02d}-{i % 28 + 1:02d}T09:00:00",
+            "face_matched": bool(i % 4),
+            "face_confidence": 90.0 if i % 4 else 0.0
+        }
+        for i in range(count)
+    ]
+
+def as_ndjson(records) -> bytes:
+    return "\n".join(json.dumps(record) for record in records).encode()
+
+def as_csv(records) -> bytes:
+    lines = [",".join(records[0])]
+    lines.extend(",".join(str(value) for value in record.values()) for record in records)
+    return "\n".join(lines).encode()
+
+async def post_batch(client: httpx.AsyncClient, body: bytes, content_type: str) -> dict:
+    response = await client.post("/attendance/bulk/", content=body, headers={"content-type": content_type})
+    response.raise_for_status()
+    return response.json()
+
+async def run(args) -> None:
+    transport = httpx.ASGITransport(app=app)
+    headers = {"authorization": f"Bearer {create_access_token({'sub': 'student1@example.com'})}"}
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", headers=headers, timeout=None) as client:
+        print(f"{'mode':>22} {'records':>8} {'seconds':>8} {'rows/s':>9}")
+
+        records = make_records(args.single_records, args.students)
+        start = time.perf_counter()
+        for record in records:
+            await post_batch(client, as_ndjson([record]), "application/x-ndjson")
+        elapsed = time.perf_counter() - start
+        print(f"{'one per request':>22} {len(records):>8} {elapsed:>8.2f} {len(records) / elapsed:>9.0f}")
+
+        for batch_size in args.batch_sizes:
+            records = make_records(batch_size, args.students)
+            for name, body, content_type in (
+                ("ndjson", as_ndjson(records), "application/x-ndjson"),
+                ("csv", as_csv(records), "text/csv"),
+            ):
+                start = time.perf_counter()
+                result = await post_batch(client, body, content_type)
+                elapsed = time.perf_counter() - start
+                assert result["created"] == batch_size, result["results"][:3]
+                label = f"{name} batch of {batch_size}"
+                print(f"{label:>22} {batch_size:>8} {elapsed:>8.2f} {batch_size / elapsed:>9.0f}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--students', type=int, default=500)
+    parser.add_argument('--single-records', type=int, default=300)
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=[100, 1000, 10000])
+    args = parser.parse_args()
+
+    seed(args.students)
+    asyncio.run(run(args))
+
+if __name__ == "__main__":
+    main()
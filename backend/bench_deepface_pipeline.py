@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark for the DeepFace input pipeline
+
+Compares the old temp-file path (full-resolution decode -> cv2.imwrite to a
+temporary JPEG -> DeepFace reads the file back) with the in-memory path
+(downscaling decode -> numpy array handed straight to DeepFace). Reports
+per-request latency and the number of read/write syscalls taken from
+/proc/self/io (Linux only).
+
+Usage:
+    python bench_deepface_pipeline.py                               # pipeline overhead only
+    python bench_deepface_pipeline.py --model --image face.jpg      # include DeepFace.represent
+
+Without --image a random-noise photo is used. It has no face, so with --model
+both paths skip face enforcement and embed the whole frame.
+"""
+import os
+import sys
+import io
+import time
+import base64
+import argparse
+import tempfile
+import statistics
+sys.path.append('.')
+
+import cv2
+import numpy as np
+from PIL import Image
+from deepface import DeepFace
+
+from app.utils.deepface_recognition import deepface_recognizer
+from app.utils.image_preprocessing import decode_image
+
+def make_test_image(width: int, height: int) -> str:
+    """Create a noisy JPEG so the codec does real work, returned as base64"""
+    rng = np.random.default_rng(0)
+    pixels = rng.integers(0, 255, size=(height, width, 3), dtype=np.uint8)
+    img_bytes = io.BytesIO()
+    Image.fromarray(pixels).save(img_bytes, format='JPEG', quality=90)
+    return base64.b64encode(img_bytes.getvalue()).decode('utf-8')
+
+def read_syscall_counters() -> tuple:
+    """Return (read syscalls, write syscalls) for this process"""
+    try:
+        with open('/proc/self/io') as f:
+            counters = dict(line.split(': ') for line in f.read().splitlines())
+        return int(counters['syscr']), int(counters['syscw'])
+    except (OSError, KeyError):
+        return 0, 0
+
+def load_test_image(path: str) -> str:
+    with open(path, 'rb') as f:
+        return base64.b64encode(f.read()).decode('utf-8')
+
+def legacy_decode(image_base64: str) -> np.ndarray:
+    """The previous decoder: the whole image at full resolution, no downscaling"""
+    if image_base64.startswith('data:image'):
+        image_base64 = image_base64.split(',')[1]
+    pil_image = Image.open(io.BytesIO(base64.b64decode(image_base64)))
+    if pil_image.mode != 'RGB':
+        pil_image = pil_image.convert('RGB')
+    return cv2.cvtColor(np.array(pil_image), cv2.COLOR_RGB2BGR)
+
+def represent(img):
+    # Both paths run the same model call, only the input handling differs
+    return DeepFace.represent(
+        img_path=img,
+        model_name=deepface_recognizer.model_name,
+        detector_backend=deepface_recognizer.detector_backend,
+        enforce_detection=False
+    )
+
+def legacy_pipeline(image_base64: str, run_model: bool):
+    """The previous implementation: write a temporary JPEG and let DeepFace load it"""
+    img = legacy_decode(image_base64)
+    with tempfile.NamedTemporaryFile(suffix='.jpg', delete=False) as temp_file:
+        cv2.imwrite(temp_file.name, img)
+        temp_path = temp_file.name
+    try:
+        if run_model:
+            return represent(temp_path)
+        # This is what DeepFace does with a path before detection
+        return cv2.imread(temp_path)
+    finally:
+        os.unlink(temp_path)
+
+def in_memory_pipeline(image_base64: str, run_model: bool):
+    """The current implementation: pass the decoded array straight through"""
+    img = decode_image(image_base64)
+    if run_model:
+        return represent(img)
+    return img
+
+def measure(name: str, fn, image_base64: str, iterations: int, run_model: bool):
+    # Warm-up so lazy imports and model builds are not counted
+    fn(image_base64, run_model)
+
+    latencies = []
+    reads_before, writes_before = read_syscall_counters()
+    for _ in range(iterations):
+        start = time.perf_counter()
+        fn(image_base64, run_model)
+        latencies.append((time.perf_counter() - start) * 1000)
+    reads_after, writes_after = read_syscall_counters()
+
+    latencies.sort()
+    print(f"{name}:")
+    print(f"  mean latency:  {statistics.mean(latencies):8.2f} ms")
+    print(f"  p95 latency:   {latencies[int(len(latencies) * 0.95) - 1]:8.2f} ms")
+    print(f"  read syscalls/request:  {(reads_after - reads_before) / iterations:6.1f}")
+    print(f"  write syscalls/request: {(writes_after - writes_before) / iterations:6.1f}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--width', type=int, default=1280)
+    parser.add_argument('--height', type=int, default=960)
+    parser.add_argument('--iterations', type=int, default=50)
+    parser.add_argument('--model', action='store_true', help='include the DeepFace embedding step')
+    parser.add_argument('--image', help='photo of a face to use instead of generated noise')
+    args = parser.parse_args()
+
+    if args.image:
+        image_base64 = load_test_image(args.image)
+        print(f"🔍 Benchmarking {args.image}, {args.iterations} iterations\n")
+    else:
+        image_base64 = make_test_image(args.width, args.height)
+        print(f"🔍 Benchmarking {args.width}x{args.height} image, {args.iterations} iterations\n")
+    measure("Temp-file JPEG round trip (before)", legacy_pipeline, image_base64, args.iterations, args.model)
+    measure("In-memory numpy arrays (after)", in_memory_pipeline, image_base64, args.iterations, args.model)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""
+Recall vs latency benchmark for the IVF face index
+
+Builds an index over synthetic clustered 512-d embeddings (ArcFace size) in a
+temporary directory and compares IVF search at several nprobe values with
+exact brute-force search.
+
+Usage:
+    python bench_vector_index.py --count 20000 --queries 200
+"""
+import sys
+import time
+import argparse
+import tempfile
+import statistics
+sys.path.append('.')
+
+import numpy as np
+
+from app.utils.vector_index import IVFIndex
+
+def make_embeddings(count: int, dimension: int, clusters: int, seed: int = 0):
+    """Clustered vectors, closer to real face embeddings than uniform noise"""
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(clusters, dimension))
+    labels = rng.integers(0, clusters, size=count)
+    return (centers[labels] + 0.6 * rng.normal(size=(count, dimension))).astype(np.float32), rng
+
+def timed_search(search, queries, top_k):
+    latencies = []
+    results = []
+    for query in queries:
+        start = time.perf_counter()
+        results.append(search(query, top_k))
+        latencies.append((time.perf_counter() - start) * 1000)
+    return results, latencies
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--count', type=int, default=20000)
+    parser.add_argument('--dimension', type=int, default=512)
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--top-k', type=int, default=10)
+    parser.add_argument('--nprobe', type=int, nargs='+', default=[1, 4, 8, 16, 32, 64])
+    args = parser.parse_args()
+
+    vectors, rng = make_embeddings(args.count, args.dimension, clusters=max(1, args.count // 100))
+    # Queries are noisy copies of enrolled faces, like a live photo of an enrolled student
+    picks = rng.integers(0, args.count, size=args.queries)
+    queries = vectors[picks] + 0.3 * rng.normal(size=(args.queries, args.dimension)).astype(np.float32)
+
+    index = IVFIndex(tempfile.mkdtemp(prefix="face_index_"), "ArcFace", "retinaface")
+    start = time.perf_counter()
+    index.build((student_id + 1, vector) for student_id, vector in enumerate(vectors))
+    print(f"🔍 Built index: {args.count} vectors, {len(index.centroids)} lists in {time.perf_counter() - start:.1f}s\n")
+
+    exact, exact_latencies = timed_search(index.search_exact, queries, args.top_k)
+    print(f"{'search':>12} {'recall@' + str(args.top_k):>10} {'mean ms':>9} {'p95 ms':>8}")
+    print(f"{'exact':>12} {1.0:>10.3f} {statistics.mean(exact_latencies):>9.3f} "
+          f"{sorted(exact_latencies)[int(len(exact_latencies) * 0.95) - 1]:>8.3f}")
+
+    for nprobe in args.nprobe:
+        approx, latencies = timed_search(
+            lambda query, top_k: index.search(query, top_k, nprobe=nprobe), queries, args.top_k
+        )
+        recall = statistics.mean(
+            len({i for i, _ in got} & {i for i, _ in truth}) / len(truth)
+            for got, truth in zip(approx, exact)
+        )
+        print(f"{'nprobe=' + str(nprobe):>12} {recall:>10.3f} {statistics.mean(latencies):>9.3f} "
+              f"{sorted(latencies)[int(len(latencies) * 0.95) - 1]:>8.3f}")
+
+if __name__ == "__main__":
+    main()
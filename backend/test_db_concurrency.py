@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+"""
+Test that face endpoints do not hold database connections during inference
+
+Runs more concurrent /face-verify/, /face-enroll/, /attendance/ and
+/attendance/classroom/ requests than the connection pool has connections (pool_size + max_overflow),
+against a temporary SQLite database, with inference replaced by a sleep. A
+handler that kept its connection while waiting on inference would exhaust
+the pool and either block the event loop or time out after DB_POOL_TIMEOUT.
+"""
+import os
+import io
+import sys
+import time
+import base64
+import asyncio
+import tempfile
+sys.path.append('.')
+
+# Throwaway database and photo storage, and no face model loading
+os.environ["DATABASE_URL"] = f"sqlite:///{tempfile.mkdtemp(prefix='test_db_')}/test.db"
+os.environ["PHOTO_STORAGE_DIR"] = tempfile.mkdtemp(prefix='test_photos_')
+os.environ["FACE_INDEX_DIR"] = tempfile.mkdtemp(prefix='test_face_index_')
+os.environ["INFERENCE_WORKERS"] = "0"
+os.environ["FACE_MODEL_WARMUP"] = "false"
+os.environ["VERIFY_CACHE_MAX_ENTRIES"] = "0"
+
+import httpx
+import numpy as np
+from PIL import Image
+
+INFERENCE_SECONDS = 1.0
+
+def make_image(color) -> str:
+    img = Image.new('RGB', (160, 160), color=color)
+    img_bytes = io.BytesIO()
+    img.save(img_bytes, format='JPEG')
+    return base64.b64encode(img_bytes.getvalue()).decode('utf-8')
+
+async def fake_embed(image):
+    """Stands in for ArcFace: slow, and the same vector for every image"""
+    await asyncio.sleep(INFERENCE_SECONDS)
+    return {"success": True, "embedding": np.ones(512, dtype=np.float32)}
+
+async def fake_inference(method_name, *args):
+    """Stands in for the classroom face detector: slow, and one face"""
+    await asyncio.sleep(INFERENCE_SECONDS)
+    return {"success": True, "faces": [{"embedding": np.ones(512, dtype=np.float32)}]}
+
+async def test_db_concurrency():
+    print("🔍 Testing face endpoints under more concurrency than the pool allows...")
+
+    from app.main import app
+    from app.database.database import SessionLocal, async_engine
+    from app.models.student import Student
+    from app.utils.batch_scheduler import embedding_batcher
+    from app.utils.embedding_store import embedding_store
+    from app.utils.inference_executor import inference_executor
+    from app.utils.security import create_access_token
+    embedding_batcher.embed = fake_embed
+    inference_executor.run = fake_inference
+
+    pool = async_engine.pool
+    connections = pool.size() + pool._max_overflow
+    requests = connections + 5
+    print(f"  Pool allows {connections} connections, sending {requests} requests of each kind")
+
+    db = SessionLocal()
+    db.add_all(
+        Student(id=i, email=f"student{i}@example.com", name=f"Student {i}", hashed_password="x",
+                class_name="CS", section="A", semester=1)
+        for i in range(1, requests + 1)
+    )
+    db.commit()
+    for i in range(1, requests + 1):
+        embedding_store.save(db, i, np.ones(512), model_name="ArcFace", detector_backend="retinaface")
+    db.close()
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test", timeout=None) as client:
+        live = make_image('red')
+
+        start = time.perf_counter()
+        responses = await asyncio.gather(*(
+            client.post("/face-verify/", data={"live_image": live, "student_id": i})
+            for i in range(1, requests + 1)
+        ))
+        elapsed = time.perf_counter() - start
+        results = [response.json() for response in responses]
+        assert all(result["success"] and result["is_verified"] for result in results), results[:3]
+        # Every request sleeps once; serialized on the pool it would take several times as long
+        assert elapsed < INFERENCE_SECONDS * 4, elapsed
+        print(f"✅ {requests} enrolled verifications in {elapsed:.2f}s")
+
+        start = time.perf_counter()
+        responses = await asyncio.gather(*(
+            client.post(
+                "/face-enroll/",
+                data={"reference_image": live, "student_id": i},
+                headers={"Authorization": f"Bearer {create_access_token({'sub': f'student{i}@example.com'})}"}
+            )
+            for i in range(1, requests + 1)
+        ))
+        elapsed = time.perf_counter() - start
+        assert all(response.status_code == 200 for response in responses), responses[0].text
+        assert elapsed < INFERENCE_SECONDS * 4, elapsed
+        print(f"✅ {requests} enrollments in {elapsed:.2f}s")
+
+        # Re-enrolling one student concurrently must replace the embedding, not hit the unique constraint
+        token = create_access_token({'sub': 'student1@example.com'})
+        responses = await asyncio.gather(*(
+            client.post(
+                "/face-enroll/",
+                data={"reference_image": live, "student_id": 1},
+                headers={"Authorization": f"Bearer {token}"}
+            )
+            for _ in range(requests)
+        ))
+        assert all(response.status_code == 200 for response in responses), [response.text for response in responses if response.status_code != 200][:1]
+        print(f"✅ {requests} concurrent re-enrollments of one student")
+
+        start = time.perf_counter()
+        photo = base64.b64decode(live)
+        responses = await asyncio.gather(*(
+            client.post(
+                "/attendance/",
+                data={"student_id": i, "subject": "Math", "status": "Present"},
+                files={"photo1": ("1.jpg", photo, "image/jpeg"), "photo2": ("2.jpg", photo, "image/jpeg")}
+            )
+            for i in range(1, requests + 1)
+        ))
+        elapsed = time.perf_counter() - start
+        assert all(response.status_code == 200 for response in responses), responses[0].text
+        assert all(response.json()["face_matched"] for response in responses)
+        # This handler uses the async pool, which queues instead of failing: holding
+        # connections through inference would run the requests in two waves
+        assert elapsed < INFERENCE_SECONDS * 2, elapsed
+        print(f"✅ {requests} attendance records in {elapsed:.2f}s")
+
+        start = time.perf_counter()
+        responses = await asyncio.gather(*(
+            client.post(
+                "/attendance/classroom/",
+                data={"class_name": "CS", "section": "A", "subject": f"Subject {i}"},
+                files={"photo": ("class.jpg", base64.b64decode(live), "image/jpeg")}
+            )
+            for i in range(requests)
+        ))
+        elapsed = time.perf_counter() - start
+        assert all(response.status_code == 200 for response in responses), responses[0].text
+        assert all(len(response.json()["present_student_ids"]) == 1 for response in responses)
+        assert elapsed < INFERENCE_SECONDS * 4, elapsed
+        print(f"✅ {requests} classroom photos in {elapsed:.2f}s")
+
+    print("🎉 Face endpoints release their connections during inference")
+    return True
+
+if __name__ == "__main__":
+    asyncio.run(test_db_concurrency())
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+Test the Azure FaceAPI client against a local mock endpoint
+
+Starts an aiohttp server that answers /face/v1.0/detect and /face/v1.0/verify
+and points AZURE_FACE_ENDPOINT at it. Checks that both detect calls run
+concurrently, that face IDs are cached by image hash and that requests reuse
+pooled connections.
+"""
+import os
+import sys
+import asyncio
+import hashlib
+sys.path.append('.')
+
+from aiohttp import web
+
+class MockFaceAPI:
+    """Counts requests and client connections, returns a face ID per image hash"""
+
+    def __init__(self):
+        self.detect_calls = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.client_ports = set()
+
+    async def detect(self, request: web.Request) -> web.Response:
+        self.client_ports.add(request.transport.get_extra_info('peername')[1])
+        self.detect_calls += 1
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(0.1)
+            image_data = await request.read()
+            if image_data == b'no-face':
+                return web.json_response([])
+            return web.json_response([{"faceId": hashlib.sha256(image_data).hexdigest()[:32]}])
+        finally:
+            self.in_flight -= 1
+
+    async def verify(self, request: web.Request) -> web.Response:
+        self.client_ports.add(request.transport.get_extra_info('peername')[1])
+        body = await request.json()
+        is_identical = body["faceId1"] == body["faceId2"]
+        return web.json_response({"isIdentical": is_identical, "confidence": 0.95 if is_identical else 0.1})
+
+async def test_face_api():
+    print("🔍 Testing FaceAPI client against a mock endpoint...")
+
+    mock = MockFaceAPI()
+    app = web.Application()
+    app.router.add_post('/face/v1.0/detect', mock.detect)
+    app.router.add_post('/face/v1.0/verify', mock.verify)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, '127.0.0.1', 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+
+    os.environ['AZURE_FACE_ENDPOINT'] = f'http://127.0.0.1:{port}'
+    os.environ['AZURE_FACE_KEY'] = 'test-key'
+    from app.utils.face_api import FaceAPI
+    client = FaceAPI()
+
+    try:
+        result = await client.compare_face_images(b'reference-photo', b'reference-photo')
+        assert result["success"] and result["confidence"] == 0.95, result
+        assert mock.max_in_flight == 2, mock.max_in_flight
+        print(f"✅ Both detect calls ran concurrently ({mock.max_in_flight} in flight)")
+
+        detect_calls = mock.detect_calls
+        result = await client.compare_face_images(b'reference-photo', b'live-photo')
+        assert not result["success"], result
+        assert mock.detect_calls == detect_calls + 1, mock.detect_calls
+        print("✅ Cached face ID reused for the repeated reference image")
+
+        result = await client.compare_face_images(b'reference-photo', b'no-face')
+        assert result["message"] == "No face detected in second image", result
+        print(f"✅ {result['message']}")
+
+        for i in range(10):
+            await client.compare_face_images(b'reference-photo', f'live-{i}'.encode())
+        assert len(mock.client_ports) <= 2, mock.client_ports
+        print(f"✅ All requests served over {len(mock.client_ports)} pooled connections")
+    finally:
+        await client.close()
+        await runner.cleanup()
+
+if __name__ == "__main__":
+    asyncio.run(test_face_api())
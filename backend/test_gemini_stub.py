@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+Test the Gemini client against a local stub server
+
+Starts an aiohttp server that answers like the generateContent endpoint and
+points GEMINI_API_BASE at it, so no API key or network access is needed.
+Checks payload downscaling, verdict caching, the concurrency limit and the
+circuit breaker.
+"""
+import os
+import sys
+import io
+import base64
+import asyncio
+sys.path.append('.')
+
+from aiohttp import web
+from PIL import Image
+
+class StubGemini:
+    """Records requests and answers with a canned verdict"""
+
+    def __init__(self):
+        self.requests = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.image_sizes = []
+        self.fail = False
+
+    async def generate_content(self, request: web.Request) -> web.Response:
+        self.requests += 1
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(0.05)
+            if self.fail:
+                return web.json_response({"error": {"message": "unavailable"}}, status=503)
+            body = await request.json()
+            for part in body["contents"][0]["parts"][1:]:
+                image = Image.open(io.BytesIO(base64.b64decode(part["inline_data"]["data"])))
+                self.image_sizes.append(image.size)
+            text = "1. YES, these are the same person. 2. Confidence: 92% 3. Same facial structure."
+            return web.json_response({"candidates": [{"content": {"parts": [{"text": text}]}}]})
+        finally:
+            self.in_flight -= 1
+
+def make_image(color, size=(2000, 1500)) -> str:
+    img = Image.new('RGB', size, color=color)
+    img_bytes = io.BytesIO()
+    img.save(img_bytes, format='JPEG')
+    return base64.b64encode(img_bytes.getvalue()).decode('utf-8')
+
+async def test_gemini_client():
+    print("🔍 Testing Gemini client against a stub server...")
+
+    stub = StubGemini()
+    app = web.Application()
+    app.router.add_post('/v1beta/models/{model}:generateContent', stub.generate_content)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, '127.0.0.1', 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+
+    os.environ['GOOGLE_API_KEY'] = 'test-key'
+    os.environ['GEMINI_API_BASE'] = f'http://127.0.0.1:{port}'
+    os.environ['GEMINI_MAX_CONCURRENCY'] = '2'
+    os.environ['GEMINI_REQUESTS_PER_MINUTE'] = '6000'
+    os.environ['GEMINI_BURST'] = '20'
+    os.environ['GEMINI_BREAKER_FAILURES'] = '3'
+    from app.utils.google_face_recognition import GoogleFaceRecognition, GeminiUnavailable
+    recognizer = GoogleFaceRecognition()
+
+    try:
+        reference = make_image('red')
+        result = await recognizer.verify_faces(reference, make_image('blue'))
+        print(f"  Verdict: {result['match_status']} at {result['similarity_percentage']}%")
+        assert result["success"] and result["match_status"] == "MATCH", result
+        assert max(max(size) for size in stub.image_sizes) <= recognizer.image_max_side, stub.image_sizes
+        print(f"✅ Images sent at {stub.image_sizes[0]} instead of (2000, 1500)")
+
+        await recognizer.verify_faces(reference, make_image('blue'))
+        assert stub.requests == 1, stub.requests
+        print("✅ Repeated image pair answered from the verdict cache")
+
+        await asyncio.gather(*[
+            recognizer.verify_faces(reference, make_image((i, 0, 0))) for i in range(8)
+        ])
+        assert stub.max_in_flight <= 2, stub.max_in_flight
+        print(f"✅ Concurrency capped at {stub.max_in_flight} requests in flight")
+
+        stub.fail = True
+        requests_before = stub.requests
+        for i in range(6):
+            result = await recognizer.verify_faces(reference, make_image((0, i, 200)))
+        assert stub.requests - requests_before == 3, stub.requests - requests_before
+        print(f"✅ Circuit breaker opened after 3 errors: {result['message']}")
+
+        # The recognizer cascade calls compare_faces, which has to raise so its own breaker sees the failure
+        try:
+            await recognizer.compare_faces(reference, make_image((0, 9, 200)))
+            raise AssertionError("compare_faces returned while the circuit was open")
+        except GeminiUnavailable as e:
+            print(f"✅ compare_faces raised for the cascade: {e}")
+    finally:
+        await recognizer.close()
+        await runner.cleanup()
+
+if __name__ == "__main__":
+    asyncio.run(test_gemini_client())
@@ -4,6 +4,7 @@ Test Google AI face recognition directly
 """
 import os
 import sys
+import asyncio
 sys.path.append('.')
 
 # Load environment variables
@@ -37,7 +38,7 @@ def test_google_ai():
     
     try:
         print("🤖 Testing Google AI face verification...")
-        result = google_face_recognizer.verify_faces(img_base64, img_base64)
+        result = asyncio.run(google_face_recognizer.verify_faces(img_base64, img_base64))
         
         print("📊 Result:")
         print(f"  Success: {result.get('success')}")
@@ -48,5 +48,35 @@ def test_simple_face():
         import traceback
         traceback.print_exc()
 
+def test_batch_ranking():
+    print("🔍 Testing simple face batch ranking...")
+    
+    import time
+    import numpy as np
+    from app.utils.image_preprocessing import DecodedImage
+    
+    # 2000 noisy reference thumbnails, the live photo is a copy of student 1234
+    rng = np.random.default_rng(0)
+    references = rng.integers(0, 256, size=(2000, 100, 100), dtype=np.uint8)
+    student_ids = np.arange(1, 2001)
+    live = DecodedImage(np.repeat(references[1233][:, :, None], 3, axis=2))
+    
+    start = time.perf_counter()
+    ranked = simple_face_recognizer.rank_references(live, references, student_ids, top_k=5)
+    batch_ms = (time.perf_counter() - start) * 1000
+    
+    start = time.perf_counter()
+    for reference in references:
+        simple_face_recognizer.calculate_image_similarity(live, DecodedImage(np.repeat(reference[:, :, None], 3, axis=2)))
+    pairwise_ms = (time.perf_counter() - start) * 1000
+    
+    print(f"  Top matches: {ranked[:3]}")
+    print(f"  Batch: {batch_ms:.1f} ms, one pair at a time: {pairwise_ms:.1f} ms")
+    if ranked[0] == (1234, 100.0):
+        print("✅ Batch ranking is working!")
+    else:
+        print(f"❌ Expected student 1234 first, got {ranked[0]}")
+
 if __name__ == "__main__":
     test_simple_face()
+    test_batch_ranking()